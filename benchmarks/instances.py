@@ -0,0 +1,81 @@
+"""Time per BUILD and memory per object for LEARNING class instances.
+
+Usage: python benchmarks/instances.py [count]
+
+Builds a chain of `count` objects of a small class, and of a class that
+extends it, on each engine. Reports the average time per BUILD and the
+memory each object keeps alive, next to what the same fields cost in the
+old nested {'__class__': ..., '__fields__': {...}} dict layout.
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processor import cache
+from processor.interpreter import Interpreter
+from processor.closures import ClosureInterpreter
+from processor.vm import VM
+
+ENGINES = {'ast': Interpreter, 'closure': ClosureInterpreter, 'vm': VM}
+
+SOURCE = """
+LEARNING Point WE
+    POPPIN constructor(ts, x, y, next) WE
+        ts.x BOOM x
+        ts.y BOOM y
+        ts.next BOOM next
+    POW
+POW
+
+EXTENDING Point WITH Pixel WE
+    POPPIN constructor(ts, x, y, next, color) WE
+        SUPERMAN(x, y, next)
+        ts.color BOOM color
+    POW
+POW
+
+YE last BOOM 0
+SPIN BOOM i IS 1, COUNT WE
+    last BOOM BUILD CLASS(i, i, last, "red")
+POW
+"""
+
+def run(engine, class_name, count):
+    source = SOURCE.replace("COUNT", str(count)).replace("CLASS", class_name)
+    tree = cache.parse(source)
+    start = time.perf_counter()
+    ENGINES[engine]().interpret(tree)
+    elapsed = time.perf_counter() - start
+    interpreter = ENGINES[engine]()
+    tracemalloc.start()
+    interpreter.interpret(tree)
+    before = tracemalloc.get_traced_memory()[0]
+    del interpreter.env['last']
+    freed = before - tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return elapsed / count, freed / count
+
+def dict_layout_size(count):
+    tracemalloc.start()
+    last = 0
+    for i in range(count):
+        last = {'__class__': None, '__fields__': {'x': i, 'y': i, 'next': last, 'color': "red"}}
+    size = tracemalloc.get_traced_memory()[0]
+    del last
+    tracemalloc.stop()
+    return size / count
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"{'engine':<8} {'class':<6} {'us/BUILD':>9} {'bytes/object':>13}")
+    for engine in ENGINES:
+        for class_name in ('Point', 'Pixel'):
+            per_build, per_object = run(engine, class_name, count)
+            print(f"{engine:<8} {class_name:<6} {per_build * 1e6:>9.2f} {per_object:>13.0f}")
+    print(f"dict layout, Pixel fields: {dict_layout_size(count):.0f} bytes/object")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Measure the memory a parsed NScript tree takes, over a large generated script.
+
+Usage: python benchmarks/memory.py [--blocks N] [--strict-parse] [--save FILE] [--out FILE]
+
+The script is BLOCK repeated N times, with every name numbered so each
+block defines its own functions, class and variables, the way generated
+scripts do. It is lexed, parsed and optimized once with tracemalloc on,
+skipping function and method bodies as the CLI does unless
+--strict-parse is given, and the JSON report has:
+
+- lines, nodes: size of the script and of its tree, without the bodies
+  left unparsed
+- tree_bytes: memory still held by the tree once parsing is done
+- bytes_per_node: tree_bytes / nodes
+- peak_bytes: peak traced allocation while lexing, parsing and optimizing
+- parse_s: time to lex, parse and optimize, without tracemalloc
+- cache_bytes, load_s: size of the tree's parse cache entry and time to
+  load it back
+- loaded_nodes: nodes of the tree loaded from the cache, which equals
+  nodes when skipped bodies stay unparsed through the cache
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import platform
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processor import cache
+from processor.ast import AST, FuncDef, fields
+
+BLOCK = """\
+YE limit{i}: num BOOM {i}
+YE label{i} BOOM "block {i}"
+YE table{i} BOOM {{"one": 1, "two": [1, 2, {i}], "three": {{"x": limit{i}}}}}
+
+POPPIN classify{i}(value) WE: string
+    WHAT (value IS UNDER 0) WE
+        RETURN "negative"
+    POW ANOTHER ONE (value IS OVER limit{i} ALSO NOT value IS 1000) WE
+        RETURN `large ${{value}} in ${{label{i}}}`
+    POW ANOTHER WE
+        RETURN "small"
+    POW
+POW
+
+POPPIN total{i}(items) WE
+    YE sum BOOM 0
+    SPIN BOOM index, item IN items WE
+        sum BOOM sum + item * index - limit{i} / 2
+    POW
+    RETURN sum
+POW
+
+LEARNING Shape{i} WE
+    POPPIN constructor(ts, width, height) WE
+        ts.width BOOM width
+        ts.height BOOM height
+    POW
+    POPPIN area(ts) WE
+        RETURN ts.width * ts.height
+    POW
+POW
+
+SPIN BOOM j IS 1, 3 WE
+    YE shape{i} BOOM BUILD Shape{i}(j, j + 1)
+    label{i} BOOM label{i} FEED classify{i}(shape{i}.area()) FEED CONVERTSTRING total{i}([j, {i}])
+POW
+"""
+
+def generate(blocks):
+    return "".join(BLOCK.format(i=i) for i in range(blocks))
+
+def count_nodes(tree):
+    count = 0
+    pending = [tree]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, (list, tuple)):
+            pending.extend(value)
+        elif isinstance(value, dict):
+            pending.extend(value.values())
+        elif isinstance(value, AST):
+            count += 1
+            if isinstance(value, FuncDef) and value.lazy is not None:
+                continue
+            pending.extend(item for _, item in fields(value))
+    return count
+
+def measure(source):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        tree = cache.parse(source)
+        tree_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    start = time.perf_counter()
+    cache.parse(source)
+    parse_s = time.perf_counter() - start
+    nodes = count_nodes(tree)
+    with tempfile.TemporaryDirectory() as folder:
+        target = os.path.join(folder, "memory.nsc")
+        if not cache.store(target, "memory", tree):
+            raise Exception("The tree could not be written to the parse cache")
+        cache_bytes = os.path.getsize(target)
+        start = time.perf_counter()
+        loaded = cache.load(target, "memory")
+        load_s = time.perf_counter() - start
+    return {
+        "lines": source.count("\n"),
+        "nodes": nodes,
+        "tree_bytes": tree_bytes - before,
+        "bytes_per_node": (tree_bytes - before) / nodes if nodes else 0.0,
+        "peak_bytes": peak_bytes - before,
+        "parse_s": parse_s,
+        "cache_bytes": cache_bytes,
+        "load_s": load_s,
+        "loaded_nodes": count_nodes(loaded),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the memory of a parsed, generated NScript script.")
+    parser.add_argument("--blocks", type=int, default=2000, help="copies of the generated block (default 2000)")
+    parser.add_argument("--strict-parse", action="store_true", help="parse every function body up front")
+    parser.add_argument("--save", help="also write the generated script to this .n file")
+    parser.add_argument("--out", help="write the JSON report to this file instead of stdout")
+    options = parser.parse_args()
+
+    cache.lazy = not options.strict_parse
+    source = generate(options.blocks)
+    if options.save:
+        with open(options.save, "w", encoding="utf-8") as f:
+            f.write(source)
+    report = {"python": platform.python_version(), "platform": platform.platform(), "blocks": options.blocks, "lazy": cache.lazy}
+    report.update(measure(source))
+
+    print(f"{report['lines']} lines, {report['nodes']} nodes: tree {report['tree_bytes'] / 1048576:.1f} MiB "
+          f"({report['bytes_per_node']:.0f} bytes/node), peak {report['peak_bytes'] / 1048576:.1f} MiB, "
+          f"parse {report['parse_s']:.2f} s, cache entry {report['cache_bytes'] / 1048576:.1f} MiB "
+          f"loaded in {report['load_s']:.2f} s", file=sys.stderr)
+    if options.out:
+        with open(options.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
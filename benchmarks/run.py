@@ -0,0 +1,204 @@
+"""Run the NScript benchmark workloads on each engine and report JSON.
+
+Usage: python benchmarks/run.py [--engine NAME] [--repeat N] [--out FILE]
+                                [--baseline FILE] [--threshold FRACTION] [workload ...]
+
+Every workload is parsed and run `repeat` times on each engine, with its
+FELLA output thrown away. The parse cache is off and the GIVE ME module
+registry is cleared before each run, so every run lexes, parses and
+executes its modules from scratch. For each workload the report has:
+
+- parse_s: best time to lex, parse and optimize the main file
+- ops: AST node evaluations the ast engine makes for one run
+- per engine, execute_s: best time to run the parsed tree, modules included
+- per engine, ops_per_sec: ops / execute_s, so engines compare on the same work
+- per engine, peak_memory_bytes: peak traced allocation over one parse and run
+- per engine, speedup: how many times faster than the first engine
+
+The JSON goes to stdout or --out, and a table to stderr. With --baseline,
+times are compared with an earlier report, and the runner exits with
+status 1 when any is more than --threshold slower.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processor import cache, modules
+from processor.interpreter import Interpreter
+from processor.closures import ClosureInterpreter
+from processor.vm import VM
+from processor.transpiled import TranspiledInterpreter
+
+ENGINES = {'ast': Interpreter, 'closure': ClosureInterpreter, 'vm': VM, 'py': TranspiledInterpreter}
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# name: (file, copies). The source of a workload is its file repeated `copies` times.
+WORKLOADS = {
+    'fib': ('fib.n', 1),
+    'loops': ('loops.n', 1),
+    'strings': ('strings.n', 1),
+    'classes': ('classes.n', 1),
+    'subscripts': ('subscripts.n', 1),
+    'imports': ('imports.n', 1),
+    'interpolation': ('interpolation.n', 1),
+    'parse': ('parse.n', 200),
+}
+
+def load(name):
+    file, copies = WORKLOADS[name]
+    path = os.path.join(HERE, file)
+    with open(path, "r", encoding="utf-8") as f:
+        source = f.read()
+    if not source.endswith("\n"):
+        source += "\n"
+    return path, source * copies
+
+def execute(engine, tree, path):
+    modules.registry.clear()
+    interpreter = ENGINES[engine]()
+    interpreter.file = path
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        interpreter.interpret(tree)
+    return interpreter
+
+def best(times):
+    return min(times), sum(times) / len(times)
+
+def time_parse(source, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cache.parse(source)
+        times.append(time.perf_counter() - start)
+    return best(times)
+
+def count_ops(tree, path):
+    modules.registry.clear()
+    interpreter = Interpreter()
+    interpreter.file = path
+    interpreter.count_nodes()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        interpreter.interpret(tree)
+    return sum(interpreter.counters.nodes.values())
+
+def time_execute(engine, source, path, repeat):
+    times = []
+    interpreter = None
+    for _ in range(repeat):
+        tree = cache.parse(source)
+        start = time.perf_counter()
+        interpreter = execute(engine, tree, path)
+        times.append(time.perf_counter() - start)
+    return best(times), interpreter
+
+def peak_memory(engine, source, path):
+    tracemalloc.start()
+    try:
+        execute(engine, cache.parse(source), path)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run_workload(name, engines, repeat):
+    path, source = load(name)
+    parse_s, parse_mean_s = time_parse(source, repeat)
+    ops = count_ops(cache.parse(source), path)
+    result = {
+        "file": os.path.basename(path),
+        "lines": source.count("\n"),
+        "parse_s": parse_s,
+        "parse_mean_s": parse_mean_s,
+        "ops": ops,
+        "engines": {},
+    }
+    for engine in engines:
+        (execute_s, execute_mean_s), interpreter = time_execute(engine, source, path, repeat)
+        stats = interpreter.stats()
+        result["engines"][engine] = {
+            "execute_s": execute_s,
+            "execute_mean_s": execute_mean_s,
+            "ops_per_sec": ops / execute_s if execute_s else 0.0,
+            "peak_memory_bytes": peak_memory(engine, source, path),
+            "function_calls": stats["function_calls"],
+            "modules_run": stats["modules_run"],
+        }
+    reference = result["engines"][engines[0]]["execute_s"]
+    for timing in result["engines"].values():
+        timing["speedup"] = reference / timing["execute_s"] if timing["execute_s"] else 0.0
+    return result
+
+def compare(report, baseline, threshold):
+    """Return a description of every time in report that is more than threshold slower than in baseline."""
+    regressions = []
+    for name, result in report["workloads"].items():
+        old = baseline.get("workloads", {}).get(name)
+        if old is None:
+            continue
+        checks = [("parse", result["parse_s"], old.get("parse_s"))]
+        for engine, timing in result["engines"].items():
+            old_timing = old.get("engines", {}).get(engine, {})
+            checks.append((engine, timing["execute_s"], old_timing.get("execute_s")))
+        for what, now, before in checks:
+            if before and now > before * (1 + threshold):
+                regressions.append({"workload": name, "stage": what, "before_s": before, "now_s": now, "ratio": now / before})
+    return regressions
+
+def print_table(report, out):
+    print(f"{'workload':<14} {'engine':<8} {'parse ms':>9} {'exec ms':>9} {'Mops/s':>8} {'peak KiB':>9} {'speedup':>8}", file=out)
+    for name, result in report["workloads"].items():
+        for engine, timing in result["engines"].items():
+            print(f"{name:<14} {engine:<8} {result['parse_s'] * 1000:>9.2f} {timing['execute_s'] * 1000:>9.2f} "
+                  f"{timing['ops_per_sec'] / 1e6:>8.3f} {timing['peak_memory_bytes'] / 1024:>9.0f} {timing['speedup']:>7.2f}x", file=out)
+    for regression in report.get("regressions", ()):
+        print(f"REGRESSION {regression['workload']} {regression['stage']}: "
+              f"{regression['before_s'] * 1000:.2f} ms -> {regression['now_s'] * 1000:.2f} ms ({regression['ratio']:.2f}x)", file=out)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the NScript benchmark workloads.")
+    parser.add_argument("workloads", nargs="*", metavar="workload",
+                        help=f"workloads to run (default: all of {', '.join(WORKLOADS)})")
+    parser.add_argument("--engine", action="append", choices=list(ENGINES),
+                        help="engine to run, may be repeated (default: all); speedups are relative to the first")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per workload and engine; the best is reported")
+    parser.add_argument("--out", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown that counts as a regression (default 0.10)")
+    options = parser.parse_args()
+    for name in options.workloads:
+        if name not in WORKLOADS:
+            parser.error(f"unknown workload '{name}', expected one of: {', '.join(WORKLOADS)}")
+
+    cache.enabled = False
+    engines = options.engine or list(ENGINES)
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": options.repeat,
+        "workloads": {},
+    }
+    for name in options.workloads or WORKLOADS:
+        report["workloads"][name] = run_workload(name, engines, options.repeat)
+    if options.baseline:
+        with open(options.baseline, "r", encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), options.threshold)
+
+    print_table(report, sys.stderr)
+    if options.out:
+        with open(options.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if report.get("regressions"):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,30 @@
 import sys
 import os
+import json
 import webbrowser
 import traceback
+import linecache
 import shutil
-from processor.lexer import Lexer
-from processor.parser import Parser
 from processor.interpreter import Interpreter
+from processor.closures import ClosureInterpreter
+from processor.compiler import Compiler, disassemble
+from processor.vm import VM
+from processor.transpiled import TranspiledInterpreter
+from processor import cache
+from processor.analysis import check_file
+from processor.profiler import Profiler
+from processor.sampler import Sampler
+from processor.tracer import Tracer
 
 VERSION = "1.2.0"
 
+ENGINES = {
+    "ast": Interpreter,
+    "closure": ClosureInterpreter,
+    "vm": VM,
+    "py": TranspiledInterpreter,
+}
+
 def resource_path(relative_path):
     """ Get absolute path to resource, works for dev and for PyInstaller """
     base_path = getattr(sys, "_MEIPASS", None)
@@ -44,24 +60,115 @@ def handle_nscript_error(e, script_file=None, playground=False):
     tb = getattr(e, "__traceback__", None)
     if tb and not playground:
         stack = traceback.extract_tb(tb)
-        shown = False
+        frames = []
         for frame in stack:
             if frame.filename.endswith(".n") or (script_file and os.path.abspath(frame.filename) == os.path.abspath(script_file)):
-                print(f'  File "{os.path.basename(frame.filename)}", line {frame.lineno}')
-                print(f'    {frame.line}')
-                shown = True
+                frames.append((frame.filename, frame.lineno, frame.line))
+        for file, line in getattr(e, "nscript_trace", ()):
+            frames.append((file, line, linecache.getline(file, line).strip()))
+        print_frames(frames)
+        shown = bool(frames)
         if not shown and script_file:
             print(f'  In script: {os.path.basename(script_file)}')
     elif playground:
         print("  (Playground mode: error in your code)")
     print("-----------------------\n")
 
+# Identical frames in a row shown before the rest are summed up, as in Python tracebacks.
+REPEATED_FRAMES = 3
+
+def print_frames(frames):
+    previous = None
+    repeats = 0
+    for frame in frames:
+        if frame == previous:
+            repeats += 1
+            if repeats >= REPEATED_FRAMES:
+                continue
+        else:
+            print_repeats(repeats)
+            previous = frame
+            repeats = 0
+        file, line, source = frame
+        print(f'  File "{os.path.basename(file)}", line {line}')
+        if source:
+            print(f'    {source}')
+    print_repeats(repeats)
+
+def print_repeats(repeats):
+    if repeats >= REPEATED_FRAMES:
+        count = repeats - REPEATED_FRAMES + 1
+        print(f"  [Previous line repeated {count} more time{'s' if count > 1 else ''}]")
+
+def report_type_errors(errors):
+    print("\n--- NacoScript Type Check ---")
+    for error in errors:
+        print(f"  {error}")
+    print(f"{len(errors)} type error(s), script not run")
+    print("-----------------------\n")
+
+def pop_option(args, name, default=None):
+    """Remove `name value` or `name=value` from args and return the value."""
+    for i, arg in enumerate(args):
+        if arg == name and i + 1 < len(args):
+            value = args[i + 1]
+            del args[i:i + 2]
+            return value
+        if arg.startswith(name + "="):
+            del args[i]
+            return arg[len(name) + 1:]
+    return default
+
 def main():
     ensure_default_libs()
-    if len(sys.argv) == 2 and sys.argv[1] in ("-v", "--version"):
+    args = sys.argv[1:]
+    engine = pop_option(args, "--engine", "ast")
+    if engine not in ENGINES:
+        print(f"Unknown engine '{engine}', expected one of: {', '.join(ENGINES)}")
+        return
+    engine_class = ENGINES[engine]
+    if "--no-cache" in args:
+        args.remove("--no-cache")
+        cache.enabled = False
+    if "--no-optimize" in args:
+        args.remove("--no-optimize")
+        cache.optimize = False
+    if "--strict-parse" in args:
+        args.remove("--strict-parse")
+        cache.lazy = False
+    check = "--check" in args
+    if check:
+        args.remove("--check")
+    profile_out = pop_option(args, "--profile-out")
+    profiler = None
+    if "--profile" in args or profile_out:
+        if "--profile" in args:
+            args.remove("--profile")
+        profiler = Profiler()
+    sample_out = pop_option(args, "--sample-profile")
+    sampler = Sampler() if sample_out else None
+    trace_out = pop_option(args, "--trace-out")
+    tracer = Tracer() if trace_out else None
+    show_stats = "--stats" in args
+    if show_stats:
+        args.remove("--stats")
+    quickening = "--quicken" in args
+    if quickening:
+        args.remove("--quicken")
+    dis_file = pop_option(args, "--dis")
+    if dis_file:
+        # Parse every body so the listing shows all of them.
+        cache.lazy = False
+        try:
+            tree = cache.parse_file(dis_file)
+            print(disassemble(Compiler().compile_program(tree, os.path.basename(dis_file))))
+        except Exception as e:
+            handle_nscript_error(e, script_file=dis_file)
+        return
+    if len(args) == 1 and args[0] in ("-v", "--version"):
         print(f"NScript version {VERSION}")
         return
-    if len(sys.argv) == 2 and sys.argv[1] in ("--docs", "-d"):
+    if len(args) == 1 and args[0] in ("--docs", "-d"):
         docs_path = resource_path("docs.html")
         if os.path.exists(docs_path):
             webbrowser.open(f"file://{os.path.abspath(docs_path)}")
@@ -69,29 +176,61 @@ def main():
         else:
             print("Documentation file 'docs.html' not found.")
         return
-    if len(sys.argv) == 2 and sys.argv[1].lower().endswith('.n'):
-        filename = sys.argv[1]
+    if len(args) == 1 and args[0].lower().endswith('.n'):
+        filename = args[0]
         try:
-            with open(filename, "r", encoding="utf-8") as f:
-                code = f.read()
-            lexer = Lexer(code)
-            parser = Parser(lexer)
-            tree = parser.parse()
-            interpreter = Interpreter()
-            interpreter.interpret(tree)
+            runtime_checks = True
+            if check:
+                checker = check_file(filename)
+                if checker.errors:
+                    report_type_errors(checker.errors)
+                    return
+                if checker.proven:
+                    runtime_checks = False
+                else:
+                    print(f"Type check passed; {checker.unproven} of {checker.checks} checks depend on runtime values and stay on.", file=sys.stderr)
+            tree = cache.parse_file(filename)
+            interpreter = engine_class()
+            interpreter.file = os.path.abspath(filename)
+            interpreter.runtime_checks = runtime_checks
+            if profiler:
+                interpreter.profile(profiler)
+            if sampler:
+                interpreter.sample(sampler)
+                sampler.start()
+            if tracer:
+                interpreter.trace(tracer)
+                tracer.start()
+            if show_stats:
+                interpreter.count_nodes()
+            if quickening:
+                interpreter.quicken()
+            try:
+                interpreter.interpret(tree)
+            finally:
+                if profiler:
+                    profiler.report()
+                    if profile_out:
+                        profiler.dump_stats(profile_out)
+                if sampler:
+                    sampler.stop()
+                    sampler.write(sample_out)
+                if tracer:
+                    tracer.stop()
+                    tracer.write(trace_out)
+                if show_stats:
+                    print(json.dumps(interpreter.stats(), indent=2), file=sys.stderr)
         except Exception as e:
             handle_nscript_error(e, script_file=filename)
     else:
         print("NScript Interactive Console (type 'exit' to quit)")
-        interpreter = Interpreter()
+        interpreter = engine_class()
         while True:
             try:
                 line = input(">>> ")
                 if line.strip().lower() == "exit":
                     break
-                lexer = Lexer(line)
-                parser = Parser(lexer)
-                tree = parser.parse()
+                tree = cache.parse(line)
                 interpreter.interpret(tree)
             except Exception as e:
                 handle_nscript_error(e, playground=True)
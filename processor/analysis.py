@@ -0,0 +1,664 @@
+import os
+from processor import cache
+from processor.ast import AST, fields
+from processor.typecheck import TYPE_MAP, checker, signature_matches
+
+NoneType = type(None)
+
+class Unknown:
+    def __repr__(self):
+        return "any"
+
+# The type of an expression the checker cannot follow, such as a library call or a subscript.
+ANY = Unknown()
+
+NUMBERS = (int, float, bool)
+
+def join(a, b):
+    if a is ANY or b is ANY:
+        return ANY
+    return a | b
+
+def type_name(member):
+    if isinstance(member, type):
+        return "none" if member is NoneType else member.__name__
+    if type(member).__name__ == 'ClassDef':
+        return member.name
+    if type(member).__name__ == 'FileInfo':
+        return "module"
+    return "function"
+
+def arithmetic(op, left, right):
+    """Result type of `left op right` on two value types, or None when the operation fails."""
+    if left in NUMBERS and right in NUMBERS:
+        if op == '/' or left is float or right is float:
+            return float
+        return int
+    if op == '+' and left is right and left in (str, list):
+        return left
+    if op == '*':
+        if left in (str, list) and right in (int, bool):
+            return left
+        if right in (str, list) and left in (int, bool):
+            return right
+    return None
+
+class FileInfo:
+    """What the checker learned about one .n file: its top-level functions, classes and variables."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = os.path.basename(path) if path else "<program>"
+        self.functions = {}
+        self.classes = {}
+        self.declared = {}
+        self.assigned = set()
+        self.globals = {}
+        self.checking = True
+
+    def symbol(self, name):
+        if name in self.globals:
+            return self.globals[name]
+        if name in self.functions:
+            return frozenset([self.functions[name]])
+        if name in self.classes:
+            return ANY
+        return None
+
+class Context:
+    """Variable types inside the file or function body being checked."""
+
+    def __init__(self, info, func=None):
+        self.info = info
+        self.func = func
+        self.env = {}
+        self.returns = frozenset()
+
+class StaticChecker:
+    """Checks the type annotations of a program and its GIVE ME modules before it runs.
+
+    Every expression gets the set of value types it can produce, or ANY when
+    that cannot be followed statically. An annotated assignment, an assignment
+    to a name annotated elsewhere in the same file, a return from a function
+    with return types and an argument for a typed parameter must fit their
+    annotation: a value type that can never match is an error, and an ANY
+    leaves the runtime check in place. `proven` tells whether every runtime
+    check in the program was shown to pass, so they can be skipped.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.loading = []
+        self.errors = []
+        self.unproven = 0
+        self.checks = 0
+        self.analyzed = {}
+        self.class_home = {}
+        self.annotations = []
+        self.context = None
+
+    @property
+    def proven(self):
+        return not self.errors and self.unproven == 0
+
+    def check_file(self, path):
+        self.main_file = os.path.abspath(path)
+        self.load_file(self.main_file)
+        self.check_annotations()
+        return not self.errors
+
+    def check(self, tree, path=None):
+        self.main_file = path
+        info = FileInfo(path)
+        self.files[path] = info
+        self.check_tree(tree, info)
+        self.check_annotations()
+        return not self.errors
+
+    def error(self, message):
+        context = self.context
+        where = context.info.name
+        if context.func is not None:
+            where += f", in '{context.func.name or '<anonymous>'}'"
+        self.errors.append(f"{where}: {message}")
+
+    def load_file(self, path):
+        key = os.path.normcase(os.path.realpath(path))
+        info = self.files.get(key)
+        if info is not None:
+            if info.checking:
+                cycle = self.loading[self.loading.index(key):] + [key]
+                self.error(f"Import cycle detected: {' -> '.join(os.path.basename(p) for p in cycle)}")
+            return info
+        info = FileInfo(path)
+        self.files[key] = info
+        try:
+            tree = cache.parse_file(path)
+        except Exception as e:
+            self.errors.append(f"{info.name}: {e}")
+            info.checking = False
+            return info
+        self.loading.append(key)
+        try:
+            self.check_tree(tree, info)
+        finally:
+            self.loading.pop()
+        return info
+
+    def check_tree(self, tree, info):
+        self.collect(tree, info)
+        saved = self.context
+        self.context = Context(info)
+        try:
+            self.block(tree.statements)
+            info.globals = dict(self.context.env)
+        finally:
+            self.context = saved
+            info.checking = False
+
+    def collect(self, node, info, top=True):
+        """Record the functions, classes and annotations anywhere below node."""
+        kind = type(node).__name__
+        if kind == 'VarAssign' and isinstance(node.name, str):
+            info.assigned.add(node.name)
+            if node.checker:
+                info.declared.setdefault(node.name, []).append(node.checker)
+                self.annotations.append((info, node.types, f"variable '{node.name}'"))
+        elif kind == 'FuncDef':
+            if top and node.name:
+                info.functions.setdefault(node.name, node)
+            if node.return_types:
+                self.annotations.append((info, node.return_types, f"return type of '{node.name or '<anonymous>'}'"))
+            for pname, ptype in node.param_types.items():
+                self.annotations.append((info, [ptype], f"parameter '{pname}'"))
+            top = False
+        elif kind == 'ClassDef':
+            if top:
+                info.classes[node.name] = node
+                self.class_home[node] = info
+            top = False
+        for _, value in fields(node):
+            self.collect_value(value, info, top)
+
+    def collect_value(self, value, info, top):
+        if isinstance(value, (list, tuple)):
+            for item in value:
+                self.collect_value(item, info, top)
+        elif isinstance(value, dict):
+            for item in value.values():
+                self.collect_value(item, info, top)
+        elif isinstance(value, AST):
+            self.collect(value, info, top)
+
+    def check_annotations(self):
+        known = {class_def.name.lower() for info in self.files.values() for class_def in info.classes.values()}
+        for info, types, what in self.annotations:
+            for t in types:
+                if isinstance(t, str) and t.lower() not in TYPE_MAP and t.lower() not in known:
+                    self.errors.append(f"{info.name}: Unknown type '{t}' in {what}")
+
+    def block(self, statements):
+        result = frozenset([NoneType])
+        for stmt in statements:
+            result = self.visit(stmt)
+        return result
+
+    def visit(self, node):
+        method = getattr(self, f'visit_{type(node).__name__}', None)
+        if method is None:
+            return ANY
+        return method(node)
+
+    def static_type(self, types_checker, nullable):
+        if types_checker.signatures:
+            return ANY
+        members = set(types_checker.py_types)
+        for name in types_checker.class_names:
+            if name in TYPE_MAP:
+                continue
+            class_def = self.find_class(name)
+            if class_def is None:
+                return ANY
+            members.add(class_def)
+        if nullable:
+            members.add(NoneType)
+        return frozenset(members)
+
+    def find_class(self, key):
+        for name, class_def in self.context.info.classes.items():
+            if class_def.name.lower() == key:
+                return class_def
+        return None
+
+    def conforms(self, value_type, types_checker, what, allow_none):
+        """Count one runtime check and report value types that can never pass it."""
+        self.checks += 1
+        if value_type is ANY:
+            self.unproven += 1
+            return
+        for member in value_type:
+            if member is NoneType:
+                ok = allow_none
+            elif isinstance(member, type):
+                ok = issubclass(member, types_checker.py_types) if types_checker.py_types else False
+            elif type(member).__name__ == 'ClassDef':
+                ok = member.name.lower() in types_checker.class_names
+            elif type(member).__name__ == 'FuncDef':
+                ok = any(signature_matches(member, a, r) for a, r in types_checker.signatures)
+            else:
+                ok = False
+            if not ok:
+                self.error(f"{what} {types_checker}, got {type_name(member)}")
+                return
+
+    def lookup(self, name):
+        context = self.context
+        if name in context.env:
+            return context.env[name]
+        info = context.info
+        if name in info.declared:
+            types = frozenset()
+            for types_checker in info.declared[name]:
+                types = join(types, self.static_type(types_checker, True))
+            return types
+        if name in info.functions and name not in info.assigned:
+            return frozenset([info.functions[name]])
+        return ANY
+
+    def store(self, name, value_type):
+        declared = self.context.info.declared.get(name)
+        if declared:
+            for types_checker in declared:
+                self.conforms(value_type, types_checker, f"Type error: variable '{name}' expects", True)
+        self.context.env[name] = value_type
+
+    def function(self, node):
+        """Check the body of a function once and return the types it can return."""
+        if node in self.analyzed:
+            result = self.analyzed[node]
+            return ANY if result is None else result
+        self.analyzed[node] = None
+        saved = self.context
+        context = Context(saved.info, node)
+        for pname in node.params:
+            ptype = node.param_types.get(pname)
+            context.env[pname] = self.static_type(checker([ptype]), True) if ptype else ANY
+        self.context = context
+        try:
+            last = self.block(node.body)
+            returns = context.returns
+            if not self.always_returns(node.body):
+                returns = join(returns, last)
+                if node.return_checker:
+                    self.conforms(last, node.return_checker, f"Function '{node.name}' must return", False)
+        finally:
+            self.context = saved
+        if node.return_checker:
+            returns = self.static_type(node.return_checker, False)
+        self.analyzed[node] = returns
+        return returns
+
+    def always_returns(self, statements):
+        if not statements:
+            return False
+        last = statements[-1]
+        kind = type(last).__name__
+        if kind == 'Return':
+            return True
+        if kind == 'If':
+            return any(condition is None for condition, _ in last.branches) and all(self.always_returns(body) for _, body in last.branches)
+        return False
+
+    def call(self, func, args, skip=0):
+        params = func.params[skip:]
+        for pname, arg in zip(params, args):
+            ptype = func.param_types.get(pname)
+            arg_type = self.visit(arg)
+            if ptype:
+                self.conforms(arg_type, checker([ptype]), f"Type error: parameter '{pname}' of '{func.name}' expects", True)
+        for arg in args[len(params):]:
+            self.visit(arg)
+        return self.function(func)
+
+    def method(self, class_def, name):
+        while class_def is not None:
+            method = class_def.methods.get(name)
+            if method is not None:
+                return method
+            info = self.class_home.get(class_def)
+            base = getattr(class_def, 'base_class', None)
+            class_def = info.classes.get(base) if info and base else None
+        return None
+
+    def single(self, value_type, kind):
+        if value_type is ANY or len(value_type) != 1:
+            return None
+        member = next(iter(value_type))
+        return member if type(member).__name__ == kind else None
+
+    def loop(self, body, bind):
+        env = self.context.env
+        while True:
+            before = dict(env)
+            bind()
+            self.block(body)
+            for name, value_type in before.items():
+                env[name] = join(env.get(name, value_type), value_type)
+            if env == before:
+                return frozenset([NoneType]) if not body else ANY
+
+    def visit_Program(self, node):
+        return self.block(node.statements)
+
+    def visit_Num(self, node):
+        return frozenset([type(node.value)])
+
+    def visit_Str(self, node):
+        return frozenset([str])
+
+    def visit_Template(self, node):
+        for i in range(1, len(node.parts), 2):
+            self.visit(node.parts[i])
+        return frozenset([str])
+
+    def visit_Bool(self, node):
+        return frozenset([bool])
+
+    def visit_ListLiteral(self, node):
+        for element in node.elements:
+            self.visit(element)
+        return frozenset([list])
+
+    def visit_DictLiteral(self, node):
+        for key, value in node.pairs:
+            self.visit(key)
+            self.visit(value)
+        return frozenset([dict])
+
+    def visit_BinOp(self, node):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        if left is ANY or right is ANY:
+            return ANY
+        op = getattr(node.op, "value", None)
+        result = set()
+        pairs = 0
+        for a in left - {NoneType}:
+            for b in right - {NoneType}:
+                pairs += 1
+                r = arithmetic(op, a, b)
+                if r is not None:
+                    result.add(r)
+        if pairs and not result:
+            self.error(f"Unsupported operand types for {op}: {' / '.join(sorted(type_name(t) for t in left))} and {' / '.join(sorted(type_name(t) for t in right))}")
+            return ANY
+        return frozenset(result) if result else ANY
+
+    def visit_Compare(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+        return frozenset([bool])
+
+    def visit_LogicalOp(self, node):
+        self.visit(node.left)
+        if node.right is not None:
+            self.visit(node.right)
+        return frozenset([bool])
+
+    def visit_FeedOp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+        return frozenset([str])
+
+    def visit_Print(self, node):
+        self.visit(node.value)
+        return frozenset([NoneType])
+
+    def visit_ToString(self, node):
+        self.visit(node.expr)
+        return frozenset([str])
+
+    def visit_ToNumber(self, node):
+        self.visit(node.expr)
+        return frozenset([int, float])
+
+    def visit_TypeOf(self, node):
+        self.visit(node.expr)
+        return frozenset([str])
+
+    def visit_Nom(self, node):
+        self.visit(node.path_expr)
+        return frozenset([str])
+
+    def visit_Input(self, node):
+        self.visit(node.prompt_expr)
+        return frozenset([str])
+
+    def visit_Gurt(self, node):
+        self.visit(node.expr)
+        return frozenset([int, float])
+
+    def visit_Len(self, node):
+        self.visit(node.value)
+        return frozenset([int])
+
+    def visit_TallBoy(self, node):
+        self.visit(node.value)
+        return frozenset([int])
+
+    def visit_Subscript(self, node):
+        self.visit(node.value)
+        self.visit(node.index)
+        return ANY
+
+    def visit_SliceNode(self, node):
+        for part in (node.start, node.end, node.step):
+            if part is not None:
+                self.visit(part)
+        return ANY
+
+    def visit_Var(self, node):
+        return self.lookup(node.name)
+
+    def visit_Hoisted(self, node):
+        return self.visit(node.expr)
+
+    def visit_VarAssign(self, node):
+        value_type = self.visit(node.value) if node.value is not None else frozenset([NoneType])
+        name = node.name
+        if not isinstance(name, str):
+            self.visit(name.obj)
+            return value_type
+        if node.checker:
+            self.conforms(value_type, node.checker, f"Type error: variable '{name}' expects", True)
+            self.context.env[name] = value_type
+        else:
+            self.store(name, value_type)
+        return value_type
+
+    def visit_Return(self, node):
+        value_type = self.visit(node.value)
+        context = self.context
+        func = context.func
+        if func is not None:
+            if func.return_checker:
+                self.conforms(value_type, func.return_checker, f"Function '{func.name}' must return", False)
+            context.returns = join(context.returns, value_type)
+        return value_type
+
+    def visit_FuncDef(self, node):
+        if node.name:
+            self.context.env[node.name] = frozenset([node])
+        self.function(node)
+        return frozenset([node])
+
+    def visit_FuncCall(self, node):
+        target = node.name
+        if type(target).__name__ == 'AttributeAccess':
+            obj = self.visit(target.obj)
+            class_def = self.single(obj, 'ClassDef')
+            if class_def is not None:
+                method = self.method(class_def, target.attr)
+                if method is not None:
+                    return self.call(method, node.args, skip=1)
+            module = self.single(obj, 'FileInfo')
+            if module is not None:
+                func = self.single(module.symbol(target.attr) or ANY, 'FuncDef')
+                if func is not None:
+                    return self.call(func, node.args)
+            for arg in node.args:
+                self.visit(arg)
+            return ANY
+        if type(target).__name__ == 'FuncDef':
+            return self.call(target, node.args)
+        func = self.single(self.visit(target), 'FuncDef')
+        if func is not None:
+            return self.call(func, node.args)
+        for arg in node.args:
+            self.visit(arg)
+        return ANY
+
+    def visit_AttributeAccess(self, node):
+        obj = self.visit(node.obj)
+        module = self.single(obj, 'FileInfo')
+        if module is not None:
+            return module.symbol(node.attr) or ANY
+        return ANY
+
+    def visit_ClassDef(self, node):
+        for method in node.methods.values():
+            self.function(method)
+        return frozenset([NoneType])
+
+    def visit_ClassInstance(self, node):
+        class_def = self.context.info.classes.get(node.class_name)
+        if class_def is None:
+            self.error(f"Class '{node.class_name}' not defined")
+            for arg in node.args:
+                self.visit(arg)
+            return ANY
+        ctor = self.method(class_def, 'constructor')
+        if ctor is not None:
+            self.call(ctor, node.args, skip=1)
+        else:
+            for arg in node.args:
+                self.visit(arg)
+        return frozenset([class_def])
+
+    def visit_SuperCall(self, node):
+        for arg in node.args:
+            self.visit(arg)
+        return frozenset([NoneType])
+
+    def visit_If(self, node):
+        context = self.context
+        before = context.env
+        envs = []
+        result = frozenset()
+        has_else = False
+        for condition, body in node.branches:
+            context.env = dict(before)
+            if condition is None:
+                has_else = True
+            else:
+                self.visit(condition)
+            result = join(result, self.block(body))
+            envs.append(context.env)
+        if not has_else:
+            envs.append(before)
+            result = join(result, frozenset([NoneType]))
+        # A name assigned on only some paths falls back to its declared type.
+        merged = {}
+        for name in set(envs[0]).intersection(*envs[1:]):
+            value_type = frozenset()
+            for env in envs:
+                value_type = join(value_type, env[name])
+            merged[name] = value_type
+        context.env = merged
+        return result
+
+    def visit_WhileLoop(self, node):
+        return self.loop(node.body, lambda: self.visit(node.condition))
+
+    def visit_ForLoop(self, node):
+        self.visit(node.start)
+        self.visit(node.end)
+        return self.loop(node.body, lambda: self.store(node.var, frozenset([int])))
+
+    def visit_ForEachLoop(self, node):
+        collection = self.visit(node.collection)
+        index_type = frozenset([int]) if collection == frozenset([list]) else ANY
+        def bind():
+            self.store(node.index_var, index_type)
+            if node.value_var:
+                self.store(node.value_var, ANY)
+        return self.loop(node.body, bind)
+
+    def module(self, module_path):
+        if not module_path.endswith('.n'):
+            module_path += '.n'
+        base_dirs = []
+        for path in (self.context.info.path, self.main_file):
+            if path and os.path.dirname(path) not in base_dirs:
+                base_dirs.append(os.path.dirname(path))
+        if not base_dirs:
+            base_dirs.append(os.getcwd())
+        candidates = [os.path.normpath(os.path.join(base_dir, module_path)) for base_dir in base_dirs]
+        path = next((path for path in candidates if os.path.exists(path)), None)
+        if path is None:
+            self.error(f"Module file '{candidates[0]}' not found")
+            return None
+        return self.load_file(path)
+
+    def visit_Import(self, node):
+        context = self.context
+        if node.module_path.startswith("LIBRARY "):
+            libname = node.module_path[len("LIBRARY "):].strip('"').strip("'")
+            context.env[libname] = ANY
+            return frozenset([NoneType])
+        module = self.module(node.module_path)
+        if module is not None:
+            prefix = os.path.basename(node.module_path).replace('.n', '')
+            for name in set(module.globals) | set(module.functions):
+                context.env[f"{prefix}__{name}"] = module.symbol(name)
+            for name, class_def in module.classes.items():
+                context.info.classes[f"{prefix}__{name}"] = class_def
+        return frozenset([NoneType])
+
+    def visit_ImportOnly(self, node):
+        module = self.module(node.module_path)
+        if module is not None:
+            self.import_name(module, node.name, node.name)
+        return frozenset([NoneType])
+
+    def visit_ImportAs(self, node):
+        context = self.context
+        if node.is_library:
+            alias = node.as_name or node.module_path[len("LIBRARY "):].strip('"').strip("'")
+            context.env[alias] = ANY
+            return frozenset([NoneType])
+        module = self.module(node.module_path)
+        alias = node.as_name or os.path.basename(node.module_path).replace('.n', '')
+        if module is None:
+            context.env[alias] = ANY
+        elif node.only_name:
+            self.import_name(module, node.only_name, alias)
+        else:
+            context.env[alias] = frozenset([module])
+        return frozenset([NoneType])
+
+    def import_name(self, module, name, alias):
+        context = self.context
+        if name in module.classes:
+            context.info.classes[alias] = module.classes[name]
+            context.env[alias] = ANY
+            return
+        symbol = module.symbol(name)
+        if symbol is None and not module.checking:
+            self.error(f"'{name}' not found in module '{module.name}'")
+        context.env[alias] = symbol or ANY
+
+def check_file(path):
+    checker = StaticChecker()
+    checker.check_file(path)
+    return checker
@@ -1,12 +1,45 @@
+from processor.typecheck import checker
+
 class AST:
-    pass
+    """Base of every node.
+
+    Nodes are slotted, so large trees carry no per-node __dict__: each class
+    lists its fields in __slots__ in the order __init__ sets them, plus any
+    attribute a later pass sets on it. The parser sets `line` on statements
+    and function definitions.
+    """
+
+    __slots__ = ('line',)
+
+# Node class -> names of its slots, most derived class first; filled in by slot_names().
+FIELDS = {}
+
+def slot_names(cls):
+    names = FIELDS.get(cls)
+    if names is None:
+        names = FIELDS[cls] = tuple(name for klass in cls.__mro__ for name in klass.__dict__.get('__slots__', ()))
+    return names
+
+def fields(node):
+    """Return (name, value) for every field set on node, in the order of its __slots__."""
+    result = []
+    for name in slot_names(type(node)):
+        try:
+            result.append((name, getattr(node, name)))
+        except AttributeError:
+            pass
+    return result
 
 class Num(AST):
+    __slots__ = ('token', 'value')
+
     def __init__(self, token):
         self.token = token
         self.value = token.value
 
 class BinOp(AST):
+    __slots__ = ('left', 'token', 'op', 'right', 'guard')
+
     def __init__(self, left, op, right):
         self.left = left
         self.token = op
@@ -14,164 +47,281 @@ class BinOp(AST):
         self.right = right
 
 class Print(AST):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
 class VarAssign(AST):
+    __slots__ = ('name', 'value', 'types', 'checker', 'ref')
+
     def __init__(self, name, value, types=None):
         self.name = name
         self.value = value
         self.types = types
+        self.checker = checker(types)
+        self.ref = None
 
 class Var(AST):
+    __slots__ = ('name', 'ref')
+
     def __init__(self, name):
         self.name = name
+        self.ref = None
 
 class Str(AST):
+    __slots__ = ('token', 'value')
+
     def __init__(self, token):
         self.token = token
         self.value = token.value
 
+class Template(AST):
+    __slots__ = ('value', 'parts', 'interpolated')
+
+    def __init__(self, value, parts):
+        self.value = value
+        self.parts = parts
+        self.interpolated = True
+
 class Compare(AST):
+    __slots__ = ('left', 'op', 'right', 'guard')
+
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
         self.right = right
 
 class If(AST):
+    __slots__ = ('branches',)
+
     def __init__(self, branches):
         self.branches = branches
 
 class Program(AST):
+    __slots__ = ('statements',)
+
     def __init__(self, statements):
         self.statements = statements
 
 class FuncDef(AST):
-    def __init__(self, name, params, body, return_types=None):
+    __slots__ = ('name', 'params', 'body', 'return_types', 'return_checker', 'param_types', 'is_method', 'lazy', 'scope', 'transpiled')
+
+    def __init__(self, name, params, body, return_types=None, param_types=None):
         self.name = name
         self.params = params
         self.body = body
         self.return_types = return_types
+        self.return_checker = checker(return_types)
+        self.param_types = param_types or {}
+        self.is_method = False
+        self.lazy = None
+        self.scope = None
+
+    def __getstate__(self):
+        # The default state reads every slot with getattr(), which would parse a skipped body.
+        state = {}
+        for name in slot_names(FuncDef):
+            try:
+                state[name] = object.__getattribute__(self, name)
+            except AttributeError:
+                pass
+        return None, state
+
+    def __getattr__(self, name):
+        # Only reached while `body` is unset: the parser skipped it and left a LazyBody to parse it on first use.
+        if name == 'body' and self.lazy is not None:
+            return self.lazy.parse(self)
+        raise AttributeError(f"'FuncDef' object has no attribute '{name}'")
 
 class FuncCall(AST):
+    __slots__ = ('name', 'args')
+
     def __init__(self, name, args):
         self.name = name
         self.args = args
 
 class Return(AST):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
 class FeedOp(AST):
+    __slots__ = ('left', 'right')
+
     def __init__(self, left, right):
         self.left = left
         self.right = right
 
 class Bool(AST):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
 class ListLiteral(AST):
+    __slots__ = ('elements',)
+
     def __init__(self, elements):
         self.elements = elements
 
 class DictLiteral(AST):
+    __slots__ = ('pairs',)
+
     def __init__(self, pairs):
         self.pairs = pairs
 
 class Subscript(AST):
+    __slots__ = ('value', 'index', 'guard', 'offset')
+
     def __init__(self, value, index):
         self.value = value
         self.index = index
 
 class ForLoop(AST):
+    __slots__ = ('var', 'start', 'end', 'body', 'var_ref', 'hoisted')
+
     def __init__(self, var, start, end, body):
         self.var = var
         self.start = start
         self.end = end
         self.body = body
+        self.var_ref = None
+        self.hoisted = []
 
 class ForEachLoop(AST):
+    __slots__ = ('index_var', 'value_var', 'collection', 'body', 'index_ref', 'value_ref', 'hoisted')
+
     def __init__(self, index_var, value_var, collection, body):
         self.index_var = index_var
         self.value_var = value_var
         self.collection = collection
         self.body = body
+        self.index_ref = None
+        self.value_ref = None
+        self.hoisted = []
 
 class Len(AST):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
 class TallBoy(AST):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
 
 class LogicalOp(AST):
+    __slots__ = ('left', 'op', 'right')
+
     def __init__(self, left, op, right):
         self.left = left
         self.op = op
         self.right = right
 
 class Import(AST):
+    __slots__ = ('module_path',)
+
     def __init__(self, module_path):
         self.module_path = module_path
 
 class ImportOnly(AST):
+    __slots__ = ('module_path', 'name')
+
     def __init__(self, module_path, name):
         self.module_path = module_path
         self.name = name
 
 class ClassDef(AST):
+    __slots__ = ('name', 'methods', 'base_class')
+
     def __init__(self, name, methods, base_class=None):
         self.name = name
         self.methods = methods
         self.base_class = base_class
 
 class SuperCall(AST):
+    __slots__ = ('args',)
+
     def __init__(self, args):
         self.args = args
 
 class ClassInstance(AST):
+    __slots__ = ('class_name', 'args')
+
     def __init__(self, class_name, args):
         self.class_name = class_name
         self.args = args
 
 class AttributeAccess(AST):
+    __slots__ = ('obj', 'attr', 'site')
+
     def __init__(self, obj, attr):
         self.obj = obj
         self.attr = attr
+        self.site = None
 
 class WhileLoop(AST):
+    __slots__ = ('condition', 'body', 'hoisted')
+
     def __init__(self, condition, body):
         self.condition = condition
         self.body = body
+        self.hoisted = []
+
+class Hoisted(AST):
+    """A loop-invariant expression, evaluated once per entry of the loop listing it in `hoisted`."""
+
+    __slots__ = ('expr', 'name', 'ref')
+
+    def __init__(self, expr, name):
+        self.expr = expr
+        self.name = name
+        self.ref = None
 
 class ToString(AST):
+    __slots__ = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr
 
 class ToNumber(AST):
+    __slots__ = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr
 
-class TypeOf:
+class TypeOf(AST):
+    __slots__ = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr
 
-class Nom:
+class Nom(AST):
+    __slots__ = ('path_expr',)
+
     def __init__(self, path_expr):
         self.path_expr = path_expr
 
-class Input:
+class Input(AST):
+    __slots__ = ('prompt_expr',)
+
     def __init__(self, prompt_expr):
         self.prompt_expr = prompt_expr
 
-class Gurt:
+class Gurt(AST):
+    __slots__ = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr
 
 class SliceNode(AST):
+    __slots__ = ('start', 'end', 'step')
+
     def __init__(self, start, end, step):
         self.start = start
         self.end = end
-        self.step = step
\ No newline at end of file
+        self.step = step
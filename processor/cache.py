@@ -0,0 +1,102 @@
+import os
+import sys
+import pickle
+import hashlib
+from processor import lexer, parser, ast, objects, typecheck, optimizer
+from processor.lexer import Lexer
+from processor.parser import Parser
+
+FORMAT_VERSION = 1
+CACHE_DIR_NAME = "__nscache__"
+
+enabled = True
+optimize = True
+# Skip the bodies of top-level functions and class methods at parse time and parse each on first use;
+# --strict-parse turns this off so a syntax error anywhere in the file is reported before it runs.
+lazy = True
+cache_dir = os.environ.get("NSCRIPT_CACHE_DIR") or None
+
+hits = 0
+misses = 0
+
+_parser_version = None
+
+def parser_version():
+    """Fingerprint of the lexer, parser, AST, type checker and optimizer modules that produced a cached tree."""
+    global _parser_version
+    if _parser_version is None:
+        digest = hashlib.sha256(f"{FORMAT_VERSION}:{sys.version_info[:2]}".encode())
+        for module in (lexer, parser, ast, objects, typecheck, optimizer):
+            try:
+                with open(module.__file__, "rb") as f:
+                    digest.update(f.read())
+            except (OSError, TypeError):
+                digest.update(module.__name__.encode())
+        _parser_version = digest.hexdigest()
+    return _parser_version
+
+def cache_path(path):
+    path = os.path.abspath(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    if cache_dir:
+        key = hashlib.sha256(path.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(cache_dir, f"{stem}.{key}.nsc")
+    return os.path.join(os.path.dirname(path), CACHE_DIR_NAME, f"{stem}.nsc")
+
+def parse(source):
+    tree = Parser(Lexer(source), lazy).parse()
+    if optimize:
+        tree = optimizer.optimize(tree)
+    return tree
+
+def parse_file(path):
+    """Parse the .n file at path, reusing its cached tree when the source is unchanged."""
+    global hits, misses
+    with open(path, "r", encoding="utf-8") as f:
+        source = f.read()
+    if not enabled:
+        return parse(source)
+    source_hash = hashlib.sha256(source.encode("utf-8")).hexdigest()
+    target = cache_path(path)
+    tree = load(target, source_hash)
+    if tree is None:
+        misses += 1
+        tree = parse(source)
+        store(target, source_hash, tree)
+    else:
+        hits += 1
+    return tree
+
+def load(target, source_hash):
+    try:
+        with open(target, "rb") as f:
+            entry = pickle.load(f)
+    except Exception:
+        return None
+    if not isinstance(entry, dict):
+        return None
+    if entry.get("version") != parser_version() or entry.get("source_hash") != source_hash:
+        return None
+    if entry.get("optimized") != optimize or entry.get("lazy") != lazy:
+        return None
+    return entry.get("tree")
+
+def store(target, source_hash, tree):
+    entry = {"version": parser_version(), "source_hash": source_hash, "optimized": optimize, "lazy": lazy, "tree": tree}
+    try:
+        data = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return False
+    temp = f"{target}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(temp, "wb") as f:
+            f.write(data)
+        os.replace(temp, target)
+    except OSError:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        return False
+    return True
@@ -0,0 +1,626 @@
+import sys
+import operator
+from processor.ast import FuncDef, AttributeAccess
+from processor.interpreter import Interpreter, ReturnException
+from processor.objects import AttributeSite, MISSING
+from processor.resolver import resolve, function_scope, make_function, Closure, UNBOUND, LOCAL, CELL, FREE, GLOBAL
+
+BINARY_OPS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+}
+
+COMPARE_OPS = {
+    'IS': operator.eq,
+    'IS_NOT': operator.ne,
+    'IS_UNDER': operator.lt,
+    'IS_OVER': operator.gt,
+}
+
+class ClosureInterpreter(Interpreter):
+    """Execution engine that compiles the AST into nested Python closures.
+
+    Every node is turned into a prebound callable once, so evaluating it no
+    longer goes through the name-based visit_* dispatch of Interpreter. The
+    environment model and runtime checks are the same as Interpreter's.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.bodies = {}
+
+    def interpret(self, node):
+        resolve(node)
+        result = self.compile(node)()
+        if self.returning:
+            self.returning = False
+            raise ReturnException(result)
+        return result
+
+    def visit(self, node):
+        return self.compile(node)()
+
+    def profile(self, profiler):
+        self.profiler = profiler
+        self.interpret = profiler.timed_program(self, self.interpret)
+        self.call_function = profiler.timed_call(self.call_function)
+        self.compile = profiler.timed_compile(self.compile)
+
+    def count_nodes(self):
+        self.counters.counting = True
+        self.compile = self.counters.counted_compile(self.compile)
+
+    def quicken(self):
+        raise Exception("Quickening is not supported by the closure engine, use the ast engine")
+
+    def sample(self, sampler):
+        super().sample(sampler)
+        self.compile = sampler.lined_compile(self.compile)
+
+    def compile(self, node):
+        method_name = f'compile_{type(node).__name__}'
+        method = getattr(self, method_name, self.generic_compile)
+        return method(node)
+
+    def generic_compile(self, node):
+        def fail():
+            raise Exception(f'No visit_{type(node).__name__} method')
+        return fail
+
+    def compile_block(self, statements):
+        compiled = [self.compile(stmt) for stmt in statements]
+        if not compiled:
+            return lambda: None
+        if len(compiled) == 1:
+            return compiled[0]
+        def block():
+            result = None
+            for stmt in compiled:
+                result = stmt()
+                if self.returning:
+                    return result
+            return result
+        return block
+
+    def function_body(self, func_def):
+        body = self.bodies.get(func_def)
+        if body is None:
+            # Resolve first, so a body the parser skipped is compiled with its refs bound.
+            function_scope(func_def)
+            body = self.compile_block(func_def.body)
+            self.bodies[func_def] = body
+        return body
+
+    def call_function(self, func, args):
+        if isinstance(func, Closure):
+            func_def, closure = func.func_def, func.cells
+        else:
+            func_def, closure = func, None
+        body = self.function_body(func_def)
+        scope = function_scope(func_def)
+        saved = self.frame, self.closure, self.scope
+        self.frame = scope.new_frame(args)
+        self.closure = closure
+        self.scope = scope
+        counters = self.counters
+        counters.calls += 1
+        counters.depth += 1
+        if counters.depth > counters.peak_depth:
+            counters.peak_depth = counters.depth
+        try:
+            result = body()
+        finally:
+            self.frame, self.closure, self.scope = saved
+            counters.depth -= 1
+        if self.returning:
+            self.returning = False
+        return result
+
+    def check_return(self, func_def, result):
+        checker = func_def.return_checker
+        if checker and self.runtime_checks and not checker.matches(result):
+            raise Exception(f"Function '{func_def.name}' must return {func_def.return_types}, got {type(result).__name__}")
+        return result
+
+    def run_constructor(self, ctor, instance, args):
+        values = [arg() for arg in args[:len(ctor.params) - 1]]
+        self.call_function(ctor, [instance] + values)
+
+    def compile_lookup(self, name, ref):
+        kind, slot = ref if ref is not None else (None, None)
+        if kind == LOCAL:
+            def lookup():
+                value = self.frame[slot]
+                if value is UNBOUND:
+                    return self.env.get(name, UNBOUND)
+                return value
+        elif kind == CELL:
+            def lookup():
+                value = self.frame[slot].value
+                if value is UNBOUND:
+                    return self.env.get(name, UNBOUND)
+                return value
+        elif kind == FREE:
+            def lookup():
+                value = self.closure[slot].value
+                if value is UNBOUND:
+                    return self.env.get(name, UNBOUND)
+                return value
+        elif kind == GLOBAL:
+            def lookup():
+                return self.env.get(name, UNBOUND)
+        else:
+            def lookup():
+                return self.lookup(name, None)
+        return lookup
+
+    def compile_store(self, name, ref):
+        kind, slot = ref if ref is not None else (None, None)
+        if kind == LOCAL:
+            def store(value):
+                self.frame[slot] = value
+        elif kind == CELL:
+            def store(value):
+                self.frame[slot].value = value
+        elif kind == GLOBAL:
+            def store(value):
+                self.env[name] = value
+        else:
+            def store(value):
+                self.store(name, None, value)
+        return store
+
+    def compile_Program(self, node):
+        compiled = [self.compile(stmt) for stmt in node.statements]
+        def program():
+            for stmt in compiled:
+                result = stmt()
+                if self.returning:
+                    return result
+            return None
+        return program
+
+    def compile_KillSelf(self, node):
+        def kill_self():
+            print("Script terminated by KILL SELF.")
+            sys.exit(1)
+        return kill_self
+
+    def compile_NoneType(self, node):
+        return self.generic_compile(node)
+
+    def compile_Num(self, node):
+        value = node.value
+        return lambda: value
+
+    def compile_Bool(self, node):
+        value = node.value
+        return lambda: value
+
+    def compile_Str(self, node):
+        value = getattr(node, "value", None)
+        return lambda: value
+
+    def compile_Template(self, node):
+        parts = node.parts
+        if len(parts) == 1:
+            template = parts[0]
+            return lambda: template
+        pieces = [(lambda part=part: part) if i % 2 == 0 else self.compile(part) for i, part in enumerate(parts)]
+        def template():
+            return ''.join([str(piece()) for piece in pieces])
+        return template
+
+    def compile_Print(self, node):
+        value = self.compile(node.value)
+        def print_():
+            print(value())
+        return print_
+
+    def compile_BinOp(self, node):
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+        op = getattr(node.op, "value", None)
+        func = BINARY_OPS.get(op)
+        if func is None:
+            def unknown():
+                left()
+                right()
+                raise Exception(f"Unknown operator: {op}")
+            return unknown
+        return lambda: func(left(), right())
+
+    def compile_Compare(self, node):
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+        func = COMPARE_OPS.get(node.op)
+        if func is None:
+            op = node.op
+            def unknown():
+                left()
+                right()
+                raise Exception(f"Unknown comparison operator: {op}")
+            return unknown
+        return lambda: func(left(), right())
+
+    def compile_LogicalOp(self, node):
+        left = self.compile(node.left)
+        if node.op == 'NOT':
+            return lambda: not bool(left())
+        right = self.compile(node.right)
+        if node.op == 'ALSO':
+            def also():
+                lval = left()
+                rval = right()
+                return bool(lval) and bool(rval)
+            return also
+        if node.op == 'MAYBE':
+            def maybe():
+                lval = left()
+                rval = right()
+                return bool(lval) or bool(rval)
+            return maybe
+        op = node.op
+        def unknown():
+            left()
+            right()
+            raise Exception(f"Unknown logical operator: {op}")
+        return unknown
+
+    def compile_FeedOp(self, node):
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+        return lambda: str(left()) + str(right())
+
+    def compile_ListLiteral(self, node):
+        elements = [self.compile(element) for element in node.elements]
+        return lambda: [element() for element in elements]
+
+    def compile_DictLiteral(self, node):
+        pairs = [(self.compile(k), self.compile(v)) for k, v in node.pairs]
+        return lambda: {k(): v() for k, v in pairs}
+
+    def compile_Var(self, node):
+        name = node.name
+        ref = getattr(node, "ref", None)
+        if ref is not None and ref[0] == LOCAL:
+            slot = ref[1]
+            def var():
+                value = self.frame[slot]
+                if value is UNBOUND:
+                    value = self.env.get(name, UNBOUND)
+                    if value is UNBOUND:
+                        if name in self.functions:
+                            return self.functions[name]
+                        raise Exception(f"Variable '{name}' not defined")
+                if isinstance(value, (FuncDef, Closure)) and value.name is None:
+                    return self.anon_function(value)
+                return value
+            return var
+        if ref is not None and ref[0] == GLOBAL:
+            def var():
+                env = self.env
+                if name in env:
+                    value = env[name]
+                    if isinstance(value, (FuncDef, Closure)) and value.name is None:
+                        return self.anon_function(value)
+                    return value
+                if name in self.functions:
+                    return self.functions[name]
+                raise Exception(f"Variable '{name}' not defined")
+            return var
+        lookup = self.compile_lookup(name, ref)
+        def var():
+            value = lookup()
+            if value is UNBOUND:
+                if name in self.functions:
+                    return self.functions[name]
+                raise Exception(f"Variable '{name}' not defined")
+            if isinstance(value, (FuncDef, Closure)) and value.name is None:
+                return self.anon_function(value)
+            return value
+        return var
+
+    def compile_VarAssign(self, node):
+        value_fn = self.compile(node.value) if node.value is not None else (lambda: None)
+        name = node.name
+        checker = node.checker
+        checks = self.runtime_checks
+        if isinstance(name, AttributeAccess):
+            obj_fn = self.compile(name.obj)
+            site = AttributeSite(name.attr)
+        else:
+            ref = getattr(node, "ref", None)
+            kind, slot = ref if ref is not None else (None, None)
+            store = self.compile_store(name, ref)
+        def var_assign():
+            value = value_fn()
+            if checks:
+                if checker:
+                    self.var_types[name] = checker
+                    expected = checker
+                else:
+                    expected = self.var_types.get(name)
+                if expected and value is not None and not expected.matches(value):
+                    raise Exception(f"Type error: variable '{name}' expects {expected}, got {type(value).__name__}")
+            if isinstance(name, AttributeAccess):
+                self.store_attribute(site, obj_fn(), value)
+                return value
+            if kind == LOCAL:
+                self.frame[slot] = value
+            elif kind == GLOBAL:
+                self.env[name] = value
+            else:
+                store(value)
+            if isinstance(value, (FuncDef, Closure)):
+                self.functions[name] = value
+            return value
+        return var_assign
+
+    def compile_If(self, node):
+        branches = [(self.compile(cond) if cond is not None else None, self.compile_block(body)) for cond, body in node.branches]
+        def if_():
+            for cond, body in branches:
+                if cond is None or cond():
+                    return body()
+            return None
+        return if_
+
+    def compile_ForLoop(self, node):
+        start_fn = self.compile(node.start)
+        end_fn = self.compile(node.end)
+        body = self.compile_block(node.body)
+        var = node.var
+        kind, slot = node.var_ref if node.var_ref is not None else (None, None)
+        store = self.compile_store(var, node.var_ref)
+        reset = self.compile_reset(node)
+        def for_loop():
+            if reset:
+                reset()
+            start = start_fn()
+            end = end_fn()
+            result = None
+            for i in range(int(start), int(end) + 1):
+                if kind == LOCAL:
+                    self.frame[slot] = i
+                elif kind == GLOBAL:
+                    self.env[var] = i
+                else:
+                    store(i)
+                result = body()
+                if self.returning:
+                    return result
+            return result
+        return for_loop
+
+    def compile_ForEachLoop(self, node):
+        collection_fn = self.compile(node.collection)
+        body = self.compile_block(node.body)
+        store_index = self.compile_store(node.index_var, node.index_ref)
+        store_value = self.compile_store(node.value_var, node.value_ref)
+        reset = self.compile_reset(node)
+        def for_each():
+            if reset:
+                reset()
+            collection = collection_fn()
+            result = None
+            if isinstance(collection, dict):
+                items = list(collection.items())
+            elif isinstance(collection, list):
+                items = enumerate(collection, 1)
+            else:
+                raise Exception("Can only SPIN over lists or dictionaries")
+            for k, v in items:
+                store_index(k)
+                store_value(v)
+                result = body()
+                if self.returning:
+                    return result
+            return result
+        return for_each
+
+    def compile_WhileLoop(self, node):
+        condition = self.compile(node.condition)
+        body = self.compile_block(node.body)
+        reset = self.compile_reset(node)
+        def while_loop():
+            if reset:
+                reset()
+            result = None
+            while condition():
+                result = body()
+                if self.returning:
+                    return result
+            return result
+        return while_loop
+
+    def compile_reset(self, loop):
+        stores = [self.compile_store(node.name, node.ref) for node in loop.hoisted]
+        if not stores:
+            return None
+        def reset():
+            for store in stores:
+                store(MISSING)
+        return reset
+
+    def compile_Hoisted(self, node):
+        expr = self.compile(node.expr)
+        kind, slot = node.ref
+        name = node.name
+        if kind == LOCAL:
+            def hoisted():
+                frame = self.frame
+                value = frame[slot]
+                if value is MISSING:
+                    value = frame[slot] = expr()
+                return value
+        else:
+            def hoisted():
+                env = self.env
+                value = env.get(name, MISSING)
+                if value is MISSING:
+                    value = env[name] = expr()
+                return value
+        return hoisted
+
+    def compile_FuncDef(self, node):
+        def func_def():
+            func = make_function(node, self.frame, self.closure)
+            self.functions[node.name] = func
+            return func
+        return func_def
+
+    def compile_Return(self, node):
+        value_fn = self.compile(node.value)
+        def return_():
+            value = value_fn()
+            self.returning = True
+            return value
+        return return_
+
+    def compile_FuncCall(self, node):
+        if isinstance(node.name, AttributeAccess):
+            obj_fn = self.compile(node.name.obj)
+            site = AttributeSite(node.name.attr)
+            args = [self.compile(arg) for arg in node.args]
+            to_python = self._to_python_value
+            lookup_method = self.lookup_method
+            call_function = self.call_function
+            def method_call():
+                obj = obj_fn()
+                method = lookup_method(site, obj)
+                if method is not None:
+                    return call_function(method, [obj] + [to_python(arg()) for arg in args])
+                value = self.load_attribute(site, obj)
+                values = [to_python(arg()) for arg in args]
+                if callable(value):
+                    if obj is site.library:
+                        return self.call_library(obj, site.attr, value, values)
+                    return value(*values)
+                raise Exception("Attribute is not callable")
+            return method_call
+        target = node.name
+        name = getattr(target, "name", None) if hasattr(target, "name") else None
+        lookup = self.compile_lookup(name, getattr(target, "ref", None))
+        args = []
+        for arg in node.args:
+            if isinstance(arg, FuncDef) and arg.name is None:
+                args.append(lambda arg=arg: make_function(arg, self.frame, self.closure))
+            else:
+                args.append(self.compile(arg))
+        to_python = self._to_python_value
+        def func_call():
+            func_obj = None
+            if hasattr(target, "name"):
+                value = lookup()
+                if value is not UNBOUND:
+                    func_obj = value
+                elif name in self.functions:
+                    func_obj = self.functions[name]
+                elif name is None:
+                    func_obj = target
+            elif isinstance(target, str) and target in self.functions:
+                func_obj = self.functions[target]
+            if isinstance(func_obj, (FuncDef, Closure)):
+                values = [arg() for arg in args[:len(func_obj.params)]]
+                result = self.call_function(func_obj, values)
+                return self.check_return(func_obj, result)
+            if func_obj and callable(func_obj):
+                return func_obj(*[to_python(arg()) for arg in args])
+            raise Exception(f"Function '{getattr(target, 'name', target)}' not defined or is not callable")
+        return func_call
+
+    def compile_ClassDef(self, node):
+        def class_def():
+            self.define_class(node)
+            return None
+        return class_def
+
+    def compile_ClassInstance(self, node):
+        class_name = node.class_name
+        args = [self.compile(arg) for arg in node.args]
+        def class_instance():
+            instance = self.new_instance(class_name)
+            if instance.shape.constructor is not None:
+                self.run_constructor(instance.shape.constructor, instance, args)
+            return instance
+        return class_instance
+
+    def compile_SuperCall(self, node):
+        args = [self.compile(arg) for arg in node.args]
+        def super_call():
+            ts = self.lookup('ts', None)
+            if ts is UNBOUND:
+                ts = None
+            if not ts:
+                raise Exception("SUPERMAN can only be called inside a class method")
+            self.run_constructor(self.base_constructor(ts), ts, args)
+        return super_call
+
+    def compile_AttributeAccess(self, node):
+        obj_fn = self.compile(node.obj)
+        site = AttributeSite(node.attr)
+        load_attribute = self.load_attribute
+        return lambda: load_attribute(site, obj_fn())
+
+    def compile_Subscript(self, node):
+        value_fn = self.compile(node.value)
+        index_fn = self.compile(node.index)
+        subscript = self._subscript
+        return lambda: subscript(value_fn(), index_fn())
+
+    def compile_SliceNode(self, node):
+        start_fn = self.compile(node.start) if node.start is not None else None
+        end_fn = self.compile(node.end) if node.end is not None else None
+        step_fn = self.compile(node.step) if node.step is not None else None
+        def slice_():
+            start = start_fn() if start_fn else None
+            if isinstance(start, int):
+                start -= 1
+            end = end_fn() if end_fn else None
+            step = step_fn() if step_fn else None
+            return slice(start, end, step)
+        return slice_
+
+    def compile_Len(self, node):
+        value_fn = self.compile(node.value)
+        return lambda: self._length(value_fn())
+
+    def compile_TallBoy(self, node):
+        value_fn = self.compile(node.value)
+        return lambda: self._tall_boy(value_fn())
+
+    def compile_ToString(self, node):
+        expr = self.compile(node.expr)
+        return lambda: str(expr())
+
+    def compile_ToNumber(self, node):
+        expr = self.compile(node.expr)
+        return lambda: self._to_number(expr())
+
+    def compile_TypeOf(self, node):
+        expr = self.compile(node.expr)
+        return lambda: self._type_of(expr())
+
+    def compile_Nom(self, node):
+        path_fn = self.compile(node.path_expr)
+        return lambda: self._nom(path_fn())
+
+    def compile_Input(self, node):
+        prompt_fn = self.compile(node.prompt_expr)
+        return lambda: input(str(prompt_fn()))
+
+    def compile_Gurt(self, node):
+        expr = self.compile(node.expr)
+        return lambda: self._gurt(expr())
+
+    def compile_Import(self, node):
+        return lambda: self.visit_Import(node)
+
+    def compile_ImportOnly(self, node):
+        return lambda: self.visit_ImportOnly(node)
+
+    def compile_ImportAs(self, node):
+        return lambda: self.visit_ImportAs(node)
@@ -0,0 +1,598 @@
+import bisect
+import math
+from processor.ast import FuncDef, AttributeAccess
+from processor import resolver
+from processor.objects import AttributeSite, MISSING
+
+LOAD_CONST = 1
+LOAD_NAME = 2
+STORE_NAME = 3
+LOAD_FAST = 4
+STORE_FAST = 5
+ASSIGN_FAST = 6
+LOAD_CELL = 7
+STORE_CELL = 8
+LOAD_FREE = 9
+LOAD_GLOBAL = 10
+STORE_GLOBAL = 11
+ASSIGN_GLOBAL = 12
+CHECK_STORE = 13
+CHECK_TYPED = 14
+STORE_ATTR = 15
+LOAD_ATTR = 16
+LOAD_METHOD = 17
+POP_TOP = 18
+DUP_TOP = 19
+SET_RESULT = 20
+CLEAR_RESULT = 21
+LOAD_RESULT = 22
+BINARY_ADD = 23
+BINARY_SUB = 24
+BINARY_MUL = 25
+BINARY_DIV = 26
+COMPARE_EQ = 27
+COMPARE_NE = 28
+COMPARE_LT = 29
+COMPARE_GT = 30
+LOGICAL_NOT = 31
+LOGICAL_AND = 32
+LOGICAL_OR = 33
+FEED = 34
+BUILD_LIST = 35
+BUILD_DICT = 36
+BUILD_SLICE = 37
+BUILD_STRING = 38
+SUBSCRIPT = 39
+LEN = 40
+TALLBOY = 41
+TO_STRING = 42
+TO_NUMBER = 43
+TYPEOF = 44
+NOM = 45
+INPUT = 46
+GURT = 47
+PRINT = 48
+JUMP = 49
+POP_JUMP_IF_FALSE = 50
+GET_RANGE = 51
+GET_ITEMS = 52
+FOR_ITER = 53
+UNPACK_PAIR = 54
+MAKE_FUNCTION = 55
+DEFINE_FUNCTION = 56
+DEFINE_CLASS = 57
+LOAD_FUNC = 58
+CALL_FUNCTION = 59
+TAIL_CALL = 60
+CALL_METHOD = 61
+LOAD_CLASS = 62
+BUILD_INSTANCE = 63
+SUPER_CALL = 64
+RETURN_VALUE = 65
+RAISE_RETURN = 66
+IMPORT = 67
+KILL_SELF = 68
+FAIL = 69
+JUMP_IF_CACHED = 70
+LOAD_SUPER = 71
+
+OPNAMES = {value: name for name, value in list(globals().items()) if name.isupper() and isinstance(value, int)}
+
+HAS_JUMP = {JUMP, POP_JUMP_IF_FALSE, FOR_ITER, JUMP_IF_CACHED}
+HAS_CONST = {LOAD_CONST, CHECK_TYPED, STORE_ATTR, LOAD_ATTR, LOAD_METHOD, MAKE_FUNCTION, DEFINE_FUNCTION, DEFINE_CLASS, IMPORT, FAIL}
+HAS_NAME = {LOAD_NAME, STORE_NAME, LOAD_GLOBAL, STORE_GLOBAL, ASSIGN_GLOBAL, CHECK_STORE}
+# Ops whose constant ends with the `skips` offsets of CodeBuilder.call().
+HAS_SKIPS = {LOAD_FUNC, LOAD_CLASS, LOAD_SUPER}
+HAS_LOCAL = {LOAD_FAST, STORE_FAST, ASSIGN_FAST, LOAD_CELL, STORE_CELL}
+
+LOAD_OPCODES = {
+    resolver.LOCAL: LOAD_FAST,
+    resolver.CELL: LOAD_CELL,
+    resolver.FREE: LOAD_FREE,
+    resolver.GLOBAL: LOAD_GLOBAL,
+}
+
+STORE_OPCODES = {
+    resolver.LOCAL: STORE_FAST,
+    resolver.CELL: STORE_CELL,
+    resolver.GLOBAL: STORE_GLOBAL,
+}
+
+BINARY_OPCODES = {
+    '+': BINARY_ADD,
+    '-': BINARY_SUB,
+    '*': BINARY_MUL,
+    '/': BINARY_DIV,
+}
+
+COMPARE_OPCODES = {
+    'IS': COMPARE_EQ,
+    'IS_NOT': COMPARE_NE,
+    'IS_UNDER': COMPARE_LT,
+    'IS_OVER': COMPARE_GT,
+}
+
+UNARY_OPCODES = {
+    'Len': LEN,
+    'TallBoy': TALLBOY,
+    'ToString': TO_STRING,
+    'ToNumber': TO_NUMBER,
+    'TypeOf': TYPEOF,
+    'Nom': NOM,
+    'Input': INPUT,
+    'Gurt': GURT,
+}
+
+UNARY_OPERANDS = {
+    'Len': 'value',
+    'TallBoy': 'value',
+    'ToString': 'expr',
+    'ToNumber': 'expr',
+    'TypeOf': 'expr',
+    'Nom': 'path_expr',
+    'Input': 'prompt_expr',
+    'Gurt': 'expr',
+}
+
+class Code:
+    """A compiled function or program body.
+
+    `instructions` is a flat list of (opcode, argument) pairs. Constant and
+    name arguments index into `constants` and `names`, frame slots into
+    `varnames` and captured cells into `freenames`; jump arguments are
+    instruction offsets. `lines` lists (offset, line) pairs for the first
+    instruction of each source statement.
+    """
+
+    def __init__(self, name, instructions, constants, names, children, varnames=(), freenames=(), lines=()):
+        self.name = name
+        self.instructions = instructions
+        self.constants = constants
+        self.names = names
+        self.children = children
+        self.varnames = varnames
+        self.freenames = freenames
+        self.lines = lines
+        self.func_def = None
+
+    def line_at(self, offset):
+        """Return the source line of the statement running at offset, or None."""
+        index = bisect.bisect_right(self.lines, (offset, math.inf)) - 1
+        return self.lines[index][1] if index >= 0 else None
+
+class CodeBuilder:
+    def __init__(self, compiler, name, is_module, scope=None):
+        self.compiler = compiler
+        self.name = name
+        self.is_module = is_module
+        self.scope = scope
+        self.instructions = []
+        self.constants = []
+        self.const_index = {}
+        self.names = []
+        self.name_index = {}
+        self.children = []
+        self.lines = []
+
+    def emit(self, op, arg=0):
+        self.instructions.append(op)
+        self.instructions.append(arg)
+        return len(self.instructions) - 2
+
+    def label(self):
+        return len(self.instructions)
+
+    def patch(self, at, target):
+        self.instructions[at + 1] = target
+
+    def const(self, value):
+        if isinstance(value, (int, float, str, bool)) or value is None:
+            key = (type(value), value)
+        else:
+            key = id(value)
+        index = self.const_index.get(key)
+        if index is None:
+            index = len(self.constants)
+            self.constants.append(value)
+            self.const_index[key] = index
+        return index
+
+    def name_arg(self, name):
+        index = self.name_index.get(name)
+        if index is None:
+            index = len(self.names)
+            self.names.append(name)
+            self.name_index[name] = index
+        return index
+
+    def build(self):
+        varnames = tuple(self.scope.names) if self.scope else ()
+        freenames = tuple(self.scope.free) if self.scope else ()
+        return Code(self.name, self.instructions, self.constants, self.names, self.children, varnames, freenames, self.lines)
+
+    def load(self, name, ref):
+        if ref is None:
+            self.emit(LOAD_NAME, self.name_arg(name))
+        elif ref[0] == resolver.GLOBAL:
+            self.emit(LOAD_GLOBAL, self.name_arg(name))
+        else:
+            self.emit(LOAD_OPCODES[ref[0]], ref[1])
+
+    def assign(self, name, ref):
+        if ref is not None and ref[0] == resolver.LOCAL:
+            self.emit(ASSIGN_FAST, ref[1])
+        elif ref is not None and ref[0] == resolver.GLOBAL:
+            self.emit(ASSIGN_GLOBAL, self.name_arg(name))
+        else:
+            self.emit(CHECK_STORE, self.name_arg(name))
+            self.store(name, ref)
+
+    def store(self, name, ref):
+        if ref is None:
+            self.emit(STORE_NAME, self.name_arg(name))
+        elif ref[0] == resolver.GLOBAL:
+            self.emit(STORE_GLOBAL, self.name_arg(name))
+        else:
+            self.emit(STORE_OPCODES[ref[0]], ref[1])
+
+    def statements(self, statements, tail):
+        last = len(statements) - 1
+        for i, stmt in enumerate(statements):
+            self.statement(stmt, tail and i == last)
+
+    def statement(self, node, tail):
+        line = getattr(node, "line", None)
+        if line is not None:
+            self.lines.append((len(self.instructions), line))
+        kind = type(node).__name__
+        if kind == 'Print':
+            self.expr(node.value)
+            self.emit(PRINT)
+            if tail:
+                self.emit(CLEAR_RESULT)
+        elif kind == 'VarAssign':
+            self.var_assign(node, tail)
+        elif kind == 'If':
+            self.if_statement(node, tail)
+        elif kind == 'ForLoop':
+            self.for_loop(node, tail)
+        elif kind == 'ForEachLoop':
+            self.for_each(node, tail)
+        elif kind == 'WhileLoop':
+            self.while_loop(node, tail)
+        elif kind == 'Return':
+            if not self.is_module and type(node.value).__name__ == 'FuncCall' and not isinstance(node.value.name, AttributeAccess):
+                self.func_call(node.value, TAIL_CALL)
+            else:
+                self.expr(node.value)
+            self.emit(RAISE_RETURN if self.is_module else RETURN_VALUE)
+        elif kind == 'Program':
+            if tail:
+                self.emit(CLEAR_RESULT)
+            self.statements(node.statements, False)
+        elif kind == 'ClassDef':
+            for method in node.methods.values():
+                if method.lazy is None:
+                    self.children.append(self.compiler.compile_function(method))
+            self.emit(DEFINE_CLASS, self.const(node))
+            if tail:
+                self.emit(CLEAR_RESULT)
+        elif kind in ('Import', 'ImportOnly', 'ImportAs'):
+            self.emit(IMPORT, self.const(node))
+            if tail:
+                self.emit(CLEAR_RESULT)
+        elif kind == 'KillSelf':
+            self.emit(KILL_SELF)
+        elif kind == 'SuperCall':
+            self.expr(node)
+            self.emit(POP_TOP)
+            if tail:
+                self.emit(CLEAR_RESULT)
+        else:
+            self.expr(node)
+            self.emit(SET_RESULT if tail else POP_TOP)
+
+    def var_assign(self, node, tail):
+        if node.value is not None:
+            self.expr(node.value)
+        else:
+            self.emit(LOAD_CONST, self.const(None))
+        if tail:
+            self.emit(DUP_TOP)
+        if isinstance(node.name, AttributeAccess):
+            self.expr(node.name.obj)
+            self.emit(STORE_ATTR, self.const(AttributeSite(node.name.attr)))
+        elif node.checker:
+            self.emit(CHECK_TYPED, self.const((node.name, node.checker)))
+            self.store(node.name, getattr(node, "ref", None))
+        else:
+            self.assign(node.name, getattr(node, "ref", None))
+        if tail:
+            self.emit(SET_RESULT)
+
+    def if_statement(self, node, tail):
+        if tail:
+            self.emit(CLEAR_RESULT)
+        exits = []
+        for condition, body in node.branches:
+            skip = None
+            if condition is not None:
+                self.expr(condition)
+                skip = self.emit(POP_JUMP_IF_FALSE)
+            self.statements(body, tail)
+            if condition is None:
+                break
+            exits.append(self.emit(JUMP))
+            self.patch(skip, self.label())
+        end = self.label()
+        for at in exits:
+            self.patch(at, end)
+
+    def loop(self, body, targets, tail):
+        start = self.label()
+        exit_jump = self.emit(FOR_ITER)
+        if len(targets) == 2:
+            self.emit(UNPACK_PAIR)
+        for name, ref in reversed(targets):
+            self.store(name, ref)
+        self.statements(body, tail)
+        self.emit(JUMP, start)
+        self.patch(exit_jump, self.label())
+
+    def reset_hoisted(self, loop):
+        for node in loop.hoisted:
+            self.emit(LOAD_CONST, self.const(MISSING))
+            self.store(node.name, node.ref)
+
+    def for_loop(self, node, tail):
+        if tail:
+            self.emit(CLEAR_RESULT)
+        self.reset_hoisted(node)
+        self.expr(node.start)
+        self.expr(node.end)
+        self.emit(GET_RANGE)
+        self.loop(node.body, [(node.var, node.var_ref)], tail)
+
+    def for_each(self, node, tail):
+        if tail:
+            self.emit(CLEAR_RESULT)
+        self.reset_hoisted(node)
+        self.expr(node.collection)
+        self.emit(GET_ITEMS)
+        self.loop(node.body, [(node.value_var, node.value_ref), (node.index_var, node.index_ref)], tail)
+
+    def while_loop(self, node, tail):
+        if tail:
+            self.emit(CLEAR_RESULT)
+        self.reset_hoisted(node)
+        start = self.label()
+        self.expr(node.condition)
+        exit_jump = self.emit(POP_JUMP_IF_FALSE)
+        self.statements(node.body, tail)
+        self.emit(JUMP, start)
+        self.patch(exit_jump, self.label())
+
+    def expr(self, node):
+        kind = type(node).__name__
+        if kind in ('Num', 'Bool'):
+            self.emit(LOAD_CONST, self.const(node.value))
+        elif kind == 'Str':
+            self.emit(LOAD_CONST, self.const(getattr(node, "value", None)))
+        elif kind == 'Template':
+            for i, part in enumerate(node.parts):
+                if i % 2 == 0:
+                    self.emit(LOAD_CONST, self.const(part))
+                else:
+                    self.expr(part)
+                    self.emit(TO_STRING)
+            self.emit(BUILD_STRING, len(node.parts))
+        elif kind == 'Var':
+            self.load(node.name, getattr(node, "ref", None))
+        elif kind == 'Hoisted':
+            self.load(node.name, node.ref)
+            cached = self.emit(JUMP_IF_CACHED)
+            self.expr(node.expr)
+            self.emit(DUP_TOP)
+            self.store(node.name, node.ref)
+            self.patch(cached, self.label())
+        elif kind == 'BinOp':
+            self.expr(node.left)
+            self.expr(node.right)
+            op = getattr(node.op, "value", None)
+            if op not in BINARY_OPCODES:
+                self.emit(FAIL, self.const(f"Unknown operator: {op}"))
+            else:
+                self.emit(BINARY_OPCODES[op])
+        elif kind == 'Compare':
+            self.expr(node.left)
+            self.expr(node.right)
+            if node.op not in COMPARE_OPCODES:
+                self.emit(FAIL, self.const(f"Unknown comparison operator: {node.op}"))
+            else:
+                self.emit(COMPARE_OPCODES[node.op])
+        elif kind == 'LogicalOp':
+            self.expr(node.left)
+            if node.op == 'NOT':
+                self.emit(LOGICAL_NOT)
+                return
+            self.expr(node.right)
+            if node.op == 'ALSO':
+                self.emit(LOGICAL_AND)
+            elif node.op == 'MAYBE':
+                self.emit(LOGICAL_OR)
+            else:
+                self.emit(FAIL, self.const(f"Unknown logical operator: {node.op}"))
+        elif kind == 'FeedOp':
+            self.expr(node.left)
+            self.expr(node.right)
+            self.emit(FEED)
+        elif kind == 'ListLiteral':
+            for element in node.elements:
+                self.expr(element)
+            self.emit(BUILD_LIST, len(node.elements))
+        elif kind == 'DictLiteral':
+            for key, value in node.pairs:
+                self.expr(key)
+                self.expr(value)
+            self.emit(BUILD_DICT, len(node.pairs))
+        elif kind == 'Subscript':
+            self.expr(node.value)
+            self.expr(node.index)
+            self.emit(SUBSCRIPT)
+        elif kind == 'SliceNode':
+            for part in (node.start, node.end, node.step):
+                if part is None:
+                    self.emit(LOAD_CONST, self.const(None))
+                else:
+                    self.expr(part)
+            self.emit(BUILD_SLICE)
+        elif kind in UNARY_OPCODES:
+            self.expr(getattr(node, UNARY_OPERANDS[kind]))
+            self.emit(UNARY_OPCODES[kind])
+        elif kind == 'FuncDef':
+            # A body the parser skipped is compiled when it is first called.
+            if node.lazy is None:
+                self.children.append(self.compiler.compile_function(node))
+            self.emit(DEFINE_FUNCTION, self.const(node))
+        elif kind == 'FuncCall':
+            self.func_call(node)
+        elif kind == 'AttributeAccess':
+            self.expr(node.obj)
+            self.emit(LOAD_ATTR, self.const(AttributeSite(node.attr)))
+        elif kind == 'ClassInstance':
+            skips = []
+            self.emit(LOAD_CLASS, self.const((node.class_name, skips)))
+            self.call(BUILD_INSTANCE, node.args, skips, self.expressions)
+        elif kind == 'SuperCall':
+            skips = []
+            self.emit(LOAD_SUPER, self.const((skips,)))
+            self.call(SUPER_CALL, node.args, skips, self.expressions)
+        else:
+            self.emit(FAIL, self.const(f'No visit_{kind} method'))
+
+    def func_call(self, node, call_op=CALL_FUNCTION):
+        if isinstance(node.name, AttributeAccess):
+            self.expr(node.name.obj)
+            self.emit(LOAD_METHOD, self.const(AttributeSite(node.name.attr)))
+            for arg in node.args:
+                self.expr(arg)
+            self.emit(CALL_METHOD, len(node.args))
+            return
+        name = getattr(node.name, "name", node.name)
+        if not isinstance(name, str):
+            self.emit(FAIL, self.const(f"Function '{name}' not defined or is not callable"))
+            return
+        skips = []
+        self.emit(LOAD_FUNC, self.const((name, getattr(node.name, "ref", None), skips)))
+        self.call(call_op, node.args, skips, self.arguments)
+
+    def call(self, call_op, args, skips, evaluate):
+        """Emit the arguments and call_op, then one shorter call for each smaller argument count.
+
+        skips[count] is where the call passing only the first `count` arguments starts. The
+        LOAD_FUNC, LOAD_CLASS or LOAD_SUPER before it jumps there when the function or constructor
+        takes fewer parameters than the call has arguments, so the surplus arguments are not
+        evaluated, as on the ast engine.
+        """
+        evaluate(args)
+        self.emit(call_op, len(args))
+        if args:
+            exits = [self.emit(JUMP)]
+            for count in range(len(args)):
+                skips.append(self.label())
+                evaluate(args[:count])
+                self.emit(call_op, count)
+                exits.append(self.emit(JUMP))
+            end = self.label()
+            for at in exits:
+                self.patch(at, end)
+
+    def expressions(self, args):
+        for arg in args:
+            self.expr(arg)
+
+    def arguments(self, args):
+        for arg in args:
+            if isinstance(arg, FuncDef) and arg.name is None:
+                self.children.append(self.compiler.compile_function(arg))
+                self.emit(MAKE_FUNCTION, self.const(arg))
+            else:
+                self.expr(arg)
+
+class Compiler:
+    """Lowers a parsed Program into Code objects for the VM."""
+
+    def __init__(self):
+        self.codes = {}
+
+    def compile_expression(self, node, name="<expression>"):
+        builder = CodeBuilder(self, name, is_module=False)
+        builder.expr(node)
+        builder.emit(RETURN_VALUE)
+        return builder.build()
+
+    def compile_program(self, program, name="<module>"):
+        resolver.resolve(program)
+        builder = CodeBuilder(self, name, is_module=True)
+        builder.statements(program.statements, False)
+        builder.emit(LOAD_CONST, builder.const(None))
+        builder.emit(RETURN_VALUE)
+        return builder.build()
+
+    def compile_function(self, func_def):
+        code = self.codes.get(func_def)
+        if code is None:
+            builder = CodeBuilder(self, func_def.name or "<anonymous>", is_module=False, scope=resolver.function_scope(func_def))
+            builder.statements(func_def.body, True)
+            builder.emit(LOAD_RESULT)
+            builder.emit(RETURN_VALUE)
+            code = builder.build()
+            code.func_def = func_def
+            self.codes[func_def] = code
+        return code
+
+def disassemble(code, seen=None):
+    """Return a human readable listing of code and every nested body."""
+    seen = set() if seen is None else seen
+    seen.add(id(code))
+    lines = [f"Disassembly of {code.name}:"]
+    instructions = code.instructions
+    targets = {instructions[i + 1] for i in range(0, len(instructions), 2) if instructions[i] in HAS_JUMP}
+    targets.update(skip for i in range(0, len(instructions), 2) if instructions[i] in HAS_SKIPS for skip in code.constants[instructions[i + 1]][-1])
+    for offset in range(0, len(instructions), 2):
+        op = instructions[offset]
+        arg = instructions[offset + 1]
+        marker = ">>" if offset in targets else "  "
+        detail = ""
+        if op in HAS_CONST:
+            detail = f"({describe_const(code.constants[arg])})"
+        elif op in HAS_NAME:
+            detail = f"({code.names[arg]})"
+        elif op in HAS_LOCAL:
+            detail = f"({code.varnames[arg]})"
+        elif op == LOAD_FREE:
+            detail = f"({code.freenames[arg]})"
+        elif op in HAS_SKIPS:
+            const = code.constants[arg]
+            name = "SUPERMAN" if op == LOAD_SUPER else const[0]
+            skips = const[-1]
+            detail = f"({name}, fewer args at {', '.join(map(str, skips))})" if skips else f"({name})"
+        elif op in HAS_JUMP:
+            detail = f"(to {arg})"
+        lines.append(f"{marker} {offset:>5} {OPNAMES[op]:<18} {arg:>4} {detail}".rstrip())
+    for child in code.children:
+        if id(child) not in seen:
+            lines.append("")
+            lines.extend(disassemble(child, seen).splitlines())
+    return "\n".join(lines)
+
+def describe_const(value):
+    if isinstance(value, AttributeSite):
+        return value.attr
+    if isinstance(value, FuncDef):
+        return f"<function {value.name or '<anonymous>'}>"
+    if type(value).__name__ == 'ClassDef':
+        return f"<class {value.name}>"
+    if type(value).__name__ in ('Import', 'ImportOnly', 'ImportAs'):
+        return f"<{type(value).__name__} {value.module_path}>"
+    return repr(value)
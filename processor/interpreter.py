@@ -1,11 +1,18 @@
 import os
 import sys
+import time
+import types
 import shutil
 from typing import Any
 from processor.lexer import Lexer
 from processor.parser import Parser
+from processor import cache, libraries, modules
+from processor.objects import Shape, Instance, AttributeSite, MISSING
 from processor.parser import AttributeAccess, Var
-from processor.ast import Var
+from processor.ast import Var, FuncDef, Num, BinOp, Compare, Subscript
+from processor.resolver import resolve, function_scope, make_function, is_function, Closure, UNBOUND, LOCAL, CELL, FREE
+from processor.stats import Counters
+from processor import quicken
 
 class Interpreter:
     def __init__(self):
@@ -14,9 +21,134 @@ class Interpreter:
         self.classes = {}
         self.libraries = {}
         self.var_types = {}
+        self.runtime_checks = True
+        self.profiler = None
+        self.sampler = None
+        self.tracer = None
+        self.counters = Counters()
+        self.quickening = False
+        self.shapes = {}
+        self.frame = None
+        self.closure = None
+        self.scope = None
+        self.file = None
+        self.main_file = None
+        self.returning = False
 
     def interpret(self, node):
-        return self.visit(node)
+        resolve(node)
+        result = self.visit(node)
+        if self.returning:
+            self.returning = False
+            raise ReturnException(result)
+        return result
+
+    def profile(self, profiler):
+        """Time every call and statement this interpreter runs with profiler."""
+        self.profiler = profiler
+        self.interpret = profiler.timed_program(self, self.interpret)
+        self.call_function = profiler.timed_call(self.call_function)
+        self.visit = profiler.timed_visit(self.visit)
+
+    def sample(self, sampler):
+        """Let sampler name the functions of every program this interpreter runs."""
+        self.sampler = sampler
+        self.interpret = sampler.registering(self, self.interpret)
+
+    def count_nodes(self):
+        """Count the nodes this interpreter evaluates by type, in stats()["nodes"]."""
+        self.counters.counting = True
+        self.visit = self.counters.counted_visit(self.visit)
+
+    def quicken(self):
+        """Specialize BinOp, Compare and Subscript nodes to the operand types they see, counted in stats()["quickening"]."""
+        self.quickening = True
+        self.visit_BinOp = self.quicken_BinOp
+        self.visit_Compare = self.quicken_Compare
+        self.visit_Subscript = self.quicken_Subscript
+
+    def stats(self):
+        """Return the counters of this interpreter and its modules as a JSON-ready dict."""
+        return self.counters.as_dict()
+
+    def trace(self, tracer):
+        """Record this interpreter's calls, module runs and library calls as tracer events."""
+        self.tracer = tracer
+        self.interpret = tracer.traced_program(self, self.interpret)
+        self.call_function = tracer.traced_call(self.call_function)
+        self._execute_module = tracer.traced_module(self._execute_module)
+        self.load_attribute = tracer.traced_attribute(self.load_attribute)
+        self.visit_ImportAs = tracer.traced_import(self, self.visit_ImportAs)
+
+    def lookup(self, name, ref):
+        if ref is None:
+            value = self.scope.get(self.frame, self.closure, name) if self.scope else UNBOUND
+        else:
+            kind, slot = ref
+            if kind == LOCAL:
+                value = self.frame[slot]
+            elif kind == CELL:
+                value = self.frame[slot].value
+            elif kind == FREE:
+                value = self.closure[slot].value
+            else:
+                value = UNBOUND
+        if value is UNBOUND:
+            return self.env.get(name, UNBOUND)
+        return value
+
+    def store(self, name, ref, value):
+        if ref is None:
+            if self.scope is None or not self.scope.set(self.frame, name, value):
+                self.env[name] = value
+            return
+        kind, slot = ref
+        if kind == LOCAL:
+            self.frame[slot] = value
+        elif kind == CELL:
+            self.frame[slot].value = value
+        else:
+            self.env[name] = value
+
+    def call_function(self, func, args):
+        if isinstance(func, Closure):
+            func_def, closure = func.func_def, func.cells
+        else:
+            func_def, closure = func, None
+        scope = function_scope(func_def)
+        saved = self.frame, self.closure, self.scope
+        self.frame = scope.new_frame(args)
+        self.closure = closure
+        self.scope = scope
+        counters = self.counters
+        counters.calls += 1
+        counters.depth += 1
+        if counters.depth > counters.peak_depth:
+            counters.peak_depth = counters.depth
+        result = None
+        try:
+            for stmt in func_def.body:
+                result = self.visit(stmt)
+                if self.returning:
+                    break
+        finally:
+            self.frame, self.closure, self.scope = saved
+            counters.depth -= 1
+        self.returning = False
+        return result
+
+    def call_library(self, library, attr, func, args):
+        """Call a function of a GIVE LIBRARY library, recording its latency in stats()."""
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.counters.library_call(library, attr, time.perf_counter() - start)
+
+    def anon_function(self, func):
+        def anon_func(*args):
+            return self.call_function(func, list(args))
+        return anon_func
 
     def visit(self, node):
         method_name = f'visit_{type(node).__name__}'
@@ -57,12 +189,60 @@ class Interpreter:
         else:
             raise Exception(f"Unknown operator: {op}")
 
+    visit_GenericBinOp = visit_BinOp
+
+    def quicken_BinOp(self, node):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        result = self._binary(getattr(node.op, "value", None), left, right)
+        if node.__class__ is BinOp:
+            self.specialized(quicken.specialize_binop(node, left, right))
+        return result
+
+    def _binary(self, op, left, right):
+        if op == '+':
+            return left + right
+        elif op == '-':
+            return left - right
+        elif op == '*':
+            return left * right
+        elif op == '/':
+            return left / right
+        else:
+            raise Exception(f"Unknown operator: {op}")
+
+    # Specialized nodes read Num and Var operands directly instead of going
+    # through visit, so count_nodes() does not see those operands.
+    def _quick_operation(self, node):
+        left = node.left
+        left = left.value if left.__class__ is Num else self.visit_Var(left) if left.__class__ is Var else self.visit(left)
+        right = node.right
+        right = right.value if right.__class__ is Num else self.visit_Var(right) if right.__class__ is Var else self.visit(right)
+        if type(left) is node.guard and type(right) is node.guard:
+            return quicken.OPERATORS[node.__class__](left, right)
+        return self.deoptimize(node, left, right)
+
+    visit_QuickAdd = visit_QuickSub = visit_QuickMul = visit_QuickDiv = _quick_operation
+
+    def specialized(self, variant):
+        counters = self.counters
+        if variant is None:
+            counters.generic += 1
+        else:
+            counters.specialized[variant] = counters.specialized.get(variant, 0) + 1
+
+    def deoptimize(self, node, left, right):
+        """Evaluate a specialized node whose guard failed on left and right, and make it generic."""
+        self.counters.deoptimized += 1
+        quicken.deoptimize(node)
+        if isinstance(node, Subscript):
+            return self._subscript(left, right)
+        if isinstance(node, Compare):
+            return self._compare(node.op, left, right)
+        return self._binary(getattr(node.op, "value", None), left, right)
+
     def visit_Print(self, node):
         value = self.visit(node.value)
-        if hasattr(value, "interpolated") and getattr(value, "interpolated", False):
-            value = self.visit_Str(value)
-        elif hasattr(node.value, "interpolated") and getattr(node.value, "interpolated", False):
-            value = self.visit_Str(node.value)
         print(value)
         return None
 
@@ -74,169 +254,219 @@ class Interpreter:
             if getattr(stmt, "is_kill_self", False):
                 print("Script terminated by KILL SELF.")
                 sys.exit(1)
-            self.visit(stmt)
+            result = self.visit(stmt)
+            if self.returning:
+                return result
         return None
 
     def visit_ClassDef(self, node):
-        self.classes[node.name] = node
+        self.define_class(node)
         return None
 
-    def visit_ClassInstance(self, node):
-        class_def = self.classes.get(node.class_name)
+    def define_class(self, class_def):
+        # The shape is made on the first BUILD, so methods the parser skipped stay unparsed until then.
+        self.classes[class_def.name] = class_def
+
+    def shape_of(self, class_def):
+        shape = self.shapes.get(class_def)
+        if shape is None:
+            base = None
+            base_name = getattr(class_def, "base_class", None)
+            if base_name:
+                base_def = self.classes.get(base_name)
+                if base_def is None:
+                    # The base class is not defined yet; resolve it again on the next BUILD.
+                    return Shape(class_def)
+                if base_def is not class_def:
+                    base = self.shape_of(base_def)
+            shape = Shape(class_def, base)
+            self.shapes[class_def] = shape
+        return shape
+
+    def base_constructor(self, ts):
+        class_def = ts.shape.class_def if isinstance(ts, Instance) else None
+        base_class_name = getattr(class_def, "base_class", None)
+        if not base_class_name:
+            raise Exception("No base class to call SUPERMAN on")
+        base_class = self.classes.get(base_class_name)
+        ctor = self.shape_of(base_class).constructor if base_class else None
+        if ctor is None:
+            raise Exception(f"Base class '{base_class_name}' has no constructor")
+        return ctor
+
+    def new_instance(self, class_name):
+        class_def = self.classes.get(class_name)
         if not class_def:
-            raise Exception(f"Class '{node.class_name}' not defined")
-        instance = {'__class__': class_def, '__fields__': {}}
-        if getattr(class_def, "base_class", None):
-            base = self.classes.get(class_def.base_class)
-            if base:
-                for k, v in base.methods.items():
-                    if k not in class_def.methods:
-                        class_def.methods[k] = v
-        if 'constructor' in class_def.methods:
-            ctor = class_def.methods['constructor']
-            local_env = {'ts': instance}
-            for pname, arg in zip(ctor.params[1:], node.args):
-                local_env[pname] = self.visit(arg)
-            old_env = self.env
-            self.env = local_env
-            for stmt in ctor.body:
-                self.visit(stmt)
-            self.env = old_env
+            raise Exception(f"Class '{class_name}' not defined")
+        instance = Instance(self.shape_of(class_def))
+        self.counters.instances += 1
+        return instance
+
+    def super_target(self):
+        """Return the base constructor SUPERMAN calls and the `ts` it runs on."""
+        ts = self.lookup('ts', None)
+        if ts is UNBOUND:
+            ts = None
+        if not ts:
+            raise Exception("SUPERMAN can only be called inside a class method")
+        return self.base_constructor(ts), ts
+
+    def visit_ClassInstance(self, node):
+        instance = self.new_instance(node.class_name)
+        ctor = instance.shape.constructor
+        if ctor is not None:
+            args = [self.visit(arg) for arg in node.args[:len(ctor.params) - 1]]
+            self.call_function(ctor, [instance] + args)
         return instance
 
     def visit_SuperCall(self, node):
-        ts = self.env.get('ts')
+        ts = self.lookup('ts', None)
+        if ts is UNBOUND:
+            ts = None
         if not ts:
             raise Exception("SUPERMAN can only be called inside a class method")
-        class_def = ts.get('__class__')
-        base_class_name = getattr(class_def, "base_class", None)
-        if not base_class_name:
-            raise Exception("No base class to call SUPERMAN on")
-        base_class = self.classes.get(base_class_name)
-        if not base_class or 'constructor' not in base_class.methods:
-            raise Exception(f"Base class '{base_class_name}' has no constructor")
-        ctor = base_class.methods['constructor']
-        local_env = {'ts': ts}
-        for pname, arg in zip(ctor.params[1:], node.args):
-            local_env[pname] = self.visit(arg)
-        old_env = self.env
-        self.env = local_env
-        for stmt in ctor.body:
-            self.visit(stmt)
-        self.env = old_env
+        ctor = self.base_constructor(ts)
+        args = [self.visit(arg) for arg in node.args[:len(ctor.params) - 1]]
+        self.call_function(ctor, [ts] + args)
 
     def visit_AttributeAccess(self, node):
-        obj = self.visit(node.obj)
-        attr = node.attr
+        site = node.site
+        if site is None:
+            site = node.site = AttributeSite(node.attr)
+        return self.load_attribute(site, self.visit(node.obj))
+
+    def load_attribute(self, site, obj):
+        if obj.__class__ is Instance:
+            shape = obj.shape
+            if shape is not site.shape or shape.version != site.version:
+                site.fill(shape)
+            slot = site.slot
+            if slot is not None:
+                values = obj.values
+                if slot < len(values) and values[slot] is not MISSING:
+                    return values[slot]
+            if site.method is not None:
+                return self.bound_method(obj, site.method)
+            raise Exception(f"Attribute '{site.attr}' not found")
+        if obj is site.library:
+            try:
+                return getattr(site.target, site.attr)
+            except AttributeError:
+                raise Exception(f"Library '{obj.__nscript_pythonlib__}' has no attribute '{site.attr}'")
+        value = self.get_attribute(obj, site.attr)
+        if hasattr(obj, "__nscript_pythonlib__"):
+            site.library = obj
+            site.target = getattr(obj, "__nscript_module__", None) or obj
+        return value
+
+    def lookup_method(self, site, obj):
+        """Return the class method obj.attr calls, or None when it is not a method of an instance."""
+        if obj.__class__ is not Instance:
+            return None
+        shape = obj.shape
+        if shape is not site.shape or shape.version != site.version:
+            site.fill(shape)
+        slot = site.slot
+        if slot is not None:
+            values = obj.values
+            if slot < len(values) and values[slot] is not MISSING:
+                return None
+        return site.method
+
+    def store_attribute(self, site, obj, value):
+        if obj.__class__ is Instance:
+            shape = obj.shape
+            if shape is not site.shape or shape.version != site.version:
+                obj.set(site.attr, value)
+                site.fill(shape)
+                return
+            values = obj.values
+            if site.slot is not None and site.slot < len(values):
+                values[site.slot] = value
+                return
+        obj.set(site.attr, value)
+
+    def bound_method(self, obj, method):
+        def bound_method(*args):
+            return self.call_function(method, [obj] + list(args))
+        return bound_method
+
+    def get_attribute(self, obj, attr):
         if hasattr(obj, "__nscript_pythonlib__"):
             if hasattr(obj, attr):
                 return getattr(obj, attr)
             raise Exception(f"Library '{obj.__nscript_pythonlib__}' has no attribute '{attr}'")
-        if isinstance(obj, dict) and attr in obj.get('__fields__', {}):
-            return obj['__fields__'][attr]
-        class_def = obj.get('__class__') if isinstance(obj, dict) else None
-        if class_def and attr in class_def.methods:
-            def bound_method(*args):
-                method = class_def.methods[attr]
-                local_env = {'ts': obj}
-                for pname, arg in zip(method.params[1:], args):
-                    local_env[pname] = arg
-                old_env = self.env
-                self.env = local_env
-                result = None
+        if isinstance(obj, modules.Module):
+            return self._module_attribute(obj, attr)
+        if isinstance(obj, Instance):
+            value = obj.get(attr)
+            if value is not MISSING:
+                return value
+            method = obj.shape.methods.get(attr)
+            if method is not None:
+                return self.bound_method(obj, method)
+        raise Exception(f"Attribute '{attr}' not found")
+
+    def _module_attribute(self, module, attr):
+        value = module.get(attr)
+        if is_function(value):
+            def module_func(*args):
+                env, self.env = self.env, module.env
                 try:
-                    for stmt in method.body:
-                        result = self.visit(stmt)
-                except ReturnException as ret:
-                    self.env = old_env
-                    return ret.value
-                self.env = old_env
+                    result = self.call_function(value, list(args))
+                finally:
+                    self.env = env
+                if value.return_checker and self.runtime_checks and not value.return_checker.matches(result):
+                    raise Exception(f"Function '{value.name}' must return {value.return_types}, got {type(result).__name__}")
                 return result
-            return bound_method
-        raise Exception(f"Attribute '{attr}' not found")
+            return module_func
+        return value
 
     def visit_VarAssign(self, node):
         value = self.visit(node.value) if node.value is not None else None
-        if hasattr(node, "types") and node.types:
-            self.var_types[node.name] = node.types
-            if value is not None and not self._type_matches(value, node.types):
-                raise Exception(f"Type error: variable '{node.name}' expects {node.types}, got {type(value).__name__}")
-        elif node.name in self.var_types:
-            if value is not None and not self._type_matches(value, self.var_types[node.name]):
-                raise Exception(f"Type error: variable '{node.name}' expects {self.var_types[node.name]}, got {type(value).__name__}")
+        if self.runtime_checks:
+            checker = node.checker
+            if checker:
+                self.var_types[node.name] = checker
+            else:
+                checker = self.var_types.get(node.name)
+            if checker and value is not None and not checker.matches(value):
+                raise Exception(f"Type error: variable '{node.name}' expects {checker}, got {type(value).__name__}")
         if isinstance(node.name, AttributeAccess):
             obj = self.visit(node.name.obj)
-            attr = node.name.attr
-            obj['__fields__'][attr] = value
+            site = node.name.site
+            if site is None:
+                site = node.name.site = AttributeSite(node.name.attr)
+            self.store_attribute(site, obj, value)
             return value
         else:
-            self.env[node.name] = value
-            if hasattr(value, "__class__") and value.__class__.__name__ == "FuncDef":
+            self.store(node.name, node.ref, value)
+            if is_function(value):
                 self.functions[node.name] = value
             return value
 
-    def _type_matches(self, value, types):
-        type_map = {
-            'str': str,
-            'string': str,
-            'num': (int, float),
-            'number': (int, float),
-            'int': int,
-            'float': float,
-            'bool': bool,
-            'boolean': bool,
-            'list': list,
-            'array': list,
-            'dict': dict,
-            'dictionary': dict,
-        }
-        for t in types:
-            if isinstance(t, tuple) and t[0] == 'func':
-                if not hasattr(value, "params") or not hasattr(value, "body"):
-                    continue
-                arg_types, ret_type = t[1], t[2]
-                if isinstance(value, dict) or not hasattr(value, "params"):
-                    continue
-                if len(value.params) != len(arg_types):
-                    continue
-                if hasattr(value, "param_types"):
-                    for pname, expected_type in zip(value.params, arg_types):
-                        if pname in value.param_typets and value.param_types[pname] != expected_type:
-                            break
-                    else:
-                        if hasattr(value, "return_types") and value.return_types:
-                            if ret_type in value.return_types:
-                                return True
-                        elif not hasattr(value, "return_types") or value.return_types is None:
-                            return True
-                        continue
-                else:
-                    if hasattr(value, "return_types") and value.return_types:
-                        if ret_type in value.return_types:
-                            return True
-                    elif not hasattr(value, "return_types") or value.return_types is None:
-                        return True
-            elif isinstance(t, str):
-                py_type = type_map.get(t.lower(), None)
-                if py_type and isinstance(value, py_type):
-                    return True
-                if isinstance(value, dict) and '__class__' in value:
-                    class_def = value['__class__']
-                    if hasattr(class_def, 'name') and class_def.name.lower() == t.lower():
-                        return True
-        return False
-
     def visit_FuncCall(self, node):
         if isinstance(node.name, AttributeAccess):
-            method = self.visit(node.name)
+            site = node.name.site
+            if site is None:
+                site = node.name.site = AttributeSite(node.name.attr)
+            obj = self.visit(node.name.obj)
+            method = self.lookup_method(site, obj)
+            if method is not None:
+                args = [self._to_python_value(self.visit(arg)) for arg in node.args]
+                return self.call_function(method, [obj] + args)
+            value = self.load_attribute(site, obj)
             args = [self._to_python_value(self.visit(arg)) for arg in node.args]
-            if callable(method):
-                return method(*args)
+            if callable(value):
+                if obj is site.library:
+                    return self.call_library(obj, site.attr, value, args)
+                return value(*args)
             raise Exception("Attribute is not callable")
         func_obj = None
         if hasattr(node.name, "name"):
-            if node.name.name in self.env:
-                func_obj = self.env[node.name.name]
+            value = self.lookup(node.name.name, getattr(node.name, "ref", None))
+            if value is not UNBOUND:
+                func_obj = value
             elif node.name.name in self.functions:
                 func_obj = self.functions[node.name.name]
             elif node.name.name is None:
@@ -245,28 +475,16 @@ class Interpreter:
             func_obj = self.functions[node.name]
         elif hasattr(node.name, "body") and hasattr(node.name, "params"):
             func_obj = node.name
-        if func_obj and not isinstance(func_obj, str) and hasattr(func_obj, "params") and hasattr(func_obj, "body"):
-            old_env = self.env.copy()
-            local_env = old_env.copy()
-            for param, arg in zip(func_obj.params, node.args):
-                if hasattr(arg, "__class__") and arg.__class__.__name__ == "FuncDef" and getattr(arg, "name", None) is None:
-                    local_env[param] = arg
+        if func_obj and is_function(func_obj):
+            args = []
+            for arg in node.args[:len(func_obj.params)]:
+                if isinstance(arg, FuncDef) and arg.name is None:
+                    args.append(make_function(arg, self.frame, self.closure))
                 else:
-                    local_env[param] = self.visit(arg)
-            self.env = local_env
-            result = None
-            try:
-                for stmt in func_obj.body:
-                    result = self.visit(stmt)
-            except ReturnException as ret:
-                self.env = old_env
-                if hasattr(func_obj, "return_types") and func_obj.return_types:
-                    if not self._type_matches(ret.value, func_obj.return_types):
-                        raise Exception(f"Function '{func_obj.name}' must return {func_obj.return_types}, got {type(ret.value).__name__}")
-                return ret.value
-            self.env = old_env
-            if hasattr(func_obj, "return_types") and func_obj.return_types:
-                if not self._type_matches(result, func_obj.return_types):
+                    args.append(self.visit(arg))
+            result = self.call_function(func_obj, args)
+            if func_obj.return_checker and self.runtime_checks:
+                if not func_obj.return_checker.matches(result):
                     raise Exception(f"Function '{func_obj.name}' must return {func_obj.return_types}, got {type(result).__name__}")
             return result
         if func_obj and callable(func_obj):
@@ -276,7 +494,8 @@ class Interpreter:
 
     def visit_Return(self, node):
         value = self.visit(node.value)
-        raise ReturnException(value)
+        self.returning = True
+        return value
 
     def visit_FeedOp(self, node):
         left = self.visit(node.left)
@@ -293,8 +512,36 @@ class Interpreter:
         return {self.visit(k): self.visit(v) for k, v in node.pairs}
 
     def visit_Subscript(self, node):
+        return self._subscript(self.visit(node.value), self.visit(node.index))
+
+    visit_GenericSubscript = visit_Subscript
+
+    def quicken_Subscript(self, node):
         value = self.visit(node.value)
         index = self.visit(node.index)
+        result = self._subscript(value, index)
+        if node.__class__ is Subscript:
+            self.specialized(quicken.specialize_subscript(node, value, index))
+        return result
+
+    def visit_QuickIndex(self, node):
+        value = node.value
+        value = self.visit_Var(value) if value.__class__ is Var else self.visit(value)
+        index = node.index
+        index = self.visit_Var(index) if index.__class__ is Var else self.visit(index)
+        if type(value) is node.guard and type(index) is int and 0 < index <= len(value):
+            return value[index - 1]
+        return self.deoptimize(node, value, index)
+
+    def visit_QuickConstIndex(self, node):
+        value = node.value
+        value = self.visit_Var(value) if value.__class__ is Var else self.visit(value)
+        offset = node.offset
+        if type(value) is node.guard and offset < len(value):
+            return value[offset]
+        return self.deoptimize(node, value, offset + 1)
+
+    def _subscript(self, value, index):
         if isinstance(index, slice):
             if isinstance(value, (str, list)):
                 return value[index]
@@ -321,27 +568,47 @@ class Interpreter:
             raise Exception(f"Cannot subscript value of type {type(value).__name__}")
 
     def visit_Len(self, node):
-        value = self.visit(node.value)
+        return self._length(self.visit(node.value))
+
+    def _length(self, value):
         if isinstance(value, (list, dict)):
             return len(value)
         else:
             raise Exception(f"Cannot get length of type {type(value).__name__}")
 
     def visit_TallBoy(self, node):
-        value = self.visit(node.value)
+        return self._tall_boy(self.visit(node.value))
+
+    def _tall_boy(self, value):
         if isinstance(value, str):
             return len(value)
         else:
             raise Exception(f"TALL BOY only works on strings, got {type(value).__name__}")
 
+    def reset_hoisted(self, loop):
+        for node in loop.hoisted:
+            self.store(node.name, node.ref, MISSING)
+
+    def visit_Hoisted(self, node):
+        kind, slot = node.ref
+        value = self.frame[slot] if kind == LOCAL else self.env.get(node.name, MISSING)
+        if value is MISSING:
+            value = self.visit(node.expr)
+            self.store(node.name, node.ref, value)
+        return value
+
     def visit_ForLoop(self, node):
+        if node.hoisted:
+            self.reset_hoisted(node)
         start = self.visit(node.start)
         end = self.visit(node.end)
         result = None
         for i in range(int(start), int(end) + 1):
-            self.env[node.var] = i
+            self.store(node.var, node.var_ref, i)
             for stmt in node.body:
                 result = self.visit(stmt)
+                if self.returning:
+                    return result
         return result
 
     def visit_LogicalOp(self, node):
@@ -357,23 +624,12 @@ class Interpreter:
             raise Exception(f"Unknown logical operator: {node.op}")
 
     def visit_Import(self, node):
+        self.counters.imports += 1
         if node.module_path.startswith("LIBRARY "):
             libname = node.module_path[len("LIBRARY "):].strip('"').strip("'")
             if libname in self.libraries:
                 return
-            local_libs_dir = os.path.join(os.environ.get("LOCALAPPDATA", ""), "nscript_libs")
-            lib_dir = os.path.join(local_libs_dir, libname)
-            lib_main = os.path.join(lib_dir, "main.py")
-            lib_main = os.path.normpath(lib_main)
-            if not os.path.exists(lib_main):
-                raise Exception(f"Library '{libname}' not found at {lib_main}")
-            import importlib.util
-            spec = importlib.util.spec_from_file_location(f"nscript_libs.{libname}.main", lib_main)
-            if spec is None or spec.loader is None:
-                raise Exception(f"Could not load library '{libname}' from {lib_main}")
-            mod = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(mod)
-            setattr(mod, "__nscript_pythonlib__", libname)
+            mod = libraries.cache.get(libname)
             self.libraries[libname] = mod
             self.env[libname] = mod
             return
@@ -386,6 +642,7 @@ class Interpreter:
             self.classes[f"{os.path.basename(node.module_path).replace('.n','')}__{k}"] = v
 
     def visit_ImportOnly(self, node):
+        self.counters.imports += 1
         module_env, module_funcs, module_classes = self._load_module_env(node.module_path)
         if node.name in module_env:
             self.env[node.name] = module_env[node.name]
@@ -397,21 +654,10 @@ class Interpreter:
             raise Exception(f"'{node.name}' not found in module '{node.module_path}'")
 
     def visit_ImportAs(self, node):
+        self.counters.imports += 1
         if node.is_library:
             libname = node.module_path[len("LIBRARY "):].strip('"').strip("'")
-            local_libs_dir = os.path.join(os.environ.get("LOCALAPPDATA", ""), "nscript_libs")
-            lib_dir = os.path.join(local_libs_dir, libname)
-            lib_main = os.path.join(lib_dir, "main.py")
-            lib_main = os.path.normpath(lib_main)
-            if not os.path.exists(lib_main):
-                raise Exception(f"Library '{libname}' not found at {lib_main}")
-            import importlib.util
-            spec = importlib.util.spec_from_file_location(f"nscript_libs.{libname}.main", lib_main)
-            if spec is None or spec.loader is None:
-                raise Exception(f"Could not load library '{libname}' from {lib_main}")
-            mod = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(mod)
-            setattr(mod, "__nscript_pythonlib__", libname)
+            mod = libraries.cache.get(libname)
             alias = node.as_name if node.as_name else libname
             if node.only_name:
                 if not hasattr(mod, node.only_name):
@@ -421,13 +667,9 @@ class Interpreter:
                 self.libraries[alias] = mod
                 self.env[alias] = mod
             return
-        module_env, module_funcs, module_classes = self._load_module_env(node.module_path)
+        module = self._load_module(node.module_path)
+        module_env, module_funcs, module_classes = module.env, module.functions, module.classes
         alias = node.as_name if node.as_name else os.path.basename(node.module_path).replace('.n','')
-        class ModuleObj:
-            pass
-        mod_obj = ModuleObj()
-        for k, v in {**module_env, **module_funcs, **module_classes}.items():
-            setattr(mod_obj, k, v)
         if node.only_name:
             if node.only_name in module_env:
                 self.env[alias] = module_env[node.only_name]
@@ -438,63 +680,71 @@ class Interpreter:
             else:
                 raise Exception(f"'{node.only_name}' not found in module '{node.module_path}'")
         else:
-            self.env[alias] = mod_obj
+            self.env[alias] = module
 
-    def _load_module_env(self, module_path):
-        import sys, os
+    def _load_module(self, module_path):
         if not module_path.endswith('.n'):
             module_path += '.n'
-        main_file = sys.argv[1] if len(sys.argv) > 1 else __file__
-        base_dir = os.path.dirname(os.path.abspath(main_file))
-        abs_module_path = os.path.join(base_dir, module_path)
-        abs_module_path = os.path.normpath(abs_module_path)
-        if not os.path.exists(abs_module_path):
-            raise Exception(f"Module file '{abs_module_path}' not found")
-        with open(abs_module_path, 'r', encoding='utf-8') as f:
-            source = f.read()
-        lexer = Lexer(source)
-        parser = Parser(lexer)
-        tree = parser.parse()
-        module_interpreter = Interpreter()
-        module_interpreter.env = {}
-        module_interpreter.functions = {}
-        module_interpreter.classes = {}
+        base_dirs = []
+        for path in (self.file, self.main_file):
+            if path and os.path.dirname(path) not in base_dirs:
+                base_dirs.append(os.path.dirname(path))
+        if not base_dirs:
+            base_dirs.append(os.getcwd())
+        candidates = [os.path.normpath(os.path.join(base_dir, module_path)) for base_dir in base_dirs]
+        abs_module_path = next((path for path in candidates if os.path.exists(path)), None)
+        if abs_module_path is None:
+            raise Exception(f"Module file '{candidates[0]}' not found")
+        return modules.registry.load(abs_module_path, self._execute_module)
+
+    def _execute_module(self, module):
+        tree = cache.parse_file(module.path)
+        module_interpreter = type(self)()
+        module_interpreter.file = module.path
+        module_interpreter.main_file = self.main_file or self.file
+        module_interpreter.runtime_checks = self.runtime_checks
+        module_interpreter.counters = self.counters
+        self.counters.modules += 1
+        if self.counters.counting:
+            module_interpreter.count_nodes()
+        if self.quickening:
+            module_interpreter.quicken()
+        if self.profiler:
+            module_interpreter.profile(self.profiler)
+        if self.sampler:
+            module_interpreter.sample(self.sampler)
+        if self.tracer:
+            module_interpreter.trace(self.tracer)
+        module_interpreter.env = module.env
+        module_interpreter.functions = module.functions
+        module_interpreter.classes = module.classes
         module_interpreter.interpret(tree)
-        return dict(module_interpreter.env), dict(module_interpreter.functions), dict(module_interpreter.classes)
+
+    def _load_module_env(self, module_path):
+        module = self._load_module(module_path)
+        return module.env, module.functions, module.classes
 
     def visit_Str(self, node):
-        value = getattr(node, "value", None)
-        if getattr(node, "interpolated", False):
-            import re
-            def interpolate(match):
-                expr_code = match.group(1)
-                expr_lexer = Lexer(expr_code)
-                expr_parser = Parser(expr_lexer)
-                expr_ast = expr_parser.expr()
-                return str(self.visit(expr_ast))
-            return re.sub(r"\$\{([^}]+)\}", interpolate, str(value) if value is not None else "")
-        return value
+        return getattr(node, "value", None)
+
+    def visit_Template(self, node):
+        parts = node.parts
+        out = parts[:]
+        for i in range(1, len(parts), 2):
+            out[i] = str(self.visit(parts[i]))
+        return ''.join(out)
 
     def visit_Var(self, node):
-        if node.name in self.env:
-            value = self.env[node.name]
-            if hasattr(value, "__class__") and value.__class__.__name__ == "FuncDef" and getattr(value, "name", None) is None:
-                def anon_func(*args):
-                    old_env = self.env.copy()
-                    local_env = old_env.copy()
-                    for param, arg in zip(value.params, args):
-                        local_env[param] = arg
-                    self.env = local_env
-                    result = None
-                    try:
-                        for stmt in value.body:
-                            result = self.visit(stmt)
-                    except ReturnException as ret:
-                        self.env = old_env
-                        return ret.value
-                    self.env = old_env
-                    return result
-                return anon_func
+        ref = node.ref
+        if ref is not None and ref[0] == LOCAL:
+            value = self.frame[ref[1]]
+            if value is UNBOUND:
+                value = self.env.get(node.name, UNBOUND)
+        else:
+            value = self.lookup(node.name, ref)
+        if value is not UNBOUND:
+            if isinstance(value, (FuncDef, Closure)) and value.name is None:
+                return self.anon_function(value)
             return value
         elif node.name in self.functions:
             return self.functions[node.name]
@@ -502,10 +752,14 @@ class Interpreter:
             raise Exception(f"Variable '{node.name}' not defined")
 
     def visit_WhileLoop(self, node):
+        if node.hoisted:
+            self.reset_hoisted(node)
         result = None
         while self.visit(node.condition):
             for stmt in node.body:
                 result = self.visit(stmt)
+                if self.returning:
+                    return result
         return result
 
     def visit_ToString(self, node):
@@ -513,7 +767,9 @@ class Interpreter:
         return str(value)
 
     def visit_ToNumber(self, node):
-        value = self.visit(node.expr)
+        return self._to_number(self.visit(node.expr))
+
+    def _to_number(self, value):
         try:
             return int(value)
         except (ValueError, TypeError):
@@ -523,7 +779,9 @@ class Interpreter:
                 raise Exception(f"Cannot convert {value!r} to number")
 
     def visit_TypeOf(self, node):
-        value = self.visit(node.expr)
+        return self._type_of(self.visit(node.expr))
+
+    def _type_of(self, value):
         if isinstance(value, bool):
             return "bool"
         elif isinstance(value, int) or isinstance(value, float):
@@ -532,17 +790,22 @@ class Interpreter:
             return "string"
         elif isinstance(value, list):
             return "list"
+        elif isinstance(value, Instance):
+            return value.shape.name
         elif isinstance(value, dict):
-            if "__class__" in value and hasattr(value["__class__"], "name"):
-                return value["__class__"].name
             return "dictionary"
         elif value is None:
             return "none"
+        elif isinstance(value, types.ModuleType):
+            # Covers the LazyLibrary proxies GIVE LIBRARY binds before main.py has run.
+            return "module"
         else:
             return type(value).__name__
 
     def visit_Nom(self, node):
-        path = self.visit(node.path_expr)
+        return self._nom(self.visit(node.path_expr))
+
+    def _nom(self, path):
         try:
             with open(path, "r", encoding="utf-8") as f:
                 return f.read()
@@ -555,6 +818,8 @@ class Interpreter:
                 result = None
                 for stmt in body:
                     result = self.visit(stmt)
+                    if self.returning:
+                        break
                 return result
         return None
 
@@ -572,16 +837,43 @@ class Interpreter:
         else:
             raise Exception(f"Unknown comparison operator: {node.op}")
 
+    visit_GenericCompare = visit_Compare
+
+    def quicken_Compare(self, node):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        result = self._compare(node.op, left, right)
+        if node.__class__ is Compare:
+            self.specialized(quicken.specialize_compare(node, left, right))
+        return result
+
+    def _compare(self, op, left, right):
+        if op == 'IS':
+            return left == right
+        elif op == 'IS_NOT':
+            return left != right
+        elif op == 'IS_UNDER':
+            return left < right
+        elif op == 'IS_OVER':
+            return left > right
+        else:
+            raise Exception(f"Unknown comparison operator: {op}")
+
+    visit_QuickEqual = visit_QuickNotEqual = visit_QuickUnder = visit_QuickOver = _quick_operation
+
     def visit_FuncDef(self, node):
-        self.functions[node.name] = node
-        return node  # <-- Return the function object
+        func = make_function(node, self.frame, self.closure)
+        self.functions[node.name] = func
+        return func  # <-- Return the function object
 
     def visit_Input(self, node):
         prompt = self.visit(node.prompt_expr)
         return input(str(prompt))
 
     def visit_Gurt(self, node):
-        expr_str = self.visit(node.expr)
+        return self._gurt(self.visit(node.expr))
+
+    def _gurt(self, expr_str):
         try:
             allowed = "0123456789+-*/(). "
             if not all(c in allowed for c in str(expr_str)):
@@ -591,21 +883,27 @@ class Interpreter:
             raise Exception(f"GURT error: {e}")
 
     def visit_ForEachLoop(self, node):
+        if node.hoisted:
+            self.reset_hoisted(node)
         collection = self.visit(node.collection)
         result = None
         if isinstance(collection, dict):
             items = list(collection.items())
             for idx, (k, v) in enumerate(items):
-                self.env[node.index_var] = k
-                self.env[node.value_var] = v
+                self.store(node.index_var, node.index_ref, k)
+                self.store(node.value_var, node.value_ref, v)
                 for stmt in node.body:
                     result = self.visit(stmt)
+                    if self.returning:
+                        return result
         elif isinstance(collection, list):
             for idx, v in enumerate(collection):
-                self.env[node.index_var] = idx + 1
-                self.env[node.value_var] = v
+                self.store(node.index_var, node.index_ref, idx + 1)
+                self.store(node.value_var, node.value_ref, v)
                 for stmt in node.body:
                     result = self.visit(stmt)
+                    if self.returning:
+                        return result
         else:
             raise Exception("Can only SPIN over lists or dictionaries")
         return result
@@ -615,6 +913,8 @@ class Interpreter:
             return {self._to_python_value(k): self._to_python_value(v) for k, v in value.items()}
         elif isinstance(value, list):
             return [self._to_python_value(v) for v in value]
+        elif isinstance(value, Instance):
+            return value.copy(self._to_python_value)
         return value
 
 class ReturnException(Exception):
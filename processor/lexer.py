@@ -1,3 +1,6 @@
+import re
+from sys import intern
+
 NUMBER = 'NUMBER'
 FLOAT = 'FLOAT'
 DOUBLE = 'DOUBLE'
@@ -63,6 +66,8 @@ AS = 'AS'
 IN = 'IN'
 
 class Token:
+    __slots__ = ('type', 'value', 'line', 'pos')
+
     def __init__(self, type_, value, line=None, pos=None):
         self.type = type_
         self.value = value
@@ -72,282 +77,236 @@ class Token:
     def __repr__(self):
         return f'Token({self.type}, {repr(self.value)}, line={self.line}, pos={self.pos})'
 
+KEYWORDS = {
+    "IN": IN,
+    "EXTENDING": EXTENDING,
+    "WITH": WITH,
+    "SUPERMAN": SUPERMAN,
+    "KILL": KILL,
+    "SELF": SELF,
+    "GIVE": GIVE,
+    "ME": ME,
+    "BUT": BUT,
+    "ONLY": ONLY,
+    "AS": AS,
+    "NOT": NOT,
+    "ALSO": ALSO,
+    "MAYBE": MAYBE,
+    "SPIN": SPIN,
+    "IS": IS,
+    "true": TRUE,
+    "false": FALSE,
+    "YE": YE,
+    "BOOM": BOOM,
+    "WHAT": WHAT,
+    "WE": WE,
+    "POPPIN": POPPIN,
+    "POW": POW,
+    "RING": RING,
+    "FEED": FEED,
+    "RETURN": RETURN,
+    "return": RETURN,
+    "UNDER": UNDER,
+    "OVER": OVER,
+    "ANOTHER": ANOTHER,
+    "ISNOT": ISNOT,
+    "LEARNING": LEARNING,
+    "BUILD": BUILD,
+    "HUNGRY": HUNGRY,
+    "FOR": FOR,
+    "CONVERTED": CONVERTED,
+    "WAITING": WAITING,
+    "CONVERTSTRING": 'CONVERTSTRING',
+    "CONVERTNUMBER": 'CONVERTNUMBER',
+    "TYPEOF": 'TYPEOF',
+    "NOM": 'NOM',
+    "INPUT": 'INPUT',
+    "None": 'NONE',
+    "LIBRARY": LIBRARY,
+    "FELLA": FELLA,
+}
+
+KEYWORD_VALUES = {
+    "true": True,
+    "false": False,
+    "ISNOT": "IS NOT",
+}
+
+# Keywords that may be followed by a second word to form one token,
+# e.g. "TALL BOY" and "ANOTHER ONE".
+MULTI_WORD = {
+    "TALL": ("BOY", TALLBOY, "TALL BOY"),
+    "ANOTHER": ("ONE", ANOTHER_ONE, "ANOTHER ONE"),
+}
+
+PUNCTUATION = {
+    '+': PLUS,
+    '-': MINUS,
+    '*': MULTIPLY,
+    '/': DIVIDE,
+    '(': LPAREN,
+    ')': RPAREN,
+    '[': LBRACKET,
+    ']': RBRACKET,
+    '{': LBRACE,
+    '}': RBRACE,
+    ':': COLON,
+    '#': HASH,
+    '.': DOT,
+    '@': AT,
+    ',': ',',
+    '->': '->',
+}
+
+TOKEN_RE = re.compile(r'''
+    (?P<SPACE>\s+)
+  | (?P<COMMENT>//[^\n]*)
+  | (?P<NUMBER>\d+(?:\.\d*)?)
+  | (?P<WORD>[^\W\d_]\w*)
+  | (?P<STRING>"[^"]*")
+  | (?P<INTERP>`[^`]*`)
+  | (?P<PUNCT>->|[-+*/()\[\]{}:\#.@,])
+''', re.VERBOSE)
+
+SPACE_RE = re.compile(r'\s*')
+INTERPOLATION_RE = re.compile(r"\$\{([^}]+)\}")
+
 class Lexer:
     def __init__(self, text):
         self.text = text
         self.pos = 0
         self.line = 1
         self.col = 1
-        self.current_char = self.text[self.pos] if self.text else None
-
-    def advance(self):
-        if self.current_char == '\n':
-            self.line += 1
-            self.col = 1
-        else:
-            self.col += 1
-        self.pos += 1
-        if self.pos < len(self.text):
-            self.current_char = self.text[self.pos]
-        else:
-            self.current_char = None
+        self._mark = (1, 0)
+        self._stream = self.tokens()
 
-    def skip_whitespace(self):
-        while self.current_char is not None and self.current_char.isspace():
-            self.advance()
-
-    def number(self):
-        result = ''
-        decimal_seen = False
-        after_decimal = ''
-        while self.current_char is not None and (self.current_char.isdigit() or self.current_char == '.'):
-            if self.current_char == '.':
-                if decimal_seen:
-                    break
-                decimal_seen = True
-                result += self.current_char
-                self.advance()
-                continue
-            if decimal_seen:
-                after_decimal += self.current_char
-            result += self.current_char
-            self.advance()
-        if not decimal_seen:
-            return Token(NUMBER, int(result), self.line, self.col)
-        elif len(after_decimal) == 1:
-            return Token(FLOAT, float(result), self.line, self.col)
-        else:
-            return Token(DOUBLE, float(result), self.line, self.col)
-
-    def string(self):
-        result = ''
-        self.advance()
-        while self.current_char is not None and self.current_char != '"':
-            result += self.current_char
-            self.advance()
-        if self.current_char != '"':
-            raise Exception("Unterminated string literal")
-        self.advance()
-        return Token(STRING, result, self.line, self.col)
+    def __iter__(self):
+        return self.tokens()
 
     def get_next_token(self):
-        while self.current_char is not None:
-            if self.current_char.isspace():
-                self.skip_whitespace()
-                continue
-            if self.current_char.isdigit():
-                return self.number()
-            if self.current_char == '+':
-                self.advance()
-                return Token(PLUS, '+', self.line, self.col)
-            if self.current_char == '-':
-                next_pos = self.pos + 1
-                if next_pos < len(self.text) and self.text[next_pos] == '>':
-                    self.advance()
-                    self.advance()
-                    return Token('->', '->', self.line, self.col)
-                else:
-                    self.advance()
-                    return Token(MINUS, '-', self.line, self.col)
-            if self.current_char == '*':
-                self.advance()
-                return Token(MULTIPLY, '*', self.line, self.col)
-            if self.current_char == '/':
-                next_pos = self.pos + 1
-                if next_pos < len(self.text) and self.text[next_pos] == '/':
-                    self.advance()
-                    self.advance()
-                    while self.current_char is not None and self.current_char != '\n':
-                        self.advance()
+        token = next(self._stream, None)
+        if token is None:
+            return Token(EOF, None, self.line, self.col)
+        return token
+
+    def tokens(self):
+        """Yield tokens lazily in a single left-to-right pass, ending with EOF."""
+        text = self.text
+        length = len(text)
+        match = TOKEN_RE.match
+        pos = self.pos
+        line = self.line
+        line_start = pos - self.col + 1
+        while pos < length:
+            m = match(text, pos)
+            if m is None:
+                raise invalid(text[pos])
+            kind = m.lastgroup
+            start = pos
+            pos = m.end()
+            if kind == 'SPACE' or kind == 'STRING' or kind == 'INTERP':
+                newlines = text.count('\n', start, pos)
+                if newlines:
+                    line += newlines
+                    line_start = text.rindex('\n', start, pos) + 1
+                if kind == 'SPACE':
                     continue
+                token_type = STRING if kind == 'STRING' else INTERP_STRING
+                yield Token(token_type, text[start + 1:pos - 1], line, pos - line_start + 1)
+            elif kind == 'WORD':
+                word = m.group()
+                follow = MULTI_WORD.get(word)
+                if follow is not None:
+                    second, token_type, value = follow
+                    after = SPACE_RE.match(text, pos).end()
+                    if text.startswith(second, after):
+                        newlines = text.count('\n', pos, after)
+                        if newlines:
+                            line += newlines
+                            line_start = text.rindex('\n', pos, after) + 1
+                        pos = after + len(second)
+                        yield Token(token_type, value, line, pos - line_start + 1)
+                        continue
+                token_type = KEYWORDS.get(word)
+                if token_type is None:
+                    # Interned, so every occurrence of a name is one string: the tree keeps a
+                    # single copy, and env, function, class and field lookups by that name
+                    # match on identity.
+                    yield Token(ID, intern(word), line, pos - line_start + 1)
                 else:
-                    self.advance()
-                    return Token(DIVIDE, '/', self.line, self.col)
-            if self.current_char == '(':
-                self.advance()
-                return Token(LPAREN, '(', self.line, self.col)
-            if self.current_char == ')':
-                self.advance()
-                return Token(RPAREN, ')', self.line, self.col)
-            if self.current_char == '"':
-                return self.string()
-            if self.text[self.pos:].startswith("FELLA"):
-                end = self.pos + 5
-                if end == len(self.text) or not self.text[end].isalnum():
-                    self.pos += 5
-                    self.current_char = self.text[self.pos] if self.pos < len(self.text) else None
-                    return Token(FELLA, "FELLA", self.line, self.col)
-            if self.current_char == '[':
-                self.advance()
-                return Token(LBRACKET, '[', self.line, self.col)
-            if self.current_char == ']':
-                self.advance()
-                return Token(RBRACKET, ']', self.line, self.col)
-            if self.current_char == '{':
-                self.advance()
-                return Token(LBRACE, '{', self.line, self.col)
-            if self.current_char == '}':
-                self.advance()
-                return Token(RBRACE, '}', self.line, self.col)
-            if self.current_char == ':':
-                self.advance()
-                return Token(COLON, ':', self.line, self.col)
-            if self.current_char == '/':
-                self.advance()
-                return Token('/', '/', self.line, self.col)
-            if self.current_char == '#':
-                self.advance()
-                return Token(HASH, '#', self.line, self.col)
-            if self.current_char == '.':
-                self.advance()
-                return Token(DOT, '.', self.line, self.col)
-            if self.current_char.isalpha():
-                ident = self._id()
-                if ident == "IN":
-                    return Token(IN, ident, self.line, self.col)
-                elif ident == "EXTENDING":
-                    return Token(EXTENDING, ident, self.line, self.col)
-                elif ident == "WITH":
-                    return Token(WITH, ident, self.line, self.col)
-                elif ident == "SUPERMAN":
-                    return Token(SUPERMAN, ident, self.line, self.col)
-                elif ident == "KILL":
-                    return Token(KILL, ident, self.line, self.col)
-                elif ident == "SELF":
-                    return Token(SELF, ident, self.line, self.col)
-                elif ident == "GIVE":
-                    return Token(GIVE, ident, self.line, self.col)
-                elif ident == "ME":
-                    return Token(ME, ident, self.line, self.col)
-                elif ident == "BUT":
-                    return Token(BUT, ident, self.line, self.col)
-                elif ident == "ONLY":
-                    return Token(ONLY, ident, self.line, self.col)
-                elif ident == "NOT":
-                    return Token(NOT, ident, self.line, self.col)
-                elif ident == "ALSO":
-                    return Token(ALSO, ident, self.line, self.col)
-                elif ident == "MAYBE":
-                    return Token(MAYBE, ident, self.line, self.col)
-                elif ident == "TALL":
-                    save_pos = self.pos
-                    self.skip_whitespace()
-                    lookahead = self.text[self.pos:self.pos+3]
-                    if lookahead == "BOY":
-                        self.pos += 3
-                        self.current_char = self.text[self.pos] if self.pos < len(self.text) else None
-                        return Token(TALLBOY, "TALL BOY", self.line, self.col)
-                    else:
-                        self.pos = save_pos
-                        self.current_char = self.text[self.pos] if self.pos < len(self.text) else None
-                elif ident == "SPIN":
-                    return Token(SPIN, ident, self.line, self.col)
-                elif ident == "IS":
-                    return Token(IS, ident, self.line, self.col)
-                elif ident == "true":
-                    return Token(TRUE, True, self.line, self.col)
-                elif ident == "false":
-                    return Token(FALSE, False, self.line, self.col)
-                elif ident == "YE":
-                    return Token('YE', ident, self.line, self.col)
-                elif ident == "BOOM":
-                    return Token('BOOM', ident, self.line, self.col)
-                elif ident == "WHAT":
-                    return Token('WHAT', ident, self.line, self.col)
-                elif ident == "WE":
-                    return Token('WE', ident, self.line, self.col)
-                elif ident == "POPPIN":
-                    return Token(POPPIN, ident, self.line, self.col)
-                elif ident == "POW":
-                    return Token('POW', ident, self.line, self.col)
-                elif ident == "RING":
-                    return Token(RING, ident, self.line, self.col)
-                elif ident == "FEED":
-                    return Token(FEED, ident, self.line, self.col)
-                elif ident == "RETURN" or ident == "return":
-                    return Token(RETURN, ident, self.line, self.col)
-                elif ident == "UNDER":
-                    return Token('UNDER', ident, self.line, self.col)
-                elif ident == "OVER":
-                    return Token('OVER', ident, self.line, self.col)
-                elif ident == "ANOTHER":
-                    save_pos = self.pos
-                    save_char = self.current_char
-                    self.skip_whitespace()
-                    lookahead = self.text[self.pos:self.pos+3]
-                    if lookahead == "ONE":
-                        self.pos += 3
-                        self.current_char = self.text[self.pos] if self.pos < len(self.text) else None
-                        return Token('ANOTHER_ONE', "ANOTHER ONE", self.line, self.col)
-                    else:
-                        self.pos = save_pos
-                        self.current_char = save_char
-                        return Token('ANOTHER', ident, self.line, self.col)
-                elif ident == "IS":
-                    save_pos = self.pos
-                    self.skip_whitespace()
-                    lookahead = self.text[self.pos:self.pos+3]
-                    if lookahead == "NOT":
-                        self.pos += 3
-                        self.current_char = self.text[self.pos] if self.pos < len(self.text) else None
-                        return Token(ISNOT, "IS NOT", self.line, self.col)
-                    else:
-                        self.pos = save_pos
-                        self.current_char = self.text[self.pos] if self.pos < len(self.text) else None
-                        return Token('IS', ident, self.line, self.col)
-                elif ident == "ISNOT":
-                    return Token(ISNOT, "IS NOT", self.line, self.col)
-                elif ident == "LEARNING":
-                    return Token(LEARNING, ident, self.line, self.col)
-                elif ident == "BUILD":
-                    return Token(BUILD, ident, self.line, self.col)
-                elif ident == "HUNGRY":
-                    return Token(HUNGRY, ident, self.line, self.col)
-                elif ident == "FOR":
-                    return Token(FOR, ident, self.line, self.col)
-                elif ident == "CONVERTED":
-                    return Token(CONVERTED, ident, self.line, self.col)
-                elif ident == "WAITING":
-                    return Token(WAITING, ident, self.line, self.col)
-                elif ident == "CONVERTSTRING":
-                    return Token('CONVERTSTRING', ident, self.line, self.col)
-                elif ident == "CONVERTNUMBER":
-                    return Token('CONVERTNUMBER', ident, self.line, self.col)
-                elif ident == "TYPEOF":
-                    return Token('TYPEOF', ident, self.line, self.col)
-                elif ident == "NOM":
-                    return Token('NOM', ident, self.line, self.col)
-                elif ident == "INPUT":
-                    return Token('INPUT', ident, self.line, self.col)
-                elif ident == "None":
-                    return Token('NONE', ident, self.line, self.col)
-                elif ident == "LIBRARY":
-                    return Token(LIBRARY, ident, self.line, self.col)
+                    yield Token(token_type, KEYWORD_VALUES.get(word, word), line, pos - line_start + 1)
+            elif kind == 'NUMBER':
+                number = m.group()
+                dot = number.find('.')
+                if dot < 0:
+                    yield Token(NUMBER, int(number), line, pos - line_start + 1)
+                elif len(number) - dot == 2:
+                    yield Token(FLOAT, float(number), line, pos - line_start + 1)
                 else:
-                    return Token('ID', ident, self.line, self.col)
-            if self.current_char == '@':
-                self.advance()
-                return Token(AT, '@', self.line, self.col)
-            if self.current_char == ',':
-                self.advance()
-                return Token(',', ',', self.line, self.col)
-            if self.current_char == '`':
-                result = ''
-                self.advance()
-                while self.current_char is not None and self.current_char != '`':
-                    result += self.current_char
-                    self.advance()
-                if self.current_char != '`':
-                    raise Exception("Unterminated interpolated string")
-                self.advance()
-                return Token(INTERP_STRING, result, self.line, self.col)
-            raise Exception(f'Invalid character: {self.current_char}')
-        return Token('EOF', None, self.line, self.col)
+                    yield Token(DOUBLE, float(number), line, pos - line_start + 1)
+            elif kind == 'PUNCT':
+                char = m.group()
+                yield Token(PUNCTUATION[char], char, line, pos - line_start + 1)
+        self.pos = pos
+        self.line = line
+        self.col = pos - line_start + 1
+        yield Token(EOF, None, self.line, self.col)
+
+    def offset(self, line, col):
+        """Return the index in text of column `col` of line `line`."""
+        mark_line, index = self._mark
+        if mark_line > line:
+            mark_line, index = 1, 0
+        text = self.text
+        while mark_line < line:
+            index = text.index('\n', index) + 1
+            mark_line += 1
+        self._mark = (line, index)
+        return index + col - 1
+
+    def skip_block(self, line, col):
+        """Move past a block body without making tokens for it.
+
+        The body starts at column `col` of line `line`, just after its WE,
+        and ends at the POW that closes it, counting the WE/POW pairs of
+        the blocks nested inside. Lexing resumes after that POW. Returns
+        (start, imports): the body's index in text and whether it contains
+        a GIVE.
+        """
+        text = self.text
+        length = len(text)
+        match = TOKEN_RE.match
+        start = pos = self.offset(line, col)
+        depth = 1
+        imports = False
+        while pos < length:
+            m = match(text, pos)
+            if m is None:
+                raise invalid(text[pos])
+            pos = m.end()
+            if m.lastgroup == 'WORD':
+                word = m.group()
+                if word == 'WE':
+                    depth += 1
+                elif word == 'POW':
+                    depth -= 1
+                    if not depth:
+                        break
+                elif word == 'GIVE':
+                    imports = True
+        else:
+            raise Exception(f"Expected POW to end the block opened at line {line}, found end of file")
+        line_start = text.rfind('\n', 0, pos) + 1
+        self.line = line + text.count('\n', start, pos)
+        self.pos = pos
+        self.col = pos - line_start + 1
+        self._mark = (self.line, line_start)
+        self._stream = self.tokens()
+        return start, imports
 
-    def _id(self):
-        """Handle identifiers and keywords."""
-        result = ''
-        while self.current_char is not None and (self.current_char.isalnum() or self.current_char == '_'):
-            result += self.current_char
-            self.advance()
-        return result
\ No newline at end of file
+def invalid(char):
+    if char == '"':
+        return Exception("Unterminated string literal")
+    if char == '`':
+        return Exception("Unterminated interpolated string")
+    return Exception(f'Invalid character: {char}')
@@ -0,0 +1,103 @@
+import os
+import types
+import importlib.util
+
+class LibraryIndex:
+    """Installed Python libraries, found by scanning nscript_libs once.
+
+    Every folder below the libs directory that holds a main.py is a library,
+    named by its path relative to that directory ("math", "defaultlibs/http").
+    """
+
+    def __init__(self, libs_dir):
+        self.libs_dir = libs_dir
+        self.entries = None
+
+    def scan(self):
+        entries = {}
+        for root, dirs, files in os.walk(self.libs_dir):
+            dirs[:] = [d for d in dirs if not d.startswith(('.', '__'))]
+            if "main.py" in files:
+                name = os.path.relpath(root, self.libs_dir).replace(os.sep, "/")
+                if name != ".":
+                    entries[name] = os.path.normpath(os.path.join(root, "main.py"))
+        self.entries = entries
+
+    def find(self, libname):
+        if self.entries is None:
+            self.scan()
+        key = os.path.normpath(libname).replace(os.sep, "/")
+        return self.entries.get(key)
+
+class LazyLibrary(types.ModuleType):
+    """Stands in for a library module and only executes main.py on first attribute access."""
+
+    def __init__(self, libname, path, cache):
+        super().__init__(f"nscript_libs.{libname}.main")
+        self.__nscript_pythonlib__ = libname
+        self.__nscript_libpath__ = path
+        self.__nscript_libcache__ = cache
+        self.__nscript_module__ = None
+
+    def __nscript_load__(self):
+        module = self.__nscript_module__
+        if module is None:
+            module = self.__nscript_libcache__.module(self.__nscript_pythonlib__, self.__nscript_libpath__)
+            self.__nscript_module__ = module
+        return module
+
+    def __getattr__(self, attr):
+        if attr.startswith("__nscript_"):
+            raise AttributeError(attr)
+        return getattr(self.__nscript_load__(), attr)
+
+    def __dir__(self):
+        return dir(self.__nscript_load__())
+
+class LibraryCache:
+    """Process-wide cache of GIVE LIBRARY modules, keyed by their main.py path."""
+
+    def __init__(self, libs_dir=None):
+        self.libs_dir = libs_dir
+        self.index = None
+        self.proxies = {}
+        self.modules = {}
+
+    def get_index(self):
+        if self.index is None:
+            libs_dir = self.libs_dir or os.path.join(os.environ.get("LOCALAPPDATA", ""), "nscript_libs")
+            self.index = LibraryIndex(libs_dir)
+        return self.index
+
+    def get(self, libname):
+        """Return a lazy proxy for libname without running its main.py."""
+        index = self.get_index()
+        path = index.find(libname)
+        if path is None:
+            lib_main = os.path.normpath(os.path.join(index.libs_dir, libname, "main.py"))
+            raise Exception(f"Library '{libname}' not found at {lib_main}")
+        proxy = self.proxies.get(path)
+        if proxy is None:
+            proxy = LazyLibrary(libname, path, self)
+            self.proxies[path] = proxy
+        return proxy
+
+    def module(self, libname, path):
+        module = self.modules.get(path)
+        if module is not None:
+            return module
+        spec = importlib.util.spec_from_file_location(f"nscript_libs.{libname}.main", path)
+        if spec is None or spec.loader is None:
+            raise Exception(f"Could not load library '{libname}' from {path}")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        setattr(module, "__nscript_pythonlib__", libname)
+        self.modules[path] = module
+        return module
+
+    def clear(self):
+        self.index = None
+        self.proxies.clear()
+        self.modules.clear()
+
+cache = LibraryCache()
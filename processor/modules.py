@@ -0,0 +1,64 @@
+import os
+
+class Module:
+    """A GIVE ME module that has been executed once and is shared by every importer."""
+
+    def __init__(self, path, mtime):
+        self.path = path
+        self.mtime = mtime
+        self.env = {}
+        self.functions = {}
+        self.classes = {}
+        self.loading = True
+
+    def get(self, name):
+        if name in self.env:
+            return self.env[name]
+        if name in self.functions:
+            return self.functions[name]
+        if name in self.classes:
+            return self.classes[name]
+        raise Exception(f"'{name}' not found in module '{os.path.basename(self.path)}'")
+
+class ModuleRegistry:
+    """Executed modules keyed by absolute path.
+
+    A module runs once per process and is re-run only when its file's
+    modification time changes. Importing a module that is still executing
+    is an import cycle and raises instead of recursing.
+    """
+
+    def __init__(self):
+        self.modules = {}
+        self.loading = []
+
+    def load(self, path, execute):
+        path = os.path.normcase(os.path.realpath(path))
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            raise Exception(f"Module file '{path}' not found")
+        module = self.modules.get(path)
+        if module is not None:
+            if module.loading:
+                cycle = self.loading[self.loading.index(path):] + [path]
+                raise Exception(f"Import cycle detected: {' -> '.join(os.path.basename(p) for p in cycle)}")
+            if module.mtime == mtime:
+                return module
+        module = Module(path, mtime)
+        self.modules[path] = module
+        self.loading.append(path)
+        try:
+            execute(module)
+        except BaseException:
+            del self.modules[path]
+            raise
+        finally:
+            self.loading.pop()
+        module.loading = False
+        return module
+
+    def clear(self):
+        self.modules.clear()
+
+registry = ModuleRegistry()
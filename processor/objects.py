@@ -0,0 +1,118 @@
+class Missing:
+    def __repr__(self):
+        return "<missing>"
+
+MISSING = Missing()
+
+class Shape:
+    """Field layout and method table shared by every instance of a class.
+
+    Fields get a fixed slot in the order the class's methods assign them
+    through `ts`, after the slots inherited from the base class. A field
+    first assigned anywhere else is appended to the layout when it is set.
+    """
+
+    def __init__(self, class_def, base=None):
+        self.class_def = class_def
+        self.name = class_def.name
+        self.key = class_def.name.lower()
+        self.base = base
+        self.fields = list(base.fields) if base else []
+        self.slots = dict(base.slots) if base else {}
+        self.methods = dict(base.methods) if base else {}
+        self.methods.update(class_def.methods)
+        self.constructor = self.methods.get('constructor')
+        self.version = 0
+        for method in class_def.methods.values():
+            for name in assigned_fields(method.body):
+                self.slot(name)
+
+    def slot(self, name):
+        index = self.slots.get(name)
+        if index is None:
+            index = len(self.fields)
+            self.fields.append(name)
+            self.slots[name] = index
+            self.version += 1
+        return index
+
+class Instance:
+    """An object built from a LEARNING class: a shape plus one value per field slot."""
+
+    __slots__ = ('shape', 'values')
+
+    def __init__(self, shape, values=None):
+        self.shape = shape
+        self.values = values if values is not None else [MISSING] * len(shape.fields)
+
+    def get(self, name):
+        index = self.shape.slots.get(name)
+        if index is None or index >= len(self.values):
+            return MISSING
+        return self.values[index]
+
+    def set(self, name, value):
+        index = self.shape.slot(name)
+        values = self.values
+        if index >= len(values):
+            values.extend([MISSING] * (index + 1 - len(values)))
+        values[index] = value
+
+    def fields(self):
+        return {name: value for name, value in zip(self.shape.fields, self.values) if value is not MISSING}
+
+    def copy(self, convert):
+        return Instance(self.shape, [value if value is MISSING else convert(value) for value in self.values])
+
+    def __eq__(self, other):
+        if not isinstance(other, Instance):
+            return NotImplemented
+        return self.shape.class_def is other.shape.class_def and self.fields() == other.fields()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"<{self.shape.name} {self.fields()!r}>"
+
+class AttributeSite:
+    """Inline cache for one `obj.attr` in the program.
+
+    Remembers how `attr` resolved for the last instance shape or library
+    seen there: the field slot and class method for a shape, or the loaded
+    module for a library. A shape that has gained fields since is
+    resolved again.
+    """
+
+    __slots__ = ('attr', 'shape', 'version', 'slot', 'method', 'library', 'target')
+
+    def __init__(self, attr):
+        self.attr = attr
+        self.shape = None
+        self.version = -1
+        self.slot = None
+        self.method = None
+        self.library = None
+        self.target = None
+
+    def fill(self, shape):
+        self.shape = shape
+        self.version = shape.version
+        self.slot = shape.slots.get(self.attr)
+        self.method = shape.methods.get(self.attr)
+
+    def __repr__(self):
+        return f"<site {self.attr}>"
+
+def assigned_fields(statements):
+    """Yield the attribute names assigned on `ts` in statements, in source order."""
+    for node in statements:
+        kind = type(node).__name__
+        if kind == 'VarAssign':
+            target = node.name
+            if type(target).__name__ == 'AttributeAccess' and getattr(target.obj, 'name', None) == 'ts':
+                yield target.attr
+        elif kind in ('ForLoop', 'ForEachLoop', 'WhileLoop'):
+            yield from assigned_fields(node.body)
+        elif kind == 'If':
+            for _, body in node.branches:
+                yield from assigned_fields(body)
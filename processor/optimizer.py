@@ -0,0 +1,501 @@
+from sys import intern
+from processor.lexer import Token, NUMBER, FLOAT, STRING
+from processor.ast import AST, Num, Str, Bool, BinOp, FeedOp, Template, Hoisted, fields
+
+CONSTANTS = ('Num', 'Str', 'Bool')
+
+# Expressions that only compute a value from their operands.
+PURE = {'Num', 'Str', 'Bool', 'Var', 'Hoisted', 'BinOp', 'Compare', 'LogicalOp', 'FeedOp', 'Template',
+        'ToString', 'ToNumber', 'TypeOf', 'Len', 'TallBoy'}
+
+# Pure expressions whose result is always a number, string, bool or None.
+VALUE_RESULTS = {'Num', 'Str', 'Bool', 'Compare', 'LogicalOp', 'FeedOp', 'Template', 'ToString', 'ToNumber',
+                 'TypeOf', 'Len', 'TallBoy', 'Input', 'Nom', 'Gurt'}
+
+CALLS = {'FuncCall', 'ClassInstance', 'SuperCall'}
+IMPORTS = {'Import', 'ImportOnly', 'ImportAs'}
+
+# Longest string literal folding may produce, so `"ab" * 100000` stays a runtime operation.
+MAX_FOLDED_STRING = 1000
+
+BINARY = {
+    '+': lambda a, b: a + b,
+    '-': lambda a, b: a - b,
+    '*': lambda a, b: a * b,
+    '/': lambda a, b: a / b,
+}
+
+COMPARE = {
+    'IS': lambda a, b: a == b,
+    'IS_NOT': lambda a, b: a != b,
+    'IS_UNDER': lambda a, b: a < b,
+    'IS_OVER': lambda a, b: a > b,
+}
+
+def feed(a, b):
+    return str(a) + str(b)
+
+def is_node(value):
+    return isinstance(value, AST)
+
+def is_constant(node):
+    return type(node).__name__ in CONSTANTS
+
+def constant(value):
+    if isinstance(value, bool):
+        return Bool(value)
+    if isinstance(value, (int, float)):
+        return Num(Token(FLOAT if isinstance(value, float) else NUMBER, value))
+    if isinstance(value, str) and len(value) <= MAX_FOLDED_STRING:
+        return Str(Token(STRING, value))
+    return None
+
+def folded_length(op, a, b):
+    """Length of the string `a op b` would produce, or 0 when the result is not a string."""
+    if op == 'FEED':
+        return len(str(a)) + len(str(b))
+    if op == '+' and isinstance(a, str) and isinstance(b, str):
+        return len(a) + len(b)
+    if op == '*' and isinstance(a, str) and isinstance(b, int):
+        return len(a) * b
+    if op == '*' and isinstance(b, str) and isinstance(a, int):
+        return len(b) * a
+    return 0
+
+def fold(compute, *values, op=None):
+    # Check the size first so a huge repeat is never built just to be thrown away.
+    if op is not None and folded_length(op, *values) > MAX_FOLDED_STRING:
+        return None
+    try:
+        return constant(compute(*values))
+    except Exception:
+        return None
+
+class LoopBody:
+    """Names a loop assigns and whether it calls anything, which decide what can leave it."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.assigned = set()
+        self.calls = False
+        self.imports = False
+        kind = type(loop).__name__
+        if kind == 'ForLoop':
+            self.assigned.add(loop.var)
+        elif kind == 'ForEachLoop':
+            self.assigned.update((loop.index_var, loop.value_var))
+        else:
+            self.scan(loop.condition)
+        self.scan(loop.body)
+
+    def scan(self, value):
+        if isinstance(value, (list, tuple)):
+            for item in value:
+                self.scan(item)
+            return
+        if not is_node(value):
+            return
+        kind = type(value).__name__
+        if kind == 'VarAssign' and isinstance(value.name, str):
+            self.assigned.add(value.name)
+        elif kind == 'ForLoop':
+            self.assigned.add(value.var)
+        elif kind == 'ForEachLoop':
+            self.assigned.update((value.index_var, value.value_var))
+        elif kind == 'FuncDef':
+            if value.name:
+                self.assigned.add(value.name)
+            return
+        elif kind == 'ClassDef':
+            return
+        elif kind in CALLS:
+            self.calls = True
+        elif kind in IMPORTS:
+            self.imports = True
+        for name, item in fields(value):
+            if name != 'hoisted':
+                self.scan(item)
+
+class NameScope:
+    """Assignments of one function body, or of the file's top level."""
+
+    def __init__(self, body, params=(), parent=None):
+        self.parent = parent
+        self.assignments = []
+        self.names = set(params)
+        self.has_imports = False
+        self.scan(body, True)
+        self.value_names = self.value_typed(set(params))
+
+    def scan(self, value, direct):
+        if isinstance(value, (list, tuple)):
+            for item in value:
+                self.scan(item, direct)
+            return
+        if not is_node(value):
+            return
+        kind = type(value).__name__
+        if kind == 'FuncDef' or kind == 'ClassDef':
+            if direct and kind == 'FuncDef' and value.name:
+                self.assignments.append((value.name, None))
+            for func_def in [value] if kind == 'FuncDef' else value.methods.values():
+                if func_def.lazy is None:
+                    self.scan(func_def.body, False)
+                elif func_def.lazy.imports:
+                    self.has_imports = True
+            return
+        if kind in IMPORTS and not direct:
+            self.has_imports = True
+        if direct:
+            if kind == 'VarAssign' and isinstance(value.name, str):
+                self.assignments.append((value.name, value.value))
+            elif kind == 'ForLoop':
+                self.assignments.append((value.var, Num(Token(NUMBER, 0))))
+            elif kind == 'ForEachLoop':
+                self.assignments.append((value.index_var, None))
+                self.assignments.append((value.value_var, None))
+        for _, item in fields(value):
+            self.scan(item, direct)
+
+    def value_typed(self, excluded):
+        """Names that only ever hold numbers, strings, bools or None in this scope."""
+        names = {name for name, _ in self.assignments} - excluded
+        self.names |= names
+        changed = True
+        while changed:
+            changed = False
+            for name, value in self.assignments:
+                if name in names and not self.value_expression(value, names):
+                    names.discard(name)
+                    changed = True
+        if self.parent is not None:
+            outer = self.parent
+            names = {name for name in names if name in outer.value_names or name not in outer.names}
+        return names
+
+    def value_expression(self, node, names):
+        if node is None:
+            return False
+        kind = type(node).__name__
+        if kind in VALUE_RESULTS:
+            return True
+        if kind == 'Var':
+            return node.name in names
+        if kind == 'BinOp':
+            return self.value_expression(node.left, names) and self.value_expression(node.right, names)
+        return False
+
+class Optimizer:
+    """Rewrites a parsed program into an equivalent, cheaper one before it runs.
+
+    Folds operations on literals, drops `WHAT` branches whose condition is
+    a literal, merges adjacent literal pieces of FEED and `+` chains, and
+    moves loop-invariant pure expressions out of SPIN and WHILE loops. A
+    moved expression becomes a Hoisted node: it is still evaluated where
+    it was written, but only the first time the loop reaches it on each
+    entry, so errors and evaluation order do not change.
+    """
+
+    def __init__(self):
+        self.scope = None
+        self.file_scope = None
+        self.count = 0
+        self.owners = {}
+
+    def optimize(self, tree):
+        self.scope = self.file_scope = NameScope(tree.statements)
+        tree.statements = self.block(tree.statements)
+        return tree
+
+    def block(self, statements):
+        return [self.visit(stmt) for stmt in statements]
+
+    def visit(self, node):
+        if node is None:
+            return None
+        method = getattr(self, f'visit_{type(node).__name__}', None)
+        if method is None:
+            return node
+        return method(node)
+
+    def visit_Program(self, node):
+        node.statements = self.block(node.statements)
+        return node
+
+    def visit_BinOp(self, node):
+        node.left = left = self.visit(node.left)
+        node.right = right = self.visit(node.right)
+        op = getattr(node.op, "value", None)
+        if op in BINARY and is_constant(left) and is_constant(right):
+            folded = fold(BINARY[op], left.value, right.value, op=op)
+            if folded is not None:
+                return folded
+        if op == '+' and type(right).__name__ == 'Str' and type(left).__name__ == 'BinOp':
+            inner = left.right
+            if getattr(left.op, "value", None) == '+' and type(inner).__name__ == 'Str':
+                merged = fold(BINARY['+'], inner.value, right.value, op='+')
+                if merged is not None:
+                    return BinOp(left.left, left.op, merged)
+        return node
+
+    def visit_Compare(self, node):
+        node.left = left = self.visit(node.left)
+        node.right = right = self.visit(node.right)
+        if node.op in COMPARE and is_constant(left) and is_constant(right):
+            return fold(COMPARE[node.op], left.value, right.value) or node
+        return node
+
+    def visit_LogicalOp(self, node):
+        node.left = left = self.visit(node.left)
+        if node.op == 'NOT':
+            return Bool(not left.value) if is_constant(left) else node
+        node.right = right = self.visit(node.right)
+        if is_constant(left) and is_constant(right):
+            if node.op == 'ALSO':
+                return Bool(bool(left.value) and bool(right.value))
+            if node.op == 'MAYBE':
+                return Bool(bool(left.value) or bool(right.value))
+        return node
+
+    def visit_FeedOp(self, node):
+        node.left = left = self.visit(node.left)
+        node.right = right = self.visit(node.right)
+        if is_constant(left) and is_constant(right):
+            return fold(feed, left.value, right.value, op='FEED') or node
+        if is_constant(right):
+            if type(left).__name__ == 'FeedOp' and is_constant(left.right):
+                merged = fold(feed, left.right.value, right.value, op='FEED')
+                if merged is not None:
+                    return FeedOp(left.left, merged)
+            if type(left).__name__ == 'Template':
+                parts = list(left.parts)
+                parts[-1] += str(right.value)
+                return Template(left.value, parts)
+        if is_constant(left):
+            if type(right).__name__ == 'FeedOp' and is_constant(right.left):
+                merged = fold(feed, left.value, right.left.value, op='FEED')
+                if merged is not None:
+                    return FeedOp(merged, right.right)
+            if type(right).__name__ == 'Template':
+                parts = list(right.parts)
+                parts[0] = str(left.value) + parts[0]
+                return Template(right.value, parts)
+        return node
+
+    def visit_Template(self, node):
+        parts = [node.parts[0]]
+        for i in range(1, len(node.parts), 2):
+            expr = self.visit(node.parts[i])
+            if is_constant(expr):
+                parts[-1] += str(expr.value)
+                parts[-1] += node.parts[i + 1]
+            else:
+                parts.append(expr)
+                parts.append(node.parts[i + 1])
+        if len(parts) == 1:
+            return constant(parts[0]) or Template(node.value, parts)
+        node.parts = parts
+        return node
+
+    def visit_ToString(self, node):
+        node.expr = self.visit(node.expr)
+        if is_constant(node.expr):
+            return fold(str, node.expr.value) or node
+        return node
+
+    def visit_TallBoy(self, node):
+        node.value = self.visit(node.value)
+        if type(node.value).__name__ == 'Str':
+            return constant(len(node.value.value))
+        return node
+
+    def visit_Len(self, node):
+        node.value = self.visit(node.value)
+        return node
+
+    def visit_ToNumber(self, node):
+        node.expr = self.visit(node.expr)
+        return node
+
+    def visit_TypeOf(self, node):
+        node.expr = self.visit(node.expr)
+        return node
+
+    def visit_Nom(self, node):
+        node.path_expr = self.visit(node.path_expr)
+        return node
+
+    def visit_Input(self, node):
+        node.prompt_expr = self.visit(node.prompt_expr)
+        return node
+
+    def visit_Gurt(self, node):
+        node.expr = self.visit(node.expr)
+        return node
+
+    def visit_Print(self, node):
+        node.value = self.visit(node.value)
+        return node
+
+    def visit_Return(self, node):
+        node.value = self.visit(node.value)
+        return node
+
+    def visit_ListLiteral(self, node):
+        node.elements = [self.visit(element) for element in node.elements]
+        return node
+
+    def visit_DictLiteral(self, node):
+        node.pairs = [(self.visit(key), self.visit(value)) for key, value in node.pairs]
+        return node
+
+    def visit_Subscript(self, node):
+        node.value = self.visit(node.value)
+        node.index = self.visit(node.index)
+        return node
+
+    def visit_SliceNode(self, node):
+        node.start = self.visit(node.start)
+        node.end = self.visit(node.end)
+        node.step = self.visit(node.step)
+        return node
+
+    def visit_AttributeAccess(self, node):
+        node.obj = self.visit(node.obj)
+        return node
+
+    def visit_VarAssign(self, node):
+        if node.value is not None:
+            node.value = self.visit(node.value)
+        if not isinstance(node.name, str):
+            node.name = self.visit(node.name)
+        return node
+
+    def visit_FuncCall(self, node):
+        if type(node.name).__name__ == 'AttributeAccess':
+            node.name = self.visit(node.name)
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
+
+    def visit_ClassInstance(self, node):
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
+
+    visit_SuperCall = visit_ClassInstance
+
+    def visit_FuncDef(self, node):
+        if node.lazy is not None:
+            # Optimized by LazyBody.parse() once the body is parsed.
+            node.lazy.optimizer = self
+            return node
+        saved = self.scope
+        self.scope = NameScope(node.body, node.params, self.file_scope)
+        try:
+            node.body = self.block(node.body)
+        finally:
+            self.scope = saved
+        return node
+
+    def visit_ClassDef(self, node):
+        for method in node.methods.values():
+            self.visit_FuncDef(method)
+        return node
+
+    def visit_If(self, node):
+        branches = []
+        for condition, body in node.branches:
+            if condition is not None:
+                condition = self.visit(condition)
+                if is_constant(condition):
+                    if not condition.value:
+                        continue
+                    condition = None
+            branches.append((condition, self.block(body)))
+            if condition is None:
+                break
+        node.branches = branches
+        return node
+
+    def visit_ForLoop(self, node):
+        node.start = self.visit(node.start)
+        node.end = self.visit(node.end)
+        node.body = self.block(node.body)
+        return self.hoist_loop(node)
+
+    def visit_ForEachLoop(self, node):
+        node.collection = self.visit(node.collection)
+        node.body = self.block(node.body)
+        return self.hoist_loop(node)
+
+    def visit_WhileLoop(self, node):
+        node.condition = self.visit(node.condition)
+        node.body = self.block(node.body)
+        return self.hoist_loop(node)
+
+    def hoist_loop(self, loop):
+        body = LoopBody(loop)
+        if body.imports:
+            return loop
+        loop.body = self.hoist(loop.body, body)
+        if type(loop).__name__ == 'WhileLoop':
+            loop.condition = self.hoist(loop.condition, body)
+        return loop
+
+    def hoist(self, value, body):
+        if isinstance(value, list):
+            return [self.hoist(item, body) for item in value]
+        if isinstance(value, tuple):
+            return tuple(self.hoist(item, body) for item in value)
+        if not is_node(value):
+            return value
+        kind = type(value).__name__
+        if kind in ('FuncDef', 'ClassDef'):
+            return value
+        if kind == 'Hoisted':
+            if self.invariant(value.expr, body):
+                # Invariant in the enclosing loop too: cache it once per entry of that loop instead.
+                self.owners[value].hoisted.remove(value)
+                body.loop.hoisted.append(value)
+                self.owners[value] = body.loop
+            return value
+        if kind in PURE and kind not in ('Var', 'Num', 'Str', 'Bool') and self.invariant(value, body):
+            self.count += 1
+            hoisted = Hoisted(value, intern(f"~hoisted{self.count}"))
+            body.loop.hoisted.append(hoisted)
+            self.owners[hoisted] = body.loop
+            return hoisted
+        for name, item in fields(value):
+            if name in ('hoisted', 'token', 'op', 'site', 'scope'):
+                continue
+            if isinstance(item, (list, tuple)) or is_node(item):
+                setattr(value, name, self.hoist(item, body))
+        return value
+
+    def invariant(self, node, body):
+        """True when node computes the same value every time the loop evaluates it."""
+        kind = type(node).__name__
+        if kind not in PURE:
+            return False
+        if kind == 'Var':
+            if node.name in body.assigned:
+                return False
+            if not body.calls:
+                return True
+            # A callee cannot rebind the loop's variables, but it can change what a
+            # list, instance or library object holds, so only immutable values qualify.
+            scope = self.scope
+            if scope is self.file_scope and scope.has_imports:
+                return False
+            return node.name in scope.value_names
+        if kind == 'Hoisted':
+            return self.invariant(node.expr, body)
+        if kind == 'Template':
+            return all(self.invariant(part, body) for part in node.parts[1::2])
+        for name in ('left', 'right', 'expr', 'value'):
+            child = getattr(node, name, None)
+            if is_node(child) and not self.invariant(child, body):
+                return False
+        return True
+
+def optimize(tree):
+    return Optimizer().optimize(tree)
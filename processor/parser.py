@@ -1,13 +1,46 @@
 from processor.lexer import (
-    Lexer, NUMBER, FLOAT, DOUBLE, PLUS, MINUS, MULTIPLY, DIVIDE, LPAREN, RPAREN, EOF, FELLA, STRING, AT, POPPIN, RING, FEED, RETURN, TRUE, FALSE, LBRACKET, RBRACKET, LBRACE, RBRACE, COLON, SPIN, ASSIGN, HASH, TALLBOY, ALSO, MAYBE, ISNOT, NOT, GIVE, ME, BUT, ONLY, LEARNING, BUILD, DOT,
+    Lexer, INTERPOLATION_RE, NUMBER, FLOAT, DOUBLE, PLUS, MINUS, MULTIPLY, DIVIDE, LPAREN, RPAREN, EOF, FELLA, STRING, AT, POPPIN, RING, FEED, RETURN, TRUE, FALSE, LBRACKET, RBRACKET, LBRACE, RBRACE, COLON, SPIN, ASSIGN, HASH, TALLBOY, ALSO, MAYBE, ISNOT, NOT, GIVE, ME, BUT, ONLY, LEARNING, BUILD, DOT,
     HUNGRY, FOR, CONVERTED, WAITING, INTERP_STRING, LIBRARY, KILL, SELF, EXTENDING, WITH, SUPERMAN, AS
 )
-from processor.ast import Num, BinOp, Print, Var, Str, If, Compare, Program, FuncDef, FuncCall, Return, FeedOp, Bool, ListLiteral, DictLiteral, Subscript, ForLoop, Len, TallBoy, LogicalOp, Import, ImportOnly, ClassDef, ClassInstance, AttributeAccess, WhileLoop
-from processor.ast import ToString, ToNumber, TypeOf, Nom, Input, Gurt
+from processor.ast import Num, BinOp, Print, Var, Str, Template, If, Compare, Program, FuncDef, FuncCall, Return, FeedOp, Bool, ListLiteral, DictLiteral, Subscript, ForLoop, Len, TallBoy, LogicalOp, Import, ImportOnly, ClassDef, ClassInstance, AttributeAccess, WhileLoop
+from processor.ast import AST, ToString, ToNumber, TypeOf, Nom, Input, Gurt
+from processor.typecheck import checker
+
+class LazyBody:
+    """Source of a function body the parser skipped, parsed the first time the body is used.
+
+    Only bodies outside any other function are skipped, so the statements
+    parse the same way whenever they are read. Once the tree has gone
+    through the optimizer, `optimizer` is set and optimizes them as well.
+    """
+
+    __slots__ = ('text', 'start', 'line', 'col', 'imports', 'optimizer')
+
+    def __init__(self, text, start, line, col, imports):
+        self.text = text
+        self.start = start
+        self.line = line
+        self.col = col
+        self.imports = imports
+        self.optimizer = None
+
+    def parse(self, func_def):
+        lexer = Lexer(self.text)
+        lexer.pos, lexer.line, lexer.col = self.start, self.line, self.col
+        parser = Parser(lexer)
+        parser.depth = 1
+        func_def.body = parser.block()
+        func_def.lazy = None
+        if self.optimizer is not None:
+            self.optimizer.visit_FuncDef(func_def)
+        return func_def.body
 
 class Parser:
-    def __init__(self, lexer: Lexer):
+    def __init__(self, lexer: Lexer, lazy=False):
         self.lexer = lexer
+        self.lazy = lazy
+        # Number of function bodies being parsed around the current token.
+        self.depth = 0
         self.current_token = self.lexer.get_next_token()
 
     def _make_slice(self, start, end, step):
@@ -22,6 +55,19 @@ class Parser:
         else:
             raise Exception(f'Unexpected token: {self.current_token}, expected {token_type} at line {getattr(self.current_token, "line", "?")}, pos {getattr(self.current_token, "pos", "?")}')
 
+    def template(self, value, token=None):
+        parts = INTERPOLATION_RE.split(value)
+        for i in range(1, len(parts), 2):
+            code = parts[i]
+            try:
+                expr_parser = Parser(Lexer(code))
+                parts[i] = expr_parser.expr()
+                if expr_parser.current_token.type != EOF:
+                    raise Exception(f"unexpected {expr_parser.current_token}")
+            except Exception as e:
+                raise Exception(f'Malformed interpolation "${{{code}}}" at line {getattr(token, "line", "?")}: {e}')
+        return Template(value, parts)
+
     def factor(self):
         token = self.current_token
         if token.type == HASH:
@@ -36,19 +82,15 @@ class Parser:
             self.eat(token.type)
             return Num(token)
         elif token.type == INTERP_STRING:
-            value = token.value
             self.eat(INTERP_STRING)
-            s = Str(token)
-            s.value = value
-            setattr(s, 'interpolated', True)
-            return s
+            return self.template(token.value, token)
         elif token.type == STRING:
             self.eat(STRING)
             return Str(token)
         elif getattr(token, "value", None) and isinstance(token.value, str) and token.value.startswith("`") and token.value.endswith("`"):
             raw = token.value[1:-1]
             self.eat(STRING)
-            return Str(type('InterpolatedString', (), {'value': raw, 'interpolated': True})())
+            return self.template(raw, token)
         elif token.type == TRUE:
             self.eat(TRUE)
             return Bool(True)
@@ -95,14 +137,18 @@ class Parser:
                             raise Exception("Expected return type name after ':'")
                         return_types.append(self.current_token.value)
                         self.eat('ID')
-                        if self.current_token.type == '/':
-                            self.eat('/')
+                        if self.current_token.type == DIVIDE:
+                            self.eat(DIVIDE)
                         else:
                             break
             else:
                 self.eat('WE')
+            self.depth += 1
             body = self.block()
-            return FuncDef(None, params, body, return_types)
+            self.depth -= 1
+            func = FuncDef(None, params, body, return_types)
+            func.line = token.line
+            return func
         elif token.type == 'ID':
             varname = token.value
             self.eat('ID')
@@ -224,15 +270,8 @@ class Parser:
         elif token.type == STRING:
             value = token.value
             self.eat(STRING)
-            import re
-            def interpolate(match):
-                expr_code = match.group(1)
-                expr_lexer = Lexer(expr_code)
-                expr_parser = Parser(expr_lexer)
-                expr_ast = expr_parser.expr()
-                return '{' + expr_code + '}'
             if '{' in value and '}' in value:
-                return Str(type('InterpolatedString', (), {'value': value, 'interpolated': True})())
+                return self.template(value, token)
             return Str(token)
         if token.type == FEED:
             self.eat(FEED)
@@ -408,8 +447,10 @@ class Parser:
         self.eat('AT')
         statements = []
         while self.current_token.type != 'AT' and self.current_token.type != 'EOF':
+            line = self.current_token.line
             stmt = self.statement()
             if stmt is not None:
+                stmt.line = line
                 statements.append(stmt)
         self.eat('AT')
         return Program(statements)
@@ -478,8 +519,10 @@ class Parser:
     def block(self):
         statements = []
         while self.current_token.type not in ('POW', 'ANOTHER', 'ANOTHER_ONE', 'EOF'):
+            line = self.current_token.line
             stmt = self.statement()
             if stmt is not None:
+                stmt.line = line
                 statements.append(stmt)
         self.eat('POW')
         return statements
@@ -529,8 +572,8 @@ class Parser:
                         raise Exception("Expected type name after ':'")
                     types.append(self.current_token.value)
                     self.eat('ID')
-                if self.current_token.type == '/':
-                    self.eat('/')
+                if self.current_token.type == DIVIDE:
+                    self.eat(DIVIDE)
                 else:
                     break
         if self.current_token.type == 'BOOM':
@@ -541,6 +584,7 @@ class Parser:
             return VarAssign(varname, None, types)
 
     def func_def(self):
+        line = self.current_token.line
         self.eat(POPPIN)
         if self.current_token.type != 'ID':
             raise Exception("Expected function name after POPPIN")
@@ -573,6 +617,7 @@ class Parser:
                 params.append(pname)
         self.eat(RPAREN)
         return_types = None
+        header = self.current_token
         if self.current_token.type == 'WE':
             self.eat('WE')
             if self.current_token.type == 'COLON':
@@ -582,15 +627,26 @@ class Parser:
                     if self.current_token.type != 'ID':
                         raise Exception("Expected return type name after ':'")
                     return_types.append(self.current_token.value)
+                    header = self.current_token
                     self.eat('ID')
-                    if self.current_token.type == '/':
-                        self.eat('/')
+                    if self.current_token.type == DIVIDE:
+                        self.eat(DIVIDE)
                     else:
                         break
         else:
             self.eat('WE')
-        body = self.block()
-        func = FuncDef(name, params, body, return_types)
+        if self.lazy and not self.depth:
+            func = FuncDef(name, params, None, return_types, param_types)
+            del func.body
+            start, imports = self.lexer.skip_block(header.line, header.pos)
+            func.lazy = LazyBody(self.lexer.text, start, header.line, header.pos, imports)
+            self.current_token = self.lexer.get_next_token()
+        else:
+            self.depth += 1
+            body = self.block()
+            self.depth -= 1
+            func = FuncDef(name, params, body, return_types, param_types)
+        func.line = line
         return func
 
     def func_call(self):
@@ -652,6 +708,7 @@ class Parser:
         methods = {}
         while self.current_token.type == POPPIN:
             method = self.func_def()
+            method.is_method = True
             methods[method.name] = method
         self.eat('POW')
         return ClassDef(class_name, methods, base_class=base_class)
@@ -666,6 +723,7 @@ class Parser:
         methods = {}
         while self.current_token.type == POPPIN:
             method = self.func_def()
+            method.is_method = True
             methods[method.name] = method
         self.eat('POW')
         return ClassDef(class_name, methods)
@@ -673,40 +731,59 @@ class Parser:
     def parse(self):
         statements = []
         while self.current_token.type != 'EOF':
+            line = self.current_token.line
             stmt = self.statement()
             if stmt is not None:
+                stmt.line = line
                 statements.append(stmt)
         return Program(statements)
 
-class KillSelf:
+class KillSelf(AST):
+    __slots__ = ()
+
     is_kill_self = True
 
-class SuperCall:
+class SuperCall(AST):
+    __slots__ = ('args',)
+
     def __init__(self, args):
         self.args = args
 
-class ImportAs:
+class ImportAs(AST):
+    __slots__ = ('module_path', 'as_name', 'only_name', 'is_library')
+
     def __init__(self, module_path, as_name, only_name=None, is_library=False):
         self.module_path = module_path
         self.as_name = as_name
         self.only_name = only_name
         self.is_library = is_library
 
-class ForEachLoop:
+class ForEachLoop(AST):
+    __slots__ = ('index_var', 'value_var', 'collection', 'body', 'index_ref', 'value_ref', 'hoisted')
+
     def __init__(self, index_var, value_var, collection, body):
         self.index_var = index_var
         self.value_var = value_var
         self.collection = collection
         self.body = body
+        self.index_ref = None
+        self.value_ref = None
+        self.hoisted = []
+
+class SliceNode(AST):
+    __slots__ = ('start', 'end', 'step')
 
-class SliceNode:
     def __init__(self, start, end, step):
         self.start = start
         self.end = end
         self.step = step
 
-class VarAssign:
+class VarAssign(AST):
+    __slots__ = ('name', 'value', 'types', 'checker', 'ref')
+
     def __init__(self, name, value, types=None):
         self.name = name
         self.value = value
-        self.types = types
\ No newline at end of file
+        self.types = types
+        self.checker = checker(types)
+        self.ref = None
\ No newline at end of file
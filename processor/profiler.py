@@ -0,0 +1,175 @@
+import sys
+import time
+import marshal
+from processor.ast import AST, fields
+
+class Profiler:
+    """Deterministic profiler for NScript functions, class methods and source lines.
+
+    Interpreter.profile() installs timing wrappers on one interpreter as
+    instance attributes, so interpreters that are not profiled run the
+    plain class methods. Functions are keyed like cProfile entries, as
+    (file, line, name), and lines as (file, line). Self time leaves out the
+    time spent in nested calls, or in nested statements for a line. Total
+    time counts a recursive call or line once, at its outermost entry.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.labels = {}
+        self.functions = {}
+        self.callers = {}
+        self.lines = {}
+        self.active = {}
+        self.calls = []
+        self.statements = []
+
+    def register(self, tree, file):
+        register(self.labels, tree, file)
+
+    def label(self, func):
+        func_def = getattr(func, "func_def", func)
+        key = self.labels.get(func_def)
+        if key is None:
+            file = self.calls[-1][0][0] if self.calls else "<input>"
+            key = (file, getattr(func_def, "line", 0) or 0, func_def.name or "<anonymous>")
+            self.labels[func_def] = key
+        return key
+
+    def enter(self, key):
+        self.active[key] = self.active.get(key, 0) + 1
+        self.calls.append([key, self.clock(), 0.0])
+
+    def exit(self):
+        key, start, children = self.calls.pop()
+        total = self.clock() - start
+        outermost = self.active[key] == 1
+        self.active[key] -= 1
+        own = total - children
+        add(self.functions.setdefault(key, [0, 0, 0.0, 0.0]), own, total, outermost)
+        if self.calls:
+            caller = self.calls[-1]
+            caller[2] += total
+            add(self.callers.setdefault(key, {}).setdefault(caller[0], [0, 0, 0.0, 0.0]), own, total, outermost)
+
+    def enter_line(self, line):
+        file = self.calls[-1][0][0] if self.calls else "<input>"
+        key = (file, line)
+        self.active[key] = self.active.get(key, 0) + 1
+        self.statements.append([key, self.clock(), 0.0])
+
+    def exit_line(self):
+        key, start, children = self.statements.pop()
+        total = self.clock() - start
+        outermost = self.active[key] == 1
+        self.active[key] -= 1
+        if self.statements:
+            self.statements[-1][2] += total
+        entry = self.lines.get(key)
+        if entry is None:
+            entry = self.lines[key] = [0, 0, 0.0, 0.0]
+        add(entry, total - children, total, outermost)
+
+    def timed_program(self, interpreter, interpret):
+        def profiled_interpret(node):
+            file = interpreter.file or "<input>"
+            self.register(node, file)
+            self.enter((file, 0, "<module>"))
+            try:
+                return interpret(node)
+            finally:
+                self.exit()
+        return profiled_interpret
+
+    def timed_call(self, call_function):
+        def profiled_call(func, args):
+            self.enter(self.label(func))
+            try:
+                return call_function(func, args)
+            finally:
+                self.exit()
+        return profiled_call
+
+    def timed_visit(self, visit):
+        def profiled_visit(node):
+            line = getattr(node, "line", None)
+            if line is None:
+                return visit(node)
+            self.enter_line(line)
+            try:
+                return visit(node)
+            finally:
+                self.exit_line()
+        return profiled_visit
+
+    def timed_compile(self, compile):
+        def profiled_compile(node):
+            run = compile(node)
+            line = getattr(node, "line", None)
+            if line is None:
+                return run
+            enter_line, exit_line = self.enter_line, self.exit_line
+            def profiled_statement():
+                enter_line(line)
+                try:
+                    return run()
+                finally:
+                    exit_line()
+            return profiled_statement
+        return profiled_compile
+
+    def report(self, out=None, limit=20):
+        out = out or sys.stderr
+        print("\n--- NacoScript Profile ---", file=out)
+        print(f"{'calls':>8} {'total s':>10} {'self s':>10}  function", file=out)
+        functions = sorted(self.functions.items(), key=lambda item: item[1][2], reverse=True)
+        for (file, line, name), (_, calls, own, total) in functions[:limit]:
+            print(f"{calls:>8} {total:>10.6f} {own:>10.6f}  {name} ({short(file)}:{line})", file=out)
+        print(f"\n{'hits':>8} {'total s':>10} {'self s':>10}  line", file=out)
+        lines = sorted(self.lines.items(), key=lambda item: item[1][2], reverse=True)
+        for (file, line), (_, hits, own, total) in lines[:limit]:
+            print(f"{hits:>8} {total:>10.6f} {own:>10.6f}  {short(file)}:{line}", file=out)
+        print("-----------------------\n", file=out)
+
+    def dump_stats(self, path):
+        """Write the function timings in the marshal format pstats.Stats reads."""
+        stats = {}
+        for key, (primitive, calls, own, total) in self.functions.items():
+            callers = {}
+            for caller, (c_primitive, c_calls, c_own, c_total) in self.callers.get(key, {}).items():
+                callers[caller] = (c_calls, c_primitive, c_own, c_total)
+            stats[key] = (primitive, calls, own, total, callers)
+        with open(path, "wb") as f:
+            marshal.dump(stats, f)
+
+def register(labels, tree, file):
+    """Key every function and method defined in tree by (file, line, name) in labels."""
+    pending = [(tree, None)]
+    while pending:
+        node, owner = pending.pop()
+        if isinstance(node, (list, tuple)):
+            pending.extend((item, owner) for item in node)
+            continue
+        kind = type(node).__name__
+        if kind == 'FuncDef':
+            name = node.name or "<anonymous>"
+            if owner:
+                name = f"{owner}.{name}"
+            labels[node] = (file, getattr(node, "line", 0) or 0, name)
+            pending.append((node.body, None))
+        elif kind == 'ClassDef':
+            pending.extend((method, node.name) for method in node.methods.values())
+        elif isinstance(node, AST):
+            for _, value in fields(node):
+                if isinstance(value, (list, tuple, AST)):
+                    pending.append((value, None))
+
+def add(entry, own, total, outermost):
+    entry[1] += 1
+    entry[2] += own
+    if outermost:
+        entry[0] += 1
+        entry[3] += total
+
+def short(file):
+    return file.replace("\\", "/").rsplit("/", 1)[-1]
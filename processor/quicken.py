@@ -0,0 +1,110 @@
+import operator
+from processor.ast import BinOp, Compare, Subscript, Num
+
+# Specialized node classes. Interpreter.quicken() rewrites a BinOp, Compare
+# or Subscript node in place, by switching its class, to the variant that
+# matches the operand types it saw; the variant's visit_* method checks
+# that guard on every evaluation and deoptimizes the node to its Generic
+# class when it fails. Generic nodes run the plain visit_* code and are
+# never specialized again.
+
+class QuickAdd(BinOp):
+    __slots__ = ()
+
+class QuickSub(BinOp):
+    __slots__ = ()
+
+class QuickMul(BinOp):
+    __slots__ = ()
+
+class QuickDiv(BinOp):
+    __slots__ = ()
+
+class GenericBinOp(BinOp):
+    __slots__ = ()
+
+class QuickEqual(Compare):
+    __slots__ = ()
+
+class QuickNotEqual(Compare):
+    __slots__ = ()
+
+class QuickUnder(Compare):
+    __slots__ = ()
+
+class QuickOver(Compare):
+    __slots__ = ()
+
+class GenericCompare(Compare):
+    __slots__ = ()
+
+class QuickIndex(Subscript):
+    __slots__ = ()
+
+class QuickConstIndex(Subscript):
+    __slots__ = ()
+
+class GenericSubscript(Subscript):
+    __slots__ = ()
+
+BINARY = {'+': QuickAdd, '-': QuickSub, '*': QuickMul, '/': QuickDiv}
+COMPARE = {'IS': QuickEqual, 'IS_NOT': QuickNotEqual, 'IS_UNDER': QuickUnder, 'IS_OVER': QuickOver}
+ARITHMETIC = (int, float)
+
+# Operation each BinOp and Compare variant applies once its guard holds.
+OPERATORS = {
+    QuickAdd: operator.add,
+    QuickSub: operator.sub,
+    QuickMul: operator.mul,
+    QuickDiv: operator.truediv,
+    QuickEqual: operator.eq,
+    QuickNotEqual: operator.ne,
+    QuickUnder: operator.lt,
+    QuickOver: operator.gt,
+}
+
+def specialize_binop(node, left, right):
+    """Rewrite node for the operand types left and right and return the variant's name, or None if it stays generic."""
+    op = getattr(node.op, "value", None)
+    kind = type(left)
+    quick = BINARY.get(op)
+    if quick is None or kind is not type(right) or not (kind in ARITHMETIC or (kind is str and op == '+')):
+        node.__class__ = GenericBinOp
+        return None
+    node.__class__ = quick
+    node.guard = kind
+    return f"{kind.__name__} {op} {kind.__name__}"
+
+def specialize_compare(node, left, right):
+    """Rewrite node for the operand types left and right and return the variant's name, or None if it stays generic."""
+    kind = type(left)
+    quick = COMPARE.get(node.op)
+    if quick is None or kind is not type(right):
+        node.__class__ = GenericCompare
+        return None
+    node.__class__ = quick
+    node.guard = kind
+    return f"{kind.__name__} {node.op} {kind.__name__}"
+
+def specialize_subscript(node, value, index):
+    """Rewrite node for the value and index it saw and return the variant's name, or None if it stays generic."""
+    kind = type(value)
+    if (kind is not list and kind is not str) or type(index) is not int:
+        node.__class__ = GenericSubscript
+        return None
+    node.guard = kind
+    if type(node.index) is Num:
+        node.__class__ = QuickConstIndex
+        node.offset = index - 1
+        return f"{kind.__name__}[constant]"
+    node.__class__ = QuickIndex
+    return f"{kind.__name__}[int]"
+
+def deoptimize(node):
+    """Turn a specialized node back into a generic one whose guard no longer holds."""
+    if isinstance(node, BinOp):
+        node.__class__ = GenericBinOp
+    elif isinstance(node, Compare):
+        node.__class__ = GenericCompare
+    else:
+        node.__class__ = GenericSubscript
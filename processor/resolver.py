@@ -0,0 +1,338 @@
+from processor.ast import FuncDef
+
+LOCAL = 0
+CELL = 1
+FREE = 2
+GLOBAL = 3
+
+class Unbound:
+    def __repr__(self):
+        return "<unbound>"
+
+UNBOUND = Unbound()
+
+class Cell:
+    """Shared storage for a local that an inner function captures."""
+
+    def __init__(self, value=UNBOUND):
+        self.value = value
+
+class Closure:
+    """A function value together with the cells it captured when defined."""
+
+    def __init__(self, func_def, cells):
+        self.func_def = func_def
+        self.cells = cells
+        self.name = func_def.name
+        self.params = func_def.params
+        self.body = func_def.body
+        self.return_types = func_def.return_types
+        self.return_checker = func_def.return_checker
+        self.param_types = func_def.param_types
+
+class Scope:
+    """Frame layout of one function body.
+
+    Parameters take the first slots, followed by every other name the body
+    assigns. Slots listed in `cells` hold a Cell because an inner function
+    captures them; `free` names are read through the enclosing function's
+    cells, described by `free_sources` as (kind, index) pairs.
+    """
+
+    def __init__(self, params, parent=None):
+        self.parent = parent
+        self.names = []
+        self.slots = {}
+        self.cells = set()
+        self.cell_slots = ()
+        self.free = []
+        self.free_slots = {}
+        self.free_sources = []
+        for name in params:
+            self.declare(name)
+        self.nparams = len(self.names)
+
+    def declare(self, name):
+        if name not in self.slots:
+            self.slots[name] = len(self.names)
+            self.names.append(name)
+
+    def free_var(self, name):
+        index = self.free_slots.get(name)
+        if index is not None:
+            return index
+        parent = self.parent
+        if parent is None:
+            return None
+        slot = parent.slots.get(name)
+        if slot is not None:
+            parent.cells.add(slot)
+            source = (CELL, slot)
+        else:
+            slot = parent.free_var(name)
+            if slot is None:
+                return None
+            source = (FREE, slot)
+        index = len(self.free)
+        self.free.append(name)
+        self.free_slots[name] = index
+        self.free_sources.append(source)
+        return index
+
+    def lookup(self, name):
+        slot = self.slots.get(name)
+        if slot is not None:
+            return (LOCAL, slot)
+        index = self.free_var(name)
+        if index is not None:
+            return (FREE, index)
+        return (GLOBAL, None)
+
+    def new_frame(self, args):
+        frame = args[:self.nparams]
+        missing = len(self.names) - len(frame)
+        if missing:
+            frame += [UNBOUND] * missing
+        for slot in self.cell_slots:
+            frame[slot] = Cell(frame[slot])
+        return frame
+
+    def get(self, frame, closure, name):
+        slot = self.slots.get(name)
+        if slot is not None:
+            value = frame[slot]
+            return value.value if slot in self.cells else value
+        index = self.free_slots.get(name)
+        if index is not None:
+            return closure[index].value
+        return UNBOUND
+
+    def set(self, frame, name, value):
+        slot = self.slots.get(name)
+        if slot is None:
+            return False
+        if slot in self.cells:
+            frame[slot].value = value
+        else:
+            frame[slot] = value
+        return True
+
+def make_function(func_def, frame, closure):
+    """Return the runtime value for func_def, capturing cells if it needs any."""
+    scope = func_def.scope
+    if scope is None or not scope.free:
+        return func_def
+    cells = []
+    for kind, index in scope.free_sources:
+        cells.append(frame[index] if kind == CELL else closure[index])
+    return Closure(func_def, tuple(cells))
+
+def is_function(value):
+    return isinstance(value, (FuncDef, Closure))
+
+class Resolver:
+    """Static scope resolution.
+
+    Annotates every name reference with `ref`, a (kind, slot) pair: LOCAL
+    and CELL refer to a slot of the current frame, FREE to a captured cell
+    and GLOBAL to the interpreter's global environment. Names are local to
+    a function when the function assigns them, as with the copied
+    environments the interpreter used before; reading a local that has not
+    been assigned yet falls back to the global of the same name.
+    """
+
+    def __init__(self):
+        self.scope = None
+        self.pending = []
+
+    def resolve(self, node):
+        self.visit(node)
+        return node
+
+    def visit(self, node):
+        if node is None or isinstance(node, (str, int, float, bool)):
+            return
+        method = getattr(self, f'resolve_{type(node).__name__}', None)
+        if method is not None:
+            method(node)
+
+    def visit_all(self, nodes):
+        for node in nodes:
+            self.visit(node)
+
+    def bind(self, node, attr, name):
+        if self.scope is None:
+            ref = (GLOBAL, None)
+        else:
+            ref = self.scope.lookup(name)
+            if ref[0] == LOCAL:
+                self.pending.append((node, attr, ref[1]))
+        setattr(node, attr, ref)
+
+    def function(self, func_def, params, parent):
+        scope = Scope(params, parent)
+        DeclarationCollector(scope).collect(func_def.body)
+        func_def.scope = scope
+        outer_scope, outer_pending = self.scope, self.pending
+        self.scope, self.pending = scope, []
+        self.visit_all(func_def.body)
+        scope.cell_slots = tuple(sorted(scope.cells))
+        for node, attr, slot in self.pending:
+            if slot in scope.cells:
+                setattr(node, attr, (CELL, slot))
+        self.scope, self.pending = outer_scope, outer_pending
+
+    def resolve_Program(self, node):
+        self.visit_all(node.statements)
+
+    def resolve_Var(self, node):
+        self.bind(node, 'ref', node.name)
+
+    def resolve_VarAssign(self, node):
+        self.visit(node.value)
+        if isinstance(node.name, str):
+            self.bind(node, 'ref', node.name)
+        else:
+            self.visit(node.name)
+
+    def resolve_Template(self, node):
+        self.visit_all(node.parts[1::2])
+
+    def resolve_FuncDef(self, node):
+        # A body the parser skipped is resolved by function_scope() when it is first called.
+        if node.lazy is None:
+            self.function(node, node.params, self.scope)
+
+    def resolve_ClassDef(self, node):
+        for method in node.methods.values():
+            if method.lazy is None:
+                self.function(method, method_params(method), None)
+
+    def resolve_FuncCall(self, node):
+        self.visit(node.name)
+        self.visit_all(node.args)
+
+    def resolve_ForLoop(self, node):
+        self.visit(node.start)
+        self.visit(node.end)
+        self.bind(node, 'var_ref', node.var)
+        self.visit_all(node.body)
+
+    def resolve_ForEachLoop(self, node):
+        self.visit(node.collection)
+        self.bind(node, 'index_ref', node.index_var)
+        self.bind(node, 'value_ref', node.value_var)
+        self.visit_all(node.body)
+
+    def resolve_WhileLoop(self, node):
+        self.visit(node.condition)
+        self.visit_all(node.body)
+
+    def resolve_If(self, node):
+        for condition, body in node.branches:
+            self.visit(condition)
+            self.visit_all(body)
+
+    def resolve_BinOp(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+
+    resolve_Compare = resolve_BinOp
+    resolve_LogicalOp = resolve_BinOp
+    resolve_FeedOp = resolve_BinOp
+
+    def resolve_Print(self, node):
+        self.visit(node.value)
+
+    resolve_Return = resolve_Print
+    resolve_Len = resolve_Print
+    resolve_TallBoy = resolve_Print
+
+    def resolve_ToString(self, node):
+        self.visit(node.expr)
+
+    resolve_ToNumber = resolve_ToString
+    resolve_TypeOf = resolve_ToString
+    resolve_Gurt = resolve_ToString
+
+    def resolve_Hoisted(self, node):
+        self.visit(node.expr)
+        self.bind(node, 'ref', node.name)
+
+    def resolve_Nom(self, node):
+        self.visit(node.path_expr)
+
+    def resolve_Input(self, node):
+        self.visit(node.prompt_expr)
+
+    def resolve_ListLiteral(self, node):
+        self.visit_all(node.elements)
+
+    def resolve_DictLiteral(self, node):
+        for key, value in node.pairs:
+            self.visit(key)
+            self.visit(value)
+
+    def resolve_Subscript(self, node):
+        self.visit(node.value)
+        self.visit(node.index)
+
+    def resolve_SliceNode(self, node):
+        self.visit(node.start)
+        self.visit(node.end)
+        self.visit(node.step)
+
+    def resolve_AttributeAccess(self, node):
+        self.visit(node.obj)
+
+    def resolve_ClassInstance(self, node):
+        self.visit_all(node.args)
+
+    resolve_SuperCall = resolve_ClassInstance
+
+class DeclarationCollector:
+    """Finds the names a function body assigns, without entering nested functions."""
+
+    def __init__(self, scope):
+        self.scope = scope
+
+    def collect(self, statements):
+        for stmt in statements:
+            self.statement(stmt)
+
+    def statement(self, node):
+        kind = type(node).__name__
+        if kind == 'VarAssign' and isinstance(node.name, str):
+            self.scope.declare(node.name)
+        elif kind == 'ForLoop':
+            self.scope.declare(node.var)
+            self.hoisted(node)
+            self.collect(node.body)
+        elif kind == 'ForEachLoop':
+            self.scope.declare(node.index_var)
+            self.scope.declare(node.value_var)
+            self.hoisted(node)
+            self.collect(node.body)
+        elif kind == 'WhileLoop':
+            self.hoisted(node)
+            self.collect(node.body)
+        elif kind == 'If':
+            for _, body in node.branches:
+                self.collect(body)
+        elif kind == 'Program':
+            self.collect(node.statements)
+
+    def hoisted(self, loop):
+        for node in loop.hoisted:
+            self.scope.declare(node.name)
+
+def resolve(node):
+    return Resolver().resolve(node)
+
+def method_params(func_def):
+    return ['ts'] + list(func_def.params[1:])
+
+def function_scope(func_def):
+    if func_def.scope is None:
+        Resolver().function(func_def, method_params(func_def) if func_def.is_method else func_def.params, None)
+    return func_def.scope
@@ -0,0 +1,160 @@
+import sys
+import threading
+from processor.interpreter import Interpreter
+from processor.closures import ClosureInterpreter
+from processor.vm import VM
+from processor.transpiled import TranspiledInterpreter
+from processor.transpiler import source_maps
+from processor.profiler import register, short
+
+VISITS = {Interpreter.visit.__code__}
+CALLS = {Interpreter.call_function.__code__, ClosureInterpreter.call_function.__code__, TranspiledInterpreter.call_function.__code__}
+PROGRAMS = {Interpreter.interpret.__code__, ClosureInterpreter.interpret.__code__, TranspiledInterpreter.interpret.__code__}
+RUNS = {VM.run.__code__}
+ACTIVATE = VM.activate.__code__
+
+class Sampler:
+    """Sampling profiler that counts NScript call stacks in collapsed-stack format.
+
+    A background thread wakes every `interval` seconds and rebuilds the
+    logical NScript stack of the profiled thread from its Python frames:
+    call_function and interpret frames mark NScript calls, visit frames, VM
+    program counters and the source maps of generated code give the line
+    running in each of them. The ast, vm and py engines run unchanged while
+    sampled; the closure engine wraps each statement in one extra call that
+    records its line.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.labels = {}
+        self.counts = {}
+        self.samples = 0
+        self.thread_id = None
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def register(self, tree, file):
+        register(self.labels, tree, file)
+
+    def registering(self, interpreter, interpret):
+        def sampled_interpret(node):
+            self.register(node, interpreter.file or "<input>")
+            return interpret(node)
+        return sampled_interpret
+
+    def lined_compile(self, compile):
+        def sampled_compile(node):
+            run = compile(node)
+            line = getattr(node, "line", None)
+            if line is None:
+                return run
+            return statement(run, line)
+        return sampled_compile
+
+    def start(self):
+        self.thread_id = threading.get_ident()
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.loop, name="nscript-sampler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def loop(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            try:
+                stack = self.walk(frame)
+            except Exception:
+                # A frame torn down mid-walk must not end sampling for the rest of the run.
+                continue
+            finally:
+                del frame
+            if stack:
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+                self.samples += 1
+
+    def walk(self, frame):
+        """Return the NScript frames running in frame and its callers, innermost first."""
+        stack = []
+        line = None
+        activating = False
+        while frame is not None:
+            code = frame.f_code
+            if code in VISITS:
+                if line is None:
+                    line = getattr(frame.f_locals.get("node"), "line", None)
+            elif code is STATEMENT:
+                if line is None:
+                    line = frame.f_locals.get("line")
+            elif code.co_filename in source_maps:
+                mapping = source_maps[code.co_filename][1]
+                lineno = frame.f_lineno
+                if line is None and lineno is not None and 0 < lineno <= len(mapping):
+                    line = mapping[lineno - 1] or None
+            elif code in CALLS:
+                func = frame.f_locals.get("func")
+                stack.append(self.function_frame(getattr(func, "func_def", func), line, frame.f_locals.get("self")))
+                line = None
+            elif code in PROGRAMS:
+                stack.append(self.module_frame(frame.f_locals.get("self"), line))
+                line = None
+            elif code is ACTIVATE:
+                # run() has already saved the caller, or is replacing it for a tail call.
+                func = frame.f_locals.get("func")
+                stack.append(self.function_frame(getattr(func, "func_def", func), None, frame.f_locals.get("self")))
+                activating = frame.f_back is not None and frame.f_back.f_code in RUNS
+            elif code in RUNS:
+                local = frame.f_locals
+                interpreter = local.get("self")
+                if not activating:
+                    stack.append(self.code_frame(local.get("code"), local.get("pc", 2) - 2, interpreter))
+                for saved in reversed(local.get("calls", ())):
+                    stack.append(self.code_frame(saved[0], saved[6] - 2, interpreter))
+                line = None
+                activating = False
+            frame = frame.f_back
+        return stack
+
+    def function_frame(self, func_def, line, interpreter):
+        label = self.labels.get(func_def)
+        if label is None:
+            file = getattr(interpreter, "file", None) or "<input>"
+            label = (file, getattr(func_def, "line", 0) or 0, getattr(func_def, "name", None) or "<anonymous>")
+        return frame_name(label[2], label[0], line)
+
+    def module_frame(self, interpreter, line):
+        return frame_name("<module>", getattr(interpreter, "file", None) or "<input>", line)
+
+    def code_frame(self, code, offset, interpreter):
+        if code is None:
+            return "<unknown>"
+        line = code.line_at(offset)
+        if code.func_def is None:
+            return frame_name(code.name, getattr(interpreter, "file", None) or "<input>", line)
+        return self.function_frame(code.func_def, line, interpreter)
+
+    def write(self, path):
+        """Write one `frame;frame;... count` line per distinct stack, as flamegraph.pl and speedscope read."""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.counts.items()):
+                f.write(f"{stack} {count}\n")
+
+def statement(run, line):
+    def sampled_statement(line=line):
+        return run()
+    return sampled_statement
+
+STATEMENT = statement(None, 0).__code__
+
+def frame_name(name, file, line):
+    if line is None:
+        return f"{name} ({short(file)})"
+    return f"{name} ({short(file)}:{line})"
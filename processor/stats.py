@@ -0,0 +1,107 @@
+import bisect
+from processor import cache
+
+# Upper bounds, in seconds, of the library call latency buckets; slower calls land in a last, open bucket.
+LATENCY_BUCKETS = (0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0)
+
+class Histogram:
+    """Latency distribution of the calls to one Python library function."""
+
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def as_dict(self):
+        labels = [f"<={format_seconds(bound)}" for bound in LATENCY_BUCKETS] + [f">{format_seconds(LATENCY_BUCKETS[-1])}"]
+        return {
+            "count": self.count,
+            "total_s": self.total,
+            "mean_s": self.total / self.count if self.count else 0.0,
+            "max_s": self.max,
+            "buckets": dict(zip(labels, self.buckets)),
+        }
+
+class Counters:
+    """Running totals kept by an interpreter and shared with the GIVE ME modules it runs.
+
+    Calls, instances, imports, call depth and the node specializations of
+    Interpreter.quicken() are counted as they happen.
+    Counting nodes by type costs a wrapper around every evaluation, so
+    `nodes` stays empty until Interpreter.count_nodes() is called.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        self.counting = False
+        self.calls = 0
+        self.instances = 0
+        self.imports = 0
+        self.modules = 0
+        self.depth = 0
+        self.peak_depth = 0
+        self.library_calls = {}
+        self.specialized = {}
+        self.generic = 0
+        self.deoptimized = 0
+
+    def library_call(self, library, attr, seconds):
+        key = (library.__nscript_pythonlib__, attr)
+        histogram = self.library_calls.get(key)
+        if histogram is None:
+            histogram = self.library_calls[key] = Histogram()
+        histogram.add(seconds)
+
+    def counted_visit(self, visit):
+        nodes = self.nodes
+        def counting_visit(node):
+            name = type(node).__name__
+            nodes[name] = nodes.get(name, 0) + 1
+            return visit(node)
+        return counting_visit
+
+    def counted_compile(self, compile):
+        nodes = self.nodes
+        def counting_compile(node):
+            run = compile(node)
+            name = type(node).__name__
+            def counted():
+                nodes[name] = nodes.get(name, 0) + 1
+                return run()
+            return counted
+        return counting_compile
+
+    def as_dict(self):
+        return {
+            "nodes": dict(sorted(self.nodes.items(), key=lambda item: item[1], reverse=True)),
+            "function_calls": self.calls,
+            "instances_built": self.instances,
+            "imports": self.imports,
+            "modules_run": self.modules,
+            "peak_call_depth": self.peak_depth,
+            "parse_cache": {"hits": cache.hits, "misses": cache.misses},
+            "quickening": {
+                "specialized": sum(self.specialized.values()),
+                "generic": self.generic,
+                "deoptimized": self.deoptimized,
+                "variants": dict(sorted(self.specialized.items(), key=lambda item: item[1], reverse=True)),
+            },
+            "library_calls": {f"{library}.{attr}": histogram.as_dict() for (library, attr), histogram in sorted(self.library_calls.items())},
+        }
+
+def format_seconds(seconds):
+    if seconds >= 1:
+        return f"{seconds:g}s"
+    if seconds >= 0.001:
+        return f"{seconds * 1000:g}ms"
+    return f"{seconds * 1000000:g}us"
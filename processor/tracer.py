@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import threading
+from processor import libraries
+from processor.profiler import register
+
+class Tracer:
+    """Records NScript execution as Chrome trace events, for Perfetto or chrome://tracing.
+
+    Interpreter.trace() wraps one interpreter's calls, GIVE ME module runs
+    and library attribute lookups as instance attributes, the way
+    Interpreter.profile() does; start() also wraps the process-wide
+    library cache so executing a GIVE LIBRARY main.py is recorded. Events
+    are buffered in memory and only written out by write().
+    """
+
+    def __init__(self, clock=time.perf_counter_ns):
+        self.clock = clock
+        self.events = []
+        self.labels = {}
+        self.wrappers = {}
+        self.origin = clock()
+
+    def begin(self, name, cat, args=None):
+        self.events.append(("B", self.clock(), threading.get_ident(), name, cat, args))
+
+    def end(self):
+        self.events.append(("E", self.clock(), threading.get_ident(), None, None, None))
+
+    def start(self):
+        load = libraries.cache.module
+        def traced_load(libname, path):
+            self.begin(f"GIVE LIBRARY {libname}", "import", {"path": path})
+            try:
+                return load(libname, path)
+            finally:
+                self.end()
+        libraries.cache.module = traced_load
+
+    def stop(self):
+        libraries.cache.__dict__.pop("module", None)
+
+    def traced_program(self, interpreter, interpret):
+        def traced_interpret(node):
+            file = interpreter.file or "<input>"
+            register(self.labels, node, file)
+            self.begin(f"<module> {os.path.basename(file)}", "module", {"file": file})
+            try:
+                return interpret(node)
+            finally:
+                self.end()
+        return traced_interpret
+
+    def traced_call(self, call_function):
+        def traced_call_function(func, args):
+            func_def = getattr(func, "func_def", func)
+            label = self.labels.get(func_def)
+            if label is None:
+                label = ("<input>", getattr(func_def, "line", 0) or 0, func_def.name or "<anonymous>")
+            cat = "build" if func_def.name == "constructor" else "function"
+            self.begin(label[2], cat, {"file": label[0], "line": label[1]})
+            try:
+                return call_function(func, args)
+            finally:
+                self.end()
+        return traced_call_function
+
+    def traced_module(self, execute):
+        def traced_execute(module):
+            self.begin(f"GIVE ME {os.path.basename(module.path)}", "import", {"path": module.path})
+            try:
+                return execute(module)
+            finally:
+                self.end()
+        return traced_execute
+
+    def traced_attribute(self, load_attribute):
+        def traced_load_attribute(site, obj):
+            value = load_attribute(site, obj)
+            libname = getattr(obj, "__nscript_pythonlib__", None)
+            if libname is not None and callable(value):
+                return self.library_call(f"{libname}.{site.attr}", value)
+            return value
+        return traced_load_attribute
+
+    def traced_import(self, interpreter, visit_import_as):
+        def traced_visit_import_as(node):
+            result = visit_import_as(node)
+            if node.is_library and node.only_name:
+                libname = node.module_path[len("LIBRARY "):].strip('"').strip("'")
+                alias = node.as_name or libname
+                value = interpreter.env.get(alias)
+                if callable(value):
+                    interpreter.env[alias] = self.library_call(f"{libname}.{node.only_name}", value)
+            return result
+        return traced_visit_import_as
+
+    def library_call(self, name, func):
+        """Return func wrapped so each call into the Python library is recorded."""
+        wrapper = self.wrappers.get((name, id(func)))
+        if wrapper is None:
+            def wrapper(*args, **kwargs):
+                self.begin(name, "library")
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.end()
+            self.wrappers[(name, id(func))] = wrapper
+        return wrapper
+
+    def write(self, path):
+        pid = os.getpid()
+        events = []
+        for phase, ts, tid, name, cat, args in self.events:
+            event = {"ph": phase, "ts": (ts - self.origin) / 1000, "pid": pid, "tid": tid}
+            if name is not None:
+                event["name"] = name
+                event["cat"] = cat
+            if args:
+                event["args"] = args
+            events.append(event)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,139 @@
+from processor import transpiler
+from processor.ast import FuncDef
+from processor.interpreter import Interpreter, ReturnException
+from processor.resolver import resolve, function_scope, make_function, Closure, UNBOUND
+
+class TranspiledInterpreter(Interpreter):
+    """Execution engine that runs NScript as generated Python code.
+
+    processor.transpiler turns every program into the source of a Python
+    module, cached next to the parse cache with a source map, so CPython
+    compiles it once and keeps its bytecode in __pycache__. The generated
+    functions use the environment model of the other engines and call back
+    into this class for everything they do not do inline. Errors raised in
+    generated code get an `nscript_trace` of the .n lines that were running.
+    """
+
+    def interpret(self, node):
+        resolve(node)
+        program = transpiler.load(node, self.file, self.runtime_checks)
+        try:
+            result = program(self, None, None)
+        except Exception as e:
+            e.nscript_trace = transpiler.nscript_trace(e.__traceback__)
+            raise
+        if self.returning:
+            self.returning = False
+            raise ReturnException(result)
+        return result
+
+    def profile(self, profiler):
+        raise Exception("Profiling is not supported by the py engine, use the ast or closure engine")
+
+    def trace(self, tracer):
+        raise Exception("Tracing is not supported by the py engine, use the ast or closure engine")
+
+    def count_nodes(self):
+        # Generated code does not evaluate nodes, so stats()["nodes"] stays empty.
+        pass
+
+    def quicken(self):
+        raise Exception("Quickening is not supported by the py engine, use the ast engine")
+
+    def call_function(self, func, args):
+        if isinstance(func, Closure):
+            func_def, closure = func.func_def, func.cells
+        else:
+            func_def, closure = func, None
+        body = getattr(func_def, "transpiled", None)
+        if body is None:
+            raise Exception(f"Function '{func_def.name}' was not transpiled")
+        scope = function_scope(func_def)
+        saved = self.frame, self.closure, self.scope
+        frame = self.frame = scope.new_frame(args)
+        self.closure = closure
+        self.scope = scope
+        counters = self.counters
+        counters.calls += 1
+        counters.depth += 1
+        if counters.depth > counters.peak_depth:
+            counters.peak_depth = counters.depth
+        try:
+            return body(self, frame, closure)
+        finally:
+            self.frame, self.closure, self.scope = saved
+            counters.depth -= 1
+
+    def run_constructor(self, ctor, instance, args):
+        self.call_function(ctor, [instance] + args[:len(ctor.params) - 1])
+
+    def fail(self, message, *values):
+        raise Exception(message)
+
+    def var_value(self, value, name):
+        if value is UNBOUND:
+            value = self.env.get(name, UNBOUND)
+            if value is UNBOUND:
+                if name in self.functions:
+                    return self.functions[name]
+                raise Exception(f"Variable '{name}' not defined")
+        if isinstance(value, (FuncDef, Closure)) and value.name is None:
+            return self.anon_function(value)
+        return value
+
+    def check_assign(self, name, checker, value):
+        if checker:
+            self.var_types[name] = checker
+        else:
+            checker = self.var_types.get(name)
+        if checker and value is not None and not checker.matches(value):
+            raise Exception(f"Type error: variable '{name}' expects {checker}, got {type(value).__name__}")
+
+    def define_function(self, func_def, frame, closure):
+        func = make_function(func_def, frame, closure)
+        self.functions[func_def.name] = func
+        return func
+
+    def callee(self, name):
+        func = self.env.get(name, UNBOUND)
+        if func is UNBOUND:
+            func = self.functions.get(name)
+        return func
+
+    def call(self, func, name, args):
+        if func is UNBOUND:
+            func = self.env.get(name, UNBOUND)
+            if func is UNBOUND:
+                func = self.functions.get(name)
+        if isinstance(func, (FuncDef, Closure)):
+            result = self.call_function(func, args[:len(func.params)])
+            checker = func.return_checker
+            if checker and self.runtime_checks and not checker.matches(result):
+                raise Exception(f"Function '{func.name}' must return {func.return_types}, got {type(result).__name__}")
+            return result
+        if func and callable(func):
+            to_python = self._to_python_value
+            return func(*[to_python(arg) for arg in args])
+        raise Exception(f"Function '{name}' not defined or is not callable")
+
+    def call_method(self, site, obj, args):
+        to_python = self._to_python_value
+        method = self.lookup_method(site, obj)
+        if method is not None:
+            return self.call_function(method, [obj] + [to_python(arg) for arg in args])
+        value = self.load_attribute(site, obj)
+        values = [to_python(arg) for arg in args]
+        if callable(value):
+            if obj is site.library:
+                return self.call_library(obj, site.attr, value, values)
+            return value(*values)
+        raise Exception("Attribute is not callable")
+
+    def construct(self, instance, args):
+        if instance.shape.constructor is not None:
+            self.run_constructor(instance.shape.constructor, instance, args)
+        return instance
+
+    def super_call(self, target, args):
+        ctor, ts = target
+        self.run_constructor(ctor, ts, args)
@@ -0,0 +1,599 @@
+import os
+import re
+import json
+import math
+import hashlib
+import importlib.util
+from processor import cache
+from processor.ast import FuncDef, FeedOp, AttributeAccess
+from processor.objects import AttributeSite, MISSING
+from processor.resolver import make_function, function_scope, Closure, Unbound, UNBOUND, LOCAL, CELL, FREE, GLOBAL
+
+FORMAT_VERSION = 1
+
+BINARY_OPS = {'+': '+', '-': '-', '*': '*', '/': '/'}
+COMPARE_OPS = {'IS': '==', 'IS_NOT': '!=', 'IS_UNDER': '<', 'IS_OVER': '>'}
+
+# Classes of the values a variable read hands to TranspiledInterpreter.var_value
+# instead of returning them as they are.
+SLOW = frozenset((Unbound, FuncDef, Closure))
+FUNCTIONS = frozenset((FuncDef, Closure))
+
+# Generated file name -> (.n file, .n line of every generated line), for nscript_trace().
+source_maps = {}
+# Source hash -> load() of the generated module, so a program is only compiled once per process.
+loaded = {}
+
+# Runtime support imported by the generated modules.
+
+def spin_items(collection):
+    if isinstance(collection, dict):
+        return list(collection.items())
+    if isinstance(collection, list):
+        return enumerate(collection, 1)
+    raise Exception("Can only SPIN over lists or dictionaries")
+
+def hoist(container, key, value):
+    container[key] = value
+    return value
+
+def nslice(start, end, step):
+    if isinstance(start, int):
+        start -= 1
+    return slice(start, end, step)
+
+class Transpiler:
+    """Translates a resolved Program into the source of a Python module.
+
+    The module defines load(N, S), which returns the program as a function
+    of (rt, frame, closure) and the body function of every FuncDef, keyed
+    by its index in N. N is the table of nodes the generated code refers
+    to, collected in `nodes`; S is built from `sites`, one AttributeSite
+    per attribute access. Locals live in the same frame lists as in the
+    other engines, so closures, modules and classes keep working, and
+    everything the generated code does not do inline goes through rt, the
+    TranspiledInterpreter running it. `mapping` holds the .n line of every
+    generated line.
+    """
+
+    def __init__(self, file=None, runtime_checks=True):
+        self.file = file
+        self.runtime_checks = runtime_checks
+        self.nodes = []
+        self.indexes = {}
+        self.sites = []
+        self.pending = []
+        self.bodies = []
+        self.lines = []
+        self.mapping = []
+        self.line = 0
+        self.indent = 0
+        self.temps = 0
+        self.in_program = False
+
+    def transpile(self, program):
+        self.line = 0
+        self.emit(f"# Generated from {self.file or '<input>'} by processor.transpiler, format {FORMAT_VERSION}.")
+        self.emit("import sys")
+        self.emit("from processor.objects import AttributeSite")
+        self.emit("from processor.transpiler import SLOW, FUNCTIONS, MISSING, UNBOUND, make_function, spin_items, hoist, nslice")
+        self.emit("")
+        self.emit("def load(N, S):")
+        self.indent += 1
+        self.in_program = True
+        self.function("program", program.statements, getattr(program, "line", 0), False)
+        self.in_program = False
+        while self.pending:
+            func_def = self.pending.pop(0)
+            index = self.node(func_def)
+            name = f"f{index}_{re.sub(r'[^0-9A-Za-z_]', '_', func_def.name or 'anonymous')}"
+            self.bodies.append((index, name))
+            # Bodies the parser skipped are parsed and resolved here, since the whole program is generated at once.
+            function_scope(func_def)
+            self.function(name, func_def.body, getattr(func_def, "line", self.line), True)
+        self.line = 0
+        bodies = ", ".join(f"{index}: {name}" for index, name in self.bodies)
+        self.emit(f"return program, {{{bodies}}}")
+        self.indent -= 1
+        return "\n".join(self.lines) + "\n"
+
+    def emit(self, text):
+        self.lines.append("    " * self.indent + text if text else "")
+        self.mapping.append(self.line)
+
+    def node(self, node):
+        index = self.indexes.get(id(node))
+        if index is None:
+            index = self.indexes[id(node)] = len(self.nodes)
+            self.nodes.append(node)
+        return index
+
+    def site(self, attr):
+        self.sites.append(attr)
+        return f"S[{len(self.sites) - 1}]"
+
+    def temp(self):
+        self.temps += 1
+        return f"_t{self.temps}"
+
+    def define(self, func_def):
+        """Queue the body of func_def for generation and return its N reference."""
+        if id(func_def) not in self.indexes:
+            self.pending.append(func_def)
+        return f"N[{self.node(func_def)}]"
+
+    def handler(self, prefix, node):
+        for cls in type(node).__mro__:
+            method = getattr(self, prefix + cls.__name__, None)
+            if method is not None:
+                return method
+        return None
+
+    def function(self, name, statements, line, tail):
+        self.line = line or self.line
+        self.temps = 0
+        self.emit(f"def {name}(rt, frame, closure):")
+        self.indent += 1
+        self.emit("env = rt.env")
+        if self.runtime_checks:
+            self.emit("var_types = rt.var_types")
+        self.block(statements, tail)
+        self.emit("return _r" if tail else "return None")
+        self.indent -= 1
+        self.emit("")
+
+    def block(self, statements, tail):
+        """Emit statements; with tail, the last one also leaves the block's result in _r."""
+        if not statements:
+            self.emit("_r = None" if tail else "pass")
+            return
+        last = len(statements) - 1
+        for i, stmt in enumerate(statements):
+            self.statement(stmt, tail and i == last)
+
+    def indented(self, statements, tail):
+        self.indent += 1
+        self.block(statements, tail)
+        self.indent -= 1
+
+    def statement(self, node, tail):
+        self.line = getattr(node, "line", None) or self.line
+        method = self.handler("statement_", node)
+        if method is not None:
+            method(node, tail)
+            return
+        value = self.expression(node)
+        self.emit(f"_r = {value}" if tail else value)
+
+    def expression(self, node):
+        method = self.handler("expression_", node)
+        if method is None:
+            return f"rt.fail({f'No visit_{type(node).__name__} method'!r})"
+        return method(node)
+
+    def target(self, name, ref):
+        """Return a Python assignment target for the variable, or None when it needs rt.store()."""
+        kind, slot = ref if ref is not None else (None, None)
+        if kind == LOCAL:
+            return f"frame[{slot}]"
+        if kind == CELL:
+            return f"frame[{slot}].value"
+        if kind == GLOBAL:
+            return f"env[{name!r}]"
+        return None
+
+    def store(self, name, ref, value):
+        target = self.target(name, ref)
+        if target is None:
+            self.emit(f"rt.store({name!r}, None, {value})")
+        else:
+            self.emit(f"{target} = {value}")
+
+    def reset(self, loop):
+        for node in loop.hoisted:
+            self.store(node.name, node.ref, "MISSING")
+
+    def loop_targets(self, names):
+        """Return the for-loop targets of (name, ref) pairs and the stores of those without one."""
+        targets = []
+        stores = []
+        for name, ref in names:
+            target = self.target(name, ref)
+            if target is None:
+                target = self.temp()
+                stores.append((name, ref, target))
+            targets.append(target)
+        return ", ".join(targets), stores
+
+    def loop_body(self, stores, statements, tail):
+        self.indent += 1
+        for name, ref, temp in stores:
+            self.store(name, ref, temp)
+        self.block(statements, tail)
+        self.indent -= 1
+
+    # Statements
+
+    def statement_Program(self, node, tail):
+        self.block(node.statements, False)
+        if tail:
+            self.emit("_r = None")
+
+    def statement_Print(self, node, tail):
+        self.emit(f"print({self.expression(node.value)})")
+        if tail:
+            self.emit("_r = None")
+
+    def statement_VarAssign(self, node, tail):
+        value = self.expression(node.value) if node.value is not None else "None"
+        self.emit(f"_v = {value}")
+        name = node.name
+        if self.runtime_checks:
+            key = f"N[{self.node(name)}]" if isinstance(name, AttributeAccess) else repr(name)
+            if node.checker:
+                self.emit(f"rt.check_assign({key}, N[{self.node(node)}].checker, _v)")
+            else:
+                self.emit(f"if var_types: rt.check_assign({key}, None, _v)")
+        if isinstance(name, AttributeAccess):
+            site = self.site(name.attr)
+            self.emit(f"rt.store_attribute({site}, {self.expression(name.obj)}, _v)")
+        else:
+            self.store(name, getattr(node, "ref", None), "_v")
+            self.emit(f"if _v.__class__ in FUNCTIONS: rt.functions[{name!r}] = _v")
+        if tail:
+            self.emit("_r = _v")
+
+    def statement_If(self, node, tail):
+        keyword = "if"
+        for cond, body in node.branches:
+            if cond is None:
+                if keyword == "if":
+                    self.block(body, tail)
+                    return
+                self.emit("else:")
+                self.indented(body, tail)
+                return
+            self.emit(f"{keyword} {self.expression(cond)}:")
+            self.indented(body, tail)
+            keyword = "elif"
+        if tail:
+            if keyword == "if":
+                self.emit("_r = None")
+            else:
+                self.emit("else:")
+                self.indented([], True)
+
+    def statement_ForLoop(self, node, tail):
+        self.reset(node)
+        start = self.expression(node.start)
+        end = self.expression(node.end)
+        if tail:
+            self.emit("_r = None")
+        targets, stores = self.loop_targets([(node.var, node.var_ref)])
+        self.emit(f"for {targets} in range(int({start}), int({end}) + 1):")
+        self.loop_body(stores, node.body, tail)
+
+    def statement_ForEachLoop(self, node, tail):
+        self.reset(node)
+        collection = self.expression(node.collection)
+        if tail:
+            self.emit("_r = None")
+        targets, stores = self.loop_targets([(node.index_var, node.index_ref), (node.value_var, node.value_ref)])
+        self.emit(f"for {targets} in spin_items({collection}):")
+        self.loop_body(stores, node.body, tail)
+
+    def statement_WhileLoop(self, node, tail):
+        self.reset(node)
+        if tail:
+            self.emit("_r = None")
+        self.emit(f"while {self.expression(node.condition)}:")
+        self.indented(node.body, tail)
+
+    def statement_Return(self, node, tail):
+        value = self.expression(node.value)
+        if self.in_program:
+            self.emit(f"_v = {value}")
+            self.emit("rt.returning = True")
+            self.emit("return _v")
+        else:
+            self.emit(f"return {value}")
+
+    def statement_FuncDef(self, node, tail):
+        self.emit(f"_v = {self.expression(node)}")
+        if tail:
+            self.emit("_r = _v")
+
+    def statement_ClassDef(self, node, tail):
+        for method in node.methods.values():
+            self.define(method)
+        self.emit(f"rt.define_class(N[{self.node(node)}])")
+        if tail:
+            self.emit("_r = None")
+
+    def statement_KillSelf(self, node, tail):
+        self.emit('print("Script terminated by KILL SELF.")')
+        self.emit("sys.exit(1)")
+
+    def statement_SuperCall(self, node, tail):
+        values = [self.expression(arg) for arg in node.args]
+        target = self.temp()
+        self.emit(f"rt.super_call(({target} := rt.super_target()), {self.leading(values, f'len({target}[0].params) - 1')})")
+        if tail:
+            self.emit("_r = None")
+
+    def statement_Import(self, node, tail):
+        self.emit(f"rt.visit_Import(N[{self.node(node)}])")
+        if tail:
+            self.emit("_r = None")
+
+    def statement_ImportOnly(self, node, tail):
+        self.emit(f"rt.visit_ImportOnly(N[{self.node(node)}])")
+        if tail:
+            self.emit("_r = None")
+
+    def statement_ImportAs(self, node, tail):
+        self.emit(f"rt.visit_ImportAs(N[{self.node(node)}])")
+        if tail:
+            self.emit("_r = None")
+
+    # Expressions: each returns Python source that is safe to use as an operand.
+
+    def arguments(self, args):
+        return f"[{', '.join(self.expression(arg) for arg in args)}]"
+
+    def leading(self, values, count):
+        """Source for a list of the first `count` of values, evaluating no others, like the ast engine.
+
+        `count` is the source of the callee's parameter count, evaluated once.
+        """
+        if not values:
+            return "[]"
+        accepted = self.temp()
+        shorter = "[]"
+        for length in range(1, len(values)):
+            shorter = f"[{', '.join(values[:length])}] if {accepted} >= {length} else {shorter}"
+        return f"([{', '.join(values)}] if ({accepted} := {count}) >= {len(values)} else {shorter})"
+
+    def expression_NoneType(self, node):
+        return "rt.fail('No visit_NoneType method')"
+
+    def expression_Num(self, node):
+        value = node.value
+        if isinstance(value, float) and not math.isfinite(value):
+            return f"float({str(value)!r})"
+        return f"({value!r})"
+
+    def expression_Str(self, node):
+        return repr(getattr(node, "value", None))
+
+    def expression_Bool(self, node):
+        return repr(node.value)
+
+    def expression_Template(self, node):
+        parts = node.parts
+        if len(parts) == 1:
+            return repr(parts[0])
+        template = "".join(part.replace("%", "%%") if i % 2 == 0 else "%s" for i, part in enumerate(parts))
+        values = "".join(f"{self.expression(part)}, " for part in parts[1::2])
+        return f"({template!r} % ({values}))"
+
+    def expression_FeedOp(self, node):
+        operands = []
+        def flatten(operand):
+            if isinstance(operand, FeedOp):
+                flatten(operand.left)
+                flatten(operand.right)
+            else:
+                operands.append(self.expression(operand))
+        flatten(node)
+        return f"({'%s' * len(operands)!r} % ({''.join(f'{operand}, ' for operand in operands)}))"
+
+    def expression_BinOp(self, node):
+        left = self.expression(node.left)
+        right = self.expression(node.right)
+        op = getattr(node.op, "value", None)
+        if op not in BINARY_OPS:
+            return f"rt.fail({f'Unknown operator: {op}'!r}, {left}, {right})"
+        return f"({left} {BINARY_OPS[op]} {right})"
+
+    def expression_Compare(self, node):
+        left = self.expression(node.left)
+        right = self.expression(node.right)
+        if node.op not in COMPARE_OPS:
+            return f"rt.fail({f'Unknown comparison operator: {node.op}'!r}, {left}, {right})"
+        return f"({left} {COMPARE_OPS[node.op]} {right})"
+
+    def expression_LogicalOp(self, node):
+        left = self.expression(node.left)
+        if node.op == 'NOT':
+            return f"(not {left})"
+        right = self.expression(node.right)
+        # Both sides are always evaluated, so & and | stand in for and and or.
+        if node.op == 'ALSO':
+            return f"(bool({left}) & bool({right}))"
+        if node.op == 'MAYBE':
+            return f"(bool({left}) | bool({right}))"
+        return f"rt.fail({f'Unknown logical operator: {node.op}'!r}, {left}, {right})"
+
+    def expression_ListLiteral(self, node):
+        return self.arguments(node.elements)
+
+    def expression_DictLiteral(self, node):
+        pairs = ", ".join(f"{self.expression(k)}: {self.expression(v)}" for k, v in node.pairs)
+        return f"{{{pairs}}}"
+
+    def lookup(self, name, ref):
+        """Source for the raw value of a variable, UNBOUND when a local or global is not set."""
+        kind, slot = ref if ref is not None else (None, None)
+        if kind == LOCAL:
+            return f"frame[{slot}]"
+        if kind == CELL:
+            return f"frame[{slot}].value"
+        if kind == FREE:
+            return f"closure[{slot}].value"
+        if kind == GLOBAL:
+            return f"env.get({name!r}, UNBOUND)"
+        return f"rt.lookup({name!r}, None)"
+
+    def expression_Var(self, node):
+        return f"(v if (v := {self.lookup(node.name, node.ref)}).__class__ not in SLOW else rt.var_value(v, {node.name!r}))"
+
+    def expression_Hoisted(self, node):
+        expr = self.expression(node.expr)
+        kind, slot = node.ref
+        if kind == LOCAL:
+            return f"(v if (v := frame[{slot}]) is not MISSING else hoist(frame, {slot}, {expr}))"
+        return f"(v if (v := env.get({node.name!r}, MISSING)) is not MISSING else hoist(env, {node.name!r}, {expr}))"
+
+    def expression_FuncDef(self, node):
+        return f"rt.define_function({self.define(node)}, frame, closure)"
+
+    def expression_FuncCall(self, node):
+        target = node.name
+        if isinstance(target, AttributeAccess):
+            site = self.site(target.attr)
+            return f"rt.call_method({site}, {self.expression(target.obj)}, {self.arguments(node.args)})"
+        values = []
+        for arg in node.args:
+            if isinstance(arg, FuncDef) and arg.name is None:
+                values.append(f"make_function({self.define(arg)}, frame, closure)")
+            else:
+                values.append(self.expression(arg))
+        if isinstance(target, FuncDef):
+            return f"rt.call({self.define(target)}, None, [{', '.join(values[:len(target.params)])}])"
+        if hasattr(target, "name"):
+            name = target.name
+            func = self.lookup(name, getattr(target, 'ref', None))
+        else:
+            name = target
+            func = f"rt.functions.get({name!r})"
+        if not values:
+            return f"rt.call({func}, {name!r}, [])"
+        # The callee is looked up before the arguments run, so that only as many are evaluated as it takes.
+        callee = self.temp()
+        func = f"({callee} := (v if (v := {func}) is not UNBOUND else rt.callee({name!r})))"
+        count = f"len({callee}.params) if {callee}.__class__ in FUNCTIONS else {len(values)}"
+        return f"rt.call({func}, {name!r}, {self.leading(values, count)})"
+
+    def expression_ClassInstance(self, node):
+        values = [self.expression(arg) for arg in node.args]
+        if not values:
+            return f"rt.construct(rt.new_instance({node.class_name!r}), [])"
+        instance, ctor = self.temp(), self.temp()
+        count = f"len({ctor}.params) - 1 if ({ctor} := {instance}.shape.constructor) is not None else 0"
+        return f"rt.construct(({instance} := rt.new_instance({node.class_name!r})), {self.leading(values, count)})"
+
+    def expression_AttributeAccess(self, node):
+        site = self.site(node.attr)
+        return f"rt.load_attribute({site}, {self.expression(node.obj)})"
+
+    def expression_Subscript(self, node):
+        value = self.expression(node.value)
+        index = self.expression(node.index)
+        v, i = self.temp(), self.temp()
+        # 1-based list indexing is done inline; everything else goes through Interpreter._subscript.
+        return (f"({v}[{i} - 1] if (({v} := {value}).__class__ is list) & (({i} := {index}).__class__ is int) "
+                f"and 0 < {i} <= len({v}) else rt._subscript({v}, {i}))")
+
+    def expression_SliceNode(self, node):
+        parts = [self.expression(part) if part is not None else "None" for part in (node.start, node.end, node.step)]
+        return f"nslice({', '.join(parts)})"
+
+    def expression_Len(self, node):
+        return f"rt._length({self.expression(node.value)})"
+
+    def expression_TallBoy(self, node):
+        return f"rt._tall_boy({self.expression(node.value)})"
+
+    def expression_ToString(self, node):
+        return f"str({self.expression(node.expr)})"
+
+    def expression_ToNumber(self, node):
+        return f"rt._to_number({self.expression(node.expr)})"
+
+    def expression_TypeOf(self, node):
+        return f"rt._type_of({self.expression(node.expr)})"
+
+    def expression_Nom(self, node):
+        return f"rt._nom({self.expression(node.path_expr)})"
+
+    def expression_Input(self, node):
+        return f"input(str({self.expression(node.prompt_expr)}))"
+
+    def expression_Gurt(self, node):
+        return f"rt._gurt({self.expression(node.expr)})"
+
+def generated_path(file, digest):
+    """Path of the generated module for the .n file at file, next to its parse cache entry."""
+    return f"{os.path.splitext(cache.cache_path(file))[0]}.{digest}.py"
+
+def load(tree, file=None, runtime_checks=True):
+    """Return the program function for the resolved tree, with a body attached to each of its FuncDefs.
+
+    With the parse cache on and a file to name it after, the generated
+    module is written next to the file's parse cache entry, together with
+    a .map of its .n line numbers, and imported from there so CPython keeps
+    its bytecode in __pycache__. Otherwise it is compiled in memory.
+    """
+    transpiler = Transpiler(file, runtime_checks)
+    source = transpiler.transpile(tree)
+    digest = hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+    load_module = loaded.get(digest)
+    if load_module is None:
+        path = generated_path(file, digest) if cache.enabled and file else None
+        if path is None or not write(path, source, transpiler.mapping, file):
+            path = f"<nscript {os.path.basename(file or 'input')} {digest}>"
+            namespace = {}
+            exec(compile(source, path, "exec"), namespace)
+            load_module = namespace["load"]
+        else:
+            spec = importlib.util.spec_from_file_location(f"nscript_{digest}", path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            load_module = module.load
+        source_maps[load_module.__code__.co_filename] = (file or "<input>", transpiler.mapping)
+        loaded[digest] = load_module
+    program, bodies = load_module(transpiler.nodes, [AttributeSite(attr) for attr in transpiler.sites])
+    for index, body in bodies.items():
+        transpiler.nodes[index].transpiled = body
+    return program
+
+def write(path, source, mapping, file):
+    """Write the generated module at path and its source map, removing older ones for the same file."""
+    map_path = os.path.splitext(path)[0] + ".map"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path) or not os.path.exists(map_path):
+            with open(map_path, "w", encoding="utf-8") as f:
+                json.dump({"version": FORMAT_VERSION, "source": os.path.abspath(file), "lines": mapping}, f)
+            temp = f"{path}.{os.getpid()}.tmp"
+            with open(temp, "w", encoding="utf-8") as f:
+                f.write(source)
+            os.replace(temp, path)
+    except OSError:
+        return False
+    directory, name = os.path.split(path)
+    stale = re.compile(re.escape(name[:-len("0123456789abcdef.py")]) + r"[0-9a-f]{16}\.(py|map)")
+    for entry in os.listdir(directory):
+        if stale.fullmatch(entry) and os.path.splitext(entry)[0] != os.path.splitext(name)[0]:
+            old = os.path.join(directory, entry)
+            try:
+                os.remove(old)
+                if entry.endswith(".py"):
+                    os.remove(importlib.util.cache_from_source(old))
+            except OSError:
+                pass
+    return True
+
+def nscript_trace(tb):
+    """Return the (.n file, line) of every frame of traceback tb that ran generated code, outermost first."""
+    trace = []
+    while tb is not None:
+        entry = source_maps.get(tb.tb_frame.f_code.co_filename)
+        if entry is not None:
+            file, mapping = entry
+            line = mapping[tb.tb_lineno - 1] if 0 < tb.tb_lineno <= len(mapping) else 0
+            if line:
+                trace.append((file, line))
+        tb = tb.tb_next
+    return trace
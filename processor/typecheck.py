@@ -0,0 +1,77 @@
+from processor.objects import Instance
+
+TYPE_MAP = {
+    'str': str,
+    'string': str,
+    'num': (int, float),
+    'number': (int, float),
+    'int': int,
+    'float': float,
+    'bool': bool,
+    'boolean': bool,
+    'list': list,
+    'array': list,
+    'dict': dict,
+    'dictionary': dict,
+}
+
+class TypeChecker:
+    """Compiled form of one type annotation, such as `num / string`, `Person` or `(num) -> num`.
+
+    Built once per declaration by the parser. Builtin type names become a
+    single isinstance tuple, every name is also compared against the class
+    of an instance, and function types keep their signature for a check
+    against the parameters and return types of a function value.
+    """
+
+    __slots__ = ('types', 'py_types', 'class_names', 'signatures')
+
+    def __init__(self, types):
+        self.types = types
+        py_types = []
+        class_names = set()
+        signatures = []
+        for t in types:
+            if isinstance(t, tuple) and t[0] == 'func':
+                signatures.append((t[1], t[2]))
+            elif isinstance(t, str):
+                py_type = TYPE_MAP.get(t.lower())
+                if isinstance(py_type, tuple):
+                    py_types.extend(py_type)
+                elif py_type is not None:
+                    py_types.append(py_type)
+                class_names.add(t.lower())
+        self.py_types = tuple(py_types)
+        self.class_names = frozenset(class_names)
+        self.signatures = tuple(signatures)
+
+    def matches(self, value):
+        if isinstance(value, self.py_types):
+            return True
+        if value.__class__ is Instance:
+            return value.shape.key in self.class_names
+        for arg_types, ret_type in self.signatures:
+            if signature_matches(value, arg_types, ret_type):
+                return True
+        return False
+
+    def __repr__(self):
+        return repr(self.types)
+
+def signature_matches(value, arg_types, ret_type):
+    params = getattr(value, "params", None)
+    if params is None or not hasattr(value, "body"):
+        return False
+    if len(params) != len(arg_types):
+        return False
+    param_types = getattr(value, "param_types", None) or {}
+    for pname, expected_type in zip(params, arg_types):
+        if pname in param_types and param_types[pname] != expected_type:
+            return False
+    return_types = getattr(value, "return_types", None)
+    if return_types:
+        return ret_type in return_types
+    return return_types is None
+
+def checker(types):
+    return TypeChecker(types) if types else None
@@ -0,0 +1,522 @@
+import sys
+from processor.ast import FuncDef
+from processor.interpreter import Interpreter, ReturnException
+from processor.objects import AttributeSite, MISSING
+from processor.resolver import function_scope, make_function, is_function, Closure, UNBOUND
+from processor.compiler import (
+    Compiler, LOAD_CONST, LOAD_NAME, STORE_NAME, LOAD_FAST, STORE_FAST, ASSIGN_FAST, LOAD_CELL, STORE_CELL,
+    LOAD_FREE, LOAD_GLOBAL, STORE_GLOBAL, ASSIGN_GLOBAL, CHECK_STORE, CHECK_TYPED, STORE_ATTR, LOAD_ATTR, LOAD_METHOD,
+    POP_TOP, DUP_TOP, SET_RESULT, CLEAR_RESULT, LOAD_RESULT, BINARY_ADD, BINARY_SUB, BINARY_MUL, BINARY_DIV,
+    COMPARE_EQ, COMPARE_NE, COMPARE_LT, COMPARE_GT, LOGICAL_NOT, LOGICAL_AND, LOGICAL_OR, FEED, BUILD_LIST,
+    BUILD_DICT, BUILD_SLICE, BUILD_STRING, SUBSCRIPT, LEN, TALLBOY, TO_STRING, TO_NUMBER, TYPEOF,
+    NOM, INPUT, GURT, PRINT, JUMP, POP_JUMP_IF_FALSE, GET_RANGE, GET_ITEMS, FOR_ITER, UNPACK_PAIR,
+    MAKE_FUNCTION, DEFINE_FUNCTION, DEFINE_CLASS, LOAD_FUNC, CALL_FUNCTION, TAIL_CALL, CALL_METHOD, LOAD_CLASS,
+    BUILD_INSTANCE, SUPER_CALL, RETURN_VALUE, RAISE_RETURN, IMPORT, KILL_SELF, FAIL, JUMP_IF_CACHED, LOAD_SUPER,
+)
+
+_DONE = object()
+
+class VM(Interpreter):
+    """Stack machine that runs Code objects produced by processor.compiler.
+
+    Globals, functions, classes and imports are shared with Interpreter, so
+    the VM keeps the reference engine's environment and type-check rules.
+    Calls between NScript functions and methods push an activation onto
+    run()'s own call stack instead of recursing in Python, so recursion
+    depth is only bounded by memory, and TAIL_CALL reuses the caller's
+    activation. Method activations run with func set to None because
+    method calls do not check return types.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.compiler = Compiler()
+
+    def interpret(self, node):
+        saved = self.frame, self.closure, self.scope
+        depth = self.counters.depth
+        try:
+            return self.run(self.compiler.compile_program(node))
+        finally:
+            self.frame, self.closure, self.scope = saved
+            self.counters.depth = depth
+
+    def visit(self, node):
+        saved = self.frame, self.closure, self.scope
+        try:
+            return self.run(self.compiler.compile_expression(node))
+        finally:
+            self.frame, self.closure, self.scope = saved
+
+    def profile(self, profiler):
+        raise Exception("Profiling is not supported by the vm engine, use the ast or closure engine")
+
+    def trace(self, tracer):
+        raise Exception("Tracing is not supported by the vm engine, use the ast or closure engine")
+
+    def count_nodes(self):
+        # The vm runs bytecode rather than nodes, so stats()["nodes"] stays empty.
+        pass
+
+    def quicken(self):
+        raise Exception("Quickening is not supported by the vm engine, use the ast engine")
+
+    def call_function(self, func, args):
+        saved = self.frame, self.closure, self.scope
+        counters = self.counters
+        depth = counters.depth
+        counters.calls += 1
+        counters.depth = depth + 1
+        if counters.depth > counters.peak_depth:
+            counters.peak_depth = counters.depth
+        try:
+            return self.run(self.activate(func, args), func)
+        finally:
+            self.frame, self.closure, self.scope = saved
+            counters.depth = depth
+
+    def activate(self, func, args):
+        if isinstance(func, Closure):
+            func_def, self.closure = func.func_def, func.cells
+        else:
+            func_def, self.closure = func, None
+        scope = function_scope(func_def)
+        self.frame = scope.new_frame(args)
+        self.scope = scope
+        return self.compiler.compile_function(func_def)
+
+    def run_constructor(self, ctor, instance, args):
+        self.call_function(ctor, [instance] + args[:len(ctor.params) - 1])
+
+    def load_global(self, name):
+        env = self.env
+        if name in env:
+            value = env[name]
+            if is_function(value) and value.name is None:
+                return self.anon_function(value)
+            return value
+        if name in self.functions:
+            return self.functions[name]
+        raise Exception(f"Variable '{name}' not defined")
+
+    def check_store(self, name, value, checker):
+        if self.runtime_checks:
+            if checker:
+                self.var_types[name] = checker
+            else:
+                checker = self.var_types.get(name)
+            if checker and value is not None and not checker.matches(value):
+                raise Exception(f"Type error: variable '{name}' expects {checker}, got {type(value).__name__}")
+        if is_function(value):
+            self.functions[name] = value
+
+    def load_function(self, name, ref):
+        func_obj = self.lookup(name, ref)
+        if func_obj is UNBOUND:
+            func_obj = self.functions.get(name)
+        if is_function(func_obj) or (func_obj and callable(func_obj)):
+            return func_obj
+        raise Exception(f"Function '{name}' not defined or is not callable")
+
+    def call(self, func_obj, args):
+        if isinstance(func_obj, (FuncDef, Closure)):
+            result = self.call_function(func_obj, args[:len(func_obj.params)])
+            if func_obj.return_checker and self.runtime_checks:
+                self.check_return(func_obj, result)
+            return result
+        to_python = self._to_python_value
+        return func_obj(*[to_python(arg) for arg in args])
+
+    def for_items(self, collection):
+        if isinstance(collection, dict):
+            return iter(list(collection.items()))
+        if isinstance(collection, list):
+            return enumerate(collection, 1)
+        raise Exception("Can only SPIN over lists or dictionaries")
+
+    def check_return(self, func, value):
+        if not func.return_checker.matches(value):
+            raise Exception(f"Function '{func.name}' must return {func.return_types}, got {type(value).__name__}")
+
+    def run(self, code, func=None):
+        instructions = code.instructions
+        constants = code.constants
+        names = code.names
+        varnames = code.varnames
+        frame = self.frame
+        closure = self.closure
+        var_types = self.var_types
+        checks = self.runtime_checks
+        counters = self.counters
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        result = None
+        pc = 0
+        calls = []
+        entry = func
+        while True:
+            op = instructions[pc]
+            arg = instructions[pc + 1]
+            pc += 2
+            if op == LOAD_FAST:
+                value = frame[arg]
+                if value is UNBOUND:
+                    push(self.load_global(varnames[arg]))
+                elif isinstance(value, (FuncDef, Closure)) and value.name is None:
+                    push(self.anon_function(value))
+                else:
+                    push(value)
+            elif op == LOAD_CONST:
+                push(constants[arg])
+            elif op == STORE_FAST:
+                frame[arg] = pop()
+            elif op == LOAD_GLOBAL:
+                name = names[arg]
+                env = self.env
+                if name in env:
+                    value = env[name]
+                    if isinstance(value, (FuncDef, Closure)) and value.name is None:
+                        value = self.anon_function(value)
+                    push(value)
+                else:
+                    push(self.load_global(name))
+            elif op == ASSIGN_FAST:
+                value = pop()
+                if varnames[arg] in var_types or isinstance(value, (FuncDef, Closure)):
+                    self.check_store(varnames[arg], value, None)
+                frame[arg] = value
+            elif op == ASSIGN_GLOBAL:
+                name = names[arg]
+                value = pop()
+                if name in var_types or isinstance(value, (FuncDef, Closure)):
+                    self.check_store(name, value, None)
+                self.env[name] = value
+            elif op == STORE_GLOBAL:
+                self.env[names[arg]] = pop()
+            elif op == POP_TOP:
+                pop()
+            elif op == FOR_ITER:
+                value = next(stack[-1], _DONE)
+                if value is _DONE:
+                    pop()
+                    pc = arg
+                else:
+                    push(value)
+            elif op == JUMP:
+                pc = arg
+            elif op == POP_JUMP_IF_FALSE:
+                if not pop():
+                    pc = arg
+            elif op == JUMP_IF_CACHED:
+                if stack[-1] is MISSING:
+                    pop()
+                else:
+                    pc = arg
+            elif op == BINARY_ADD:
+                right = pop()
+                stack[-1] = stack[-1] + right
+            elif op == BINARY_SUB:
+                right = pop()
+                stack[-1] = stack[-1] - right
+            elif op == BINARY_MUL:
+                right = pop()
+                stack[-1] = stack[-1] * right
+            elif op == BINARY_DIV:
+                right = pop()
+                stack[-1] = stack[-1] / right
+            elif op == COMPARE_EQ:
+                right = pop()
+                stack[-1] = stack[-1] == right
+            elif op == COMPARE_NE:
+                right = pop()
+                stack[-1] = stack[-1] != right
+            elif op == COMPARE_LT:
+                right = pop()
+                stack[-1] = stack[-1] < right
+            elif op == COMPARE_GT:
+                right = pop()
+                stack[-1] = stack[-1] > right
+            elif op == LOAD_FUNC:
+                name, ref, skips = constants[arg]
+                callee = self.load_function(name, ref)
+                push(callee)
+                if skips and isinstance(callee, (FuncDef, Closure)) and len(callee.params) < len(skips):
+                    pc = skips[len(callee.params)]
+            elif op == CALL_FUNCTION:
+                args = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                callee = stack[-1]
+                if isinstance(callee, (FuncDef, Closure)):
+                    pop()
+                    calls.append((code, frame, closure, self.scope, stack, result, pc, func))
+                    counters.calls += 1
+                    counters.depth += 1
+                    if counters.depth > counters.peak_depth:
+                        counters.peak_depth = counters.depth
+                    code = self.activate(callee, args)
+                    func = callee
+                    instructions = code.instructions
+                    constants = code.constants
+                    names = code.names
+                    varnames = code.varnames
+                    frame = self.frame
+                    closure = self.closure
+                    stack = []
+                    push = stack.append
+                    pop = stack.pop
+                    result = None
+                    pc = 0
+                else:
+                    stack[-1] = self.call(callee, args)
+            elif op == RETURN_VALUE:
+                value = pop()
+                if not calls:
+                    # The caller checks the entry function's result; a tail call may have replaced it.
+                    if func is not entry and checks and func.return_checker:
+                        self.check_return(func, value)
+                    return value
+                if func is not None and checks and func.return_checker:
+                    self.check_return(func, value)
+                code, frame, closure, self.scope, stack, result, pc, func = calls.pop()
+                counters.depth -= 1
+                self.frame = frame
+                self.closure = closure
+                instructions = code.instructions
+                constants = code.constants
+                names = code.names
+                varnames = code.varnames
+                push = stack.append
+                pop = stack.pop
+                push(value)
+            elif op == TAIL_CALL:
+                args = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                callee = stack[-1]
+                if not isinstance(callee, (FuncDef, Closure)):
+                    stack[-1] = self.call(callee, args)
+                    continue
+                pop()
+                if func is None or (checks and func.return_checker and getattr(func, 'func_def', func) is not getattr(callee, 'func_def', callee)):
+                    calls.append((code, frame, closure, self.scope, stack, result, pc, func))
+                    counters.depth += 1
+                    if counters.depth > counters.peak_depth:
+                        counters.peak_depth = counters.depth
+                counters.calls += 1
+                code = self.activate(callee, args)
+                func = callee
+                instructions = code.instructions
+                constants = code.constants
+                names = code.names
+                varnames = code.varnames
+                frame = self.frame
+                closure = self.closure
+                stack = []
+                push = stack.append
+                pop = stack.pop
+                result = None
+                pc = 0
+            elif op == SET_RESULT:
+                result = pop()
+            elif op == CLEAR_RESULT:
+                result = None
+            elif op == LOAD_RESULT:
+                push(result)
+            elif op == DUP_TOP:
+                push(stack[-1])
+            elif op == FEED:
+                right = pop()
+                stack[-1] = str(stack[-1]) + str(right)
+            elif op == LOAD_ATTR:
+                stack[-1] = self.load_attribute(constants[arg], stack[-1])
+            elif op == LOAD_METHOD:
+                obj = stack[-1]
+                site = constants[arg]
+                method = self.lookup_method(site, obj)
+                if method is None:
+                    stack[-1] = self.load_attribute(site, obj)
+                    push(site if obj is site.library else None)
+                else:
+                    stack[-1] = method
+                    push(obj)
+            elif op == CALL_METHOD:
+                args = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                obj = pop()
+                method = pop()
+                to_python = self._to_python_value
+                args = [to_python(value) for value in args]
+                if obj is not None and obj.__class__ is not AttributeSite:
+                    calls.append((code, frame, closure, self.scope, stack, result, pc, func))
+                    counters.calls += 1
+                    counters.depth += 1
+                    if counters.depth > counters.peak_depth:
+                        counters.peak_depth = counters.depth
+                    code = self.activate(method, [obj] + args)
+                    func = None
+                    instructions = code.instructions
+                    constants = code.constants
+                    names = code.names
+                    varnames = code.varnames
+                    frame = self.frame
+                    closure = self.closure
+                    stack = []
+                    push = stack.append
+                    pop = stack.pop
+                    result = None
+                    pc = 0
+                elif not callable(method):
+                    raise Exception("Attribute is not callable")
+                elif obj is None:
+                    push(method(*args))
+                else:
+                    push(self.call_library(obj.library, obj.attr, method, args))
+            elif op == STORE_ATTR:
+                obj = pop()
+                self.store_attribute(constants[arg], obj, pop())
+            elif op == CHECK_TYPED:
+                name, checker = constants[arg]
+                self.check_store(name, stack[-1], checker)
+            elif op == PRINT:
+                print(pop())
+            elif op == LOGICAL_NOT:
+                stack[-1] = not bool(stack[-1])
+            elif op == LOGICAL_AND:
+                right = pop()
+                stack[-1] = bool(stack[-1]) and bool(right)
+            elif op == LOGICAL_OR:
+                right = pop()
+                stack[-1] = bool(stack[-1]) or bool(right)
+            elif op == SUBSCRIPT:
+                index = pop()
+                stack[-1] = self._subscript(stack[-1], index)
+            elif op == BUILD_STRING:
+                items = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                push(''.join(items))
+            elif op == BUILD_LIST:
+                if arg:
+                    items = stack[len(stack) - arg:]
+                    del stack[len(stack) - arg:]
+                else:
+                    items = []
+                push(items)
+            elif op == BUILD_DICT:
+                items = stack[len(stack) - 2 * arg:]
+                del stack[len(stack) - 2 * arg:]
+                push({items[i]: items[i + 1] for i in range(0, len(items), 2)})
+            elif op == BUILD_SLICE:
+                step = pop()
+                end = pop()
+                start = pop()
+                if isinstance(start, int):
+                    start -= 1
+                push(slice(start, end, step))
+            elif op == GET_RANGE:
+                end = pop()
+                start = pop()
+                push(iter(range(int(start), int(end) + 1)))
+            elif op == GET_ITEMS:
+                stack[-1] = self.for_items(stack[-1])
+            elif op == UNPACK_PAIR:
+                key, value = pop()
+                push(value)
+                push(key)
+            elif op == LEN:
+                stack[-1] = self._length(stack[-1])
+            elif op == TALLBOY:
+                stack[-1] = self._tall_boy(stack[-1])
+            elif op == TO_STRING:
+                stack[-1] = str(stack[-1])
+            elif op == TO_NUMBER:
+                stack[-1] = self._to_number(stack[-1])
+            elif op == TYPEOF:
+                stack[-1] = self._type_of(stack[-1])
+            elif op == NOM:
+                stack[-1] = self._nom(stack[-1])
+            elif op == INPUT:
+                stack[-1] = input(str(stack[-1]))
+            elif op == GURT:
+                stack[-1] = self._gurt(stack[-1])
+            elif op == MAKE_FUNCTION:
+                push(make_function(constants[arg], frame, closure))
+            elif op == DEFINE_FUNCTION:
+                value = make_function(constants[arg], frame, closure)
+                self.functions[value.name] = value
+                push(value)
+            elif op == DEFINE_CLASS:
+                self.define_class(constants[arg])
+            elif op == LOAD_CLASS:
+                class_name, skips = constants[arg]
+                instance = self.new_instance(class_name)
+                push(instance)
+                if skips:
+                    ctor = instance.shape.constructor
+                    accepted = len(ctor.params) - 1 if ctor is not None else 0
+                    if accepted < len(skips):
+                        pc = skips[max(accepted, 0)]
+            elif op == BUILD_INSTANCE:
+                args = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                instance = stack[-1]
+                if instance.shape.constructor is not None:
+                    self.run_constructor(instance.shape.constructor, instance, args)
+            elif op == LOAD_SUPER:
+                ctor, ts = self.super_target()
+                push(ctor)
+                push(ts)
+                skips = constants[arg][0]
+                if skips and len(ctor.params) - 1 < len(skips):
+                    pc = skips[max(len(ctor.params) - 1, 0)]
+            elif op == SUPER_CALL:
+                args = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                ts = pop()
+                self.run_constructor(pop(), ts, args)
+                push(None)
+            elif op == LOAD_CELL:
+                value = frame[arg].value
+                if value is UNBOUND:
+                    push(self.load_global(varnames[arg]))
+                elif isinstance(value, (FuncDef, Closure)) and value.name is None:
+                    push(self.anon_function(value))
+                else:
+                    push(value)
+            elif op == STORE_CELL:
+                frame[arg].value = pop()
+            elif op == LOAD_FREE:
+                value = closure[arg].value
+                if value is UNBOUND:
+                    push(self.load_global(code.freenames[arg]))
+                elif isinstance(value, (FuncDef, Closure)) and value.name is None:
+                    push(self.anon_function(value))
+                else:
+                    push(value)
+            elif op == LOAD_NAME:
+                name = names[arg]
+                value = self.lookup(name, None)
+                if value is UNBOUND:
+                    push(self.load_global(name))
+                elif isinstance(value, (FuncDef, Closure)) and value.name is None:
+                    push(self.anon_function(value))
+                else:
+                    push(value)
+            elif op == STORE_NAME:
+                self.store(names[arg], None, pop())
+            elif op == CHECK_STORE:
+                name = names[arg]
+                value = stack[-1]
+                if name in var_types or isinstance(value, (FuncDef, Closure)):
+                    self.check_store(name, value, None)
+            elif op == IMPORT:
+                node = constants[arg]
+                getattr(self, f'visit_{type(node).__name__}')(node)
+            elif op == RAISE_RETURN:
+                raise ReturnException(pop())
+            elif op == KILL_SELF:
+                print("Script terminated by KILL SELF.")
+                sys.exit(1)
+            elif op == FAIL:
+                raise Exception(constants[arg])
+            else:
+                raise Exception(f"Unknown opcode {op}")
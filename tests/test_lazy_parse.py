@@ -0,0 +1,106 @@
+"""Lazy parsing of function and method bodies, checked through the nscript.py CLI with the parse cache on."""
+import os
+import sys
+import json
+import subprocess
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The py engine generates the whole program before it runs, so it parses every body up front.
+LAZY_ENGINES = ["ast", "closure", "vm"]
+
+BROKEN_FUNCTION = """\
+FELLA("start")
+POPPIN broken(x) WE
+    YE y BOOM (x +
+POW
+POPPIN works(x) WE
+    RETURN x + 1
+POW
+FELLA(works(1))
+"""
+
+HOISTED = """\
+POPPIN grid(n) WE
+    YE out BOOM ""
+    SPIN BOOM i IS 1, n WE
+        SPIN BOOM j IS 1, n WE
+            out BOOM out FEED (i FEED ",") FEED j FEED ";"
+        POW
+    POW
+    RETURN out
+POW
+FELLA(grid(2))
+"""
+
+BROKEN_METHOD = """\
+LEARNING Box WE
+    POPPIN constructor(ts) WE
+        ts.v BOOM 1
+    POW
+    POPPIN broken(ts) WE
+        RETURN ts.v +
+    POW
+POW
+FELLA("defined")
+YE box BOOM BUILD Box()
+FELLA("built")
+"""
+
+def run(tmp_path, name, source, *options):
+    script = tmp_path / name
+    if not script.exists() or script.read_text() != source:
+        script.write_text(source)
+    env = dict(os.environ, LOCALAPPDATA=str(tmp_path))
+    env.pop("NSCRIPT_CACHE_DIR", None)
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, "nscript.py"), *options, str(script)],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60,
+    )
+    return result.stdout, result.stderr
+
+def parse_cache_stats(stderr):
+    report = json.loads(stderr[stderr.index("{"):])
+    return report["parse_cache"]
+
+@pytest.mark.parametrize("engine", LAZY_ENGINES)
+def test_skipped_body_with_syntax_error_is_cached(tmp_path, engine):
+    out, err = run(tmp_path, "s.n", BROKEN_FUNCTION, "--engine", engine, "--stats")
+    assert "start\n2\n" in out
+    assert "NacoScript Error" not in out
+    assert parse_cache_stats(err) == {"hits": 0, "misses": 1}
+    assert (tmp_path / "__nscache__" / "s.nsc").exists()
+
+    out, err = run(tmp_path, "s.n", BROKEN_FUNCTION, "--engine", engine, "--stats")
+    assert "start\n2\n" in out
+    assert parse_cache_stats(err) == {"hits": 1, "misses": 0}
+
+@pytest.mark.parametrize("engine", LAZY_ENGINES)
+def test_syntax_error_is_raised_when_the_function_is_called(tmp_path, engine):
+    source = BROKEN_FUNCTION + "FELLA(broken(1))\n"
+    for _ in range(2):
+        out, _ = run(tmp_path, "s.n", source, "--engine", engine)
+        assert "start\n2\n" in out
+        assert "Invalid syntax" in out.split("start", 1)[1]
+
+def test_strict_parse_reports_the_syntax_error_before_running(tmp_path):
+    run(tmp_path, "s.n", BROKEN_FUNCTION)
+    out, _ = run(tmp_path, "s.n", BROKEN_FUNCTION, "--strict-parse")
+    assert "start" not in out
+    assert "Invalid syntax" in out
+
+@pytest.mark.parametrize("engine", LAZY_ENGINES + ["py"])
+@pytest.mark.parametrize("options", [["--no-cache"], []])
+def test_lazy_function_with_hoisted_invariant(tmp_path, engine, options):
+    for _ in range(2):
+        out, _ = run(tmp_path, "h.n", HOISTED, "--engine", engine, *options)
+        assert out.endswith("1,1;1,2;2,1;2,2;\n")
+
+@pytest.mark.parametrize("engine", LAZY_ENGINES)
+def test_method_body_is_parsed_on_first_build(tmp_path, engine):
+    out, _ = run(tmp_path, "m.n", BROKEN_METHOD, "--engine", engine)
+    assert "defined\n" in out
+    assert "built" not in out
+    assert "Invalid syntax" in out.split("defined", 1)[1]
@@ -0,0 +1,27 @@
+"""GIVE LIBRARY modules, which are bound as lazy proxies until first used."""
+import os
+import sys
+import subprocess
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TYPEOF_LIBRARY = """\
+GIVE LIBRARY "tl"
+FELLA(TYPEOF(tl))
+"""
+
+@pytest.mark.parametrize("engine", ["ast", "closure", "vm", "py"])
+def test_typeof_library_is_module(tmp_path, engine):
+    library = tmp_path / "nscript_libs" / "tl"
+    library.mkdir(parents=True)
+    (library / "main.py").write_text("def hello():\n    return 1\n")
+    script = tmp_path / "t.n"
+    script.write_text(TYPEOF_LIBRARY)
+    env = dict(os.environ, LOCALAPPDATA=str(tmp_path))
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, "nscript.py"), "--engine", engine, str(script)],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60,
+    )
+    assert result.stdout.endswith("module\n")
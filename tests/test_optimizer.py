@@ -0,0 +1,37 @@
+"""Constant folding limits of the AST optimizer."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from processor.lexer import Lexer
+from processor.parser import Parser
+from processor.optimizer import MAX_FOLDED_STRING, folded_length, optimize
+
+DEAD_REPEAT = """\
+YE x BOOM 1
+WHAT (x IS 2) WE
+    FELLA("ab" * 200000000)
+POW
+FELLA("ab" * 3)
+"""
+
+def parse(source):
+    return optimize(Parser(Lexer(source)).parse())
+
+def test_folded_length_is_known_before_computing():
+    assert folded_length('*', "ab", 200000000) == 400000000
+    assert folded_length('*', 3, "ab") == 6
+    assert folded_length('+', "ab", "cd") == 4
+    assert folded_length('FEED', "x", 10) == 3
+    assert folded_length('+', 1, 2) == 0
+
+def test_huge_repeat_in_dead_branch_is_left_unfolded():
+    program = parse(DEAD_REPEAT)
+    (_, body), = program.statements[1].branches
+    assert type(body[0].value).__name__ == "BinOp"
+    assert program.statements[2].value.value == "ababab"
+
+def test_repeat_over_the_cap_stays_a_runtime_operation():
+    program = parse('YE s BOOM "ab" * %d\n' % (MAX_FOLDED_STRING // 2 + 1))
+    assert type(program.statements[0].value).__name__ == "BinOp"
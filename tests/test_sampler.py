@@ -0,0 +1,42 @@
+"""The sampling profiler on the py engine, whose frames come from generated modules."""
+import os
+import sys
+import subprocess
+from types import SimpleNamespace
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from processor.sampler import Sampler
+from processor.transpiler import source_maps
+
+FIB = """\
+POPPIN fib(n) WE
+    WHAT (n IS UNDER 2) WE
+        RETURN n
+    POW
+    RETURN fib(n - 1) + fib(n - 2)
+POW
+FELLA(fib(24))
+"""
+
+def test_generated_frame_without_a_line_number():
+    source_maps["<nscript-test>"] = ("t.n", [1, 2, 3])
+    try:
+        frame = SimpleNamespace(f_code=compile("", "<nscript-test>", "exec"), f_lineno=None, f_back=None)
+        assert Sampler().walk(frame) == []
+    finally:
+        del source_maps["<nscript-test>"]
+
+def test_py_engine_samples_are_written(tmp_path):
+    script = tmp_path / "fib.n"
+    script.write_text(FIB)
+    env = dict(os.environ, LOCALAPPDATA=str(tmp_path))
+    result = subprocess.run(
+        [sys.executable, os.path.join(ROOT, "nscript.py"), "--engine", "py", "--no-cache",
+         "--sample-profile", "fib.folded", str(script)],
+        cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60,
+    )
+    assert "46368" in result.stdout
+    stacks = (tmp_path / "fib.folded").read_text()
+    assert "<module> (fib.n:7);fib (fib.n:" in stacks